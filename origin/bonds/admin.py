@@ -1,4 +1,29 @@
 from django.contrib import admin
-from .models import Bond
+from . import versions
+from .models import ArchivedBond, Bond, LegalEntity
 
-admin.site.register(Bond)
+class BondAdmin(admin.ModelAdmin):
+    # Edits made here change the owner's book, just like writes through the API
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        versions.bump([obj.owner_id])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        versions.bump([obj.owner_id])
+
+    def delete_queryset(self, request, queryset):
+        owner_ids = set(queryset.values_list('owner_id', flat=True))
+        super().delete_queryset(request, queryset)
+        versions.bump(owner_ids)
+
+class LegalEntityAdmin(admin.ModelAdmin):
+    # Renaming an issuer changes the books of the users holding its bonds
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'legal_name' in form.changed_data:
+            versions.bump_holders([obj.lei])
+
+admin.site.register(Bond, BondAdmin)
+admin.site.register(ArchivedBond, BondAdmin)
+admin.site.register(LegalEntity, LegalEntityAdmin)
@@ -0,0 +1,132 @@
+"""
+Defines the portfolio analytics served by `/bonds/analytics/`, computed with NumPy.
+
+The bonds are read in one query, as the number and total size of the bonds of each distinct
+(maturity, currency, LEI), which the (owner, maturity, currency, lei, size) index returns in
+order without touching the table. The rows are read in chunks into compact arrays: sizes and
+counts as 64-bit integers, maturities as day numbers, and currencies and LEIs as integer codes
+into lists of the distinct values. Every metric is then computed on the arrays in vectorized
+form, weighted by the counts, so memory use is a few bytes per row.
+"""
+from itertools import islice
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Sum
+from .models import LegalEntity
+from .summary import DAYS_PER_YEAR
+
+class Book:
+    """
+    A set of bonds as arrays, with one entry per distinct (maturity, currency, LEI): the number
+    of bonds (`counts`), their total size (`sizes`), the maturity (as a date ordinal), and the
+    currency and issuer as codes, i.e. indexes into `currencies` and `leis`.
+    """
+    def __init__(self, counts, sizes, maturities, currency_codes, currencies, issuer_codes, leis):
+        self.counts = counts
+        self.sizes = sizes
+        self.maturities = maturities
+        self.currency_codes = currency_codes
+        self.currencies = currencies
+        self.issuer_codes = issuer_codes
+        self.leis = leis
+
+def encode(values, codes):
+    """
+    Return the codes of `values`, assigning new codes (in `codes`) to unseen values.
+    """
+    return [codes.setdefault(value, len(codes)) for value in values]
+
+def load_book(bonds, chunk_size=None):
+    """
+    Read `bonds` (a queryset) into a `Book`, with one query.
+    """
+    chunk_size = chunk_size or settings.BONDS_ANALYTICS_CHUNK_SIZE
+    rows = bonds.order_by().values('maturity', 'currency', 'legal_entity') \
+        .annotate(count=Count('id'), total_size=Sum('size')) \
+        .values_list('count', 'total_size', 'maturity', 'currency', 'legal_entity') \
+        .iterator(chunk_size=chunk_size)
+    currencies, leis = {}, {}
+    arrays = [[] for _ in range(5)]
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        counts, sizes, maturities, chunk_currencies, chunk_leis = zip(*chunk)
+        arrays[0].append(np.array(counts, dtype=np.int64))
+        arrays[1].append(np.array(sizes, dtype=np.int64))
+        arrays[2].append(np.array([maturity.toordinal() for maturity in maturities], dtype=np.int32))
+        arrays[3].append(np.array(encode(chunk_currencies, currencies), dtype=np.int32))
+        arrays[4].append(np.array(encode(chunk_leis, leis), dtype=np.int32))
+
+    dtypes = [np.int64, np.int64, np.int32, np.int32, np.int32]
+    counts, sizes, maturities, currency_codes, issuer_codes = [
+        np.concatenate(chunks) if chunks else np.zeros(0, dtype=dtype) for chunks, dtype in zip(arrays, dtypes)]
+    return Book(counts, sizes, maturities, currency_codes, list(currencies), issuer_codes, list(leis))
+
+def maturity_ladder(book, years_to_maturity, bounds):
+    """
+    Return the number and total size of the bonds maturing in each bucket of years, where
+    `bounds` are the (increasing) upper bounds of the buckets. Matured bonds have their own bucket.
+    """
+    labels = ['matured']
+    lower = 0
+    for upper in bounds:
+        labels.append('%g-%gy' % (lower, upper))
+        lower = upper
+    labels.append('%gy+' % lower)
+
+    # Bucket 0 holds matured bonds, and bucket i the bonds maturing within (bounds[i-2], bounds[i-1]]
+    buckets = np.where(years_to_maturity <= 0, 0,
+                       np.searchsorted(np.asarray(bounds, dtype=np.float64), years_to_maturity) + 1)
+    counts = np.bincount(buckets, weights=book.counts, minlength=len(labels))
+    sizes = np.bincount(buckets, weights=book.sizes, minlength=len(labels))
+    return [{'bucket': label, 'count': int(count), 'total_size': int(size)}
+            for label, count, size in zip(labels, counts, sizes)]
+
+def concentration(codes, sizes, values, total_size):
+    """
+    Return the total size and share of each value (largest first), along with the
+    Herfindahl-Hirschman index of the shares.
+    """
+    totals = np.bincount(codes, weights=sizes, minlength=len(values))
+    shares = totals / total_size if total_size else np.zeros(len(values))
+    order = np.argsort(-totals, kind='stable')
+    groups = [(values[i], int(totals[i]), float(shares[i])) for i in order]
+    return groups, float(np.sum(shares ** 2))
+
+def analyze(book, today, ladder_bounds=None, top_issuers=None):
+    """
+    Return the analytics of a book as of `today`: the number of bonds, their total size and
+    size-weighted average life (in years, counting matured bonds as zero), a maturity ladder,
+    and the concentration of the book by currency and by issuer (the `top_issuers` largest).
+    """
+    ladder_bounds = ladder_bounds or settings.BONDS_ANALYTICS_LADDER
+    top_issuers = settings.BONDS_ANALYTICS_TOP_ISSUERS if top_issuers is None else top_issuers
+    total_size = int(book.sizes.sum())
+    years_to_maturity = (book.maturities - today.toordinal()) / DAYS_PER_YEAR
+    remaining_life = np.maximum(years_to_maturity, 0.0)
+
+    by_currency, currency_hhi = concentration(book.currency_codes, book.sizes, book.currencies, total_size)
+    by_issuer, issuer_hhi = concentration(book.issuer_codes, book.sizes, book.leis, total_size)
+    by_issuer = by_issuer[:top_issuers]
+    legal_names = dict(LegalEntity.objects.filter(lei__in=[lei for lei, _, _ in by_issuer])
+                       .values_list('lei', 'legal_name'))
+
+    return {
+        'count': int(book.counts.sum()),
+        'total_size': total_size,
+        'weighted_average_life_years':
+            float(np.dot(book.sizes, remaining_life) / total_size) if total_size else None,
+        'maturity_ladder': maturity_ladder(book, years_to_maturity, ladder_bounds),
+        'currencies': {
+            'hhi': currency_hhi,
+            'groups': [{'currency': currency, 'total_size': size, 'share': share}
+                       for currency, size, share in by_currency],
+        },
+        'issuers': {
+            'count': len(book.leis),
+            'hhi': issuer_hhi,
+            'top': [{'lei': lei, 'legal_name': legal_names.get(lei) or '', 'total_size': size, 'share': share}
+                    for lei, size, share in by_issuer],
+        },
+    }
@@ -1,4 +1,9 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 class BondsConfig(AppConfig):
     name = 'bonds'
+
+    def ready(self):
+        from .db import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='bonds.configure_sqlite')
@@ -0,0 +1,55 @@
+"""
+Defines the archival of matured bonds, run with the `archive_matured_bonds` command.
+
+Bonds which matured before a given date are moved from the `Bond` table to `ArchivedBond`,
+so that the bonds (and indexes) read by `GET /bonds/` stay proportional to the live book
+rather than to years of history. Bonds are moved in batches, each in its own short
+transaction: one `INSERT ... SELECT` into the archive, and one `DELETE`. Archived bonds are
+still returned by `GET /bonds/?include_matured=true` (see `CombinedBond`).
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+from . import versions
+from .models import ArchivedBond, Bond
+
+def matured_bonds(before):
+    """
+    Return the bonds which matured before `before` and can be archived.
+    """
+    # Pending bonds are left until enriched, as their enrichment jobs refer to them
+    return Bond.objects.filter(maturity__lt=before).exclude(enrichment_status=Bond.PENDING)
+
+def archive_matured_bonds(before, batch_size, progress=None):
+    """
+    Move the bonds which matured before `before` to the archive, `batch_size` at a time.
+    Calls `progress` with the number of bonds archived so far after each batch, and returns
+    the number of bonds archived.
+    """
+    archived, last_id = 0, 0
+    while True:
+        with transaction.atomic():
+            # Walking the ids reads each bond once, however many batches there are
+            batch = list(matured_bonds(before).filter(id__gt=last_id).order_by('id')
+                         .values_list('id', 'owner_id')[:batch_size])
+            if not batch:
+                return archived
+            ids = [bond_id for bond_id, _ in batch]
+            archive_batch(ids)
+            versions.bump(owner_id for _, owner_id in batch)
+        archived += len(ids)
+        last_id = ids[-1]
+        if progress:
+            progress(archived)
+
+def archive_batch(ids):
+    """
+    Copy the bonds with these ids to the archive, and delete them.
+    """
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in Bond._meta.concrete_fields)
+    with connection.cursor() as cursor:
+        cursor.execute('INSERT INTO %s (%s, %s) SELECT %s, %%s FROM %s WHERE %s IN (%s)' % (
+            quote(ArchivedBond._meta.db_table), columns, quote('archived_at'), columns,
+            quote(Bond._meta.db_table), quote('id'), ', '.join(['%s'] * len(ids))),
+            [ArchivedBond._meta.get_field('archived_at').get_db_prep_save(timezone.now(), connection)] + ids)
+    Bond.objects.filter(id__in=ids).delete()
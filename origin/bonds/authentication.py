@@ -0,0 +1,75 @@
+"""
+Defines the signed token authentication of API clients (`Authorization: Token <token>`).
+
+Tokens are issued by `POST /token/` and carry the user id, signed and timestamped with
+`TimestampSigner`, so verifying one needs no database query. Users are kept in a small
+in-process LRU, so most authenticated requests do not read the user table either.
+
+Tokens expire after `API_TOKEN_MAX_AGE` seconds. Bumping `API_TOKEN_VERSION` revokes every
+token issued before, and changing a user's password revokes that user's tokens (once the
+user drops out of the cache, i.e. within `API_TOKEN_USER_CACHE_TTL` seconds).
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.utils.crypto import constant_time_compare
+from rest_framework import authentication, exceptions
+from .cache import LRUCache, MISSING
+
+TOKEN_SALT = 'bonds.authentication'
+
+user_cache = LRUCache(settings.API_TOKEN_USER_CACHE_SIZE, settings.API_TOKEN_USER_CACHE_TTL)
+
+def password_fingerprint(user):
+    # Derived from the password hash, so that a new password invalidates existing tokens
+    return user.get_session_auth_hash()[:16]
+
+def issue_token(user):
+    """
+    Return a signed token which authenticates `user` for `API_TOKEN_MAX_AGE` seconds.
+    """
+    value = '%d:%d:%s' % (user.pk, settings.API_TOKEN_VERSION, password_fingerprint(user))
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(value)
+
+def get_user(user_id):
+    """
+    Return the active user with this id (from the cache if possible), or `None`.
+    """
+    user = user_cache.get(user_id)
+    if user is MISSING:
+        user = User.objects.filter(pk=user_id, is_active=True).first()
+        if user is None:
+            return None
+        user_cache.set(user_id, user)
+    return user
+
+class SignedTokenAuthentication(authentication.BaseAuthentication):
+    """
+    Authenticates requests which carry a token issued by `issue_token`.
+    """
+    keyword = 'Token'
+
+    def authenticate(self, request):
+        header = authentication.get_authorization_header(request).split()
+        if not header or header[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(header) != 2:
+            raise exceptions.AuthenticationFailed("Invalid token header.")
+        try:
+            token = header[1].decode()
+            value = signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.API_TOKEN_MAX_AGE)
+        except signing.SignatureExpired:
+            raise exceptions.AuthenticationFailed("Token has expired.")
+        except (signing.BadSignature, UnicodeError):
+            raise exceptions.AuthenticationFailed("Invalid token.")
+
+        user_id, version, fingerprint = value.split(':')
+        if int(version) != settings.API_TOKEN_VERSION:
+            raise exceptions.AuthenticationFailed("Token has been revoked.")
+        user = get_user(int(user_id))
+        if user is None or not constant_time_compare(fingerprint, password_fingerprint(user)):
+            raise exceptions.AuthenticationFailed("Token has been revoked.")
+        return (user, token)
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -0,0 +1,341 @@
+"""
+Defines helpers shared by the benchmark management commands, the benchmark of the bonds API
+run by `bench_bonds`, and the multi-process benchmark of the database profiles run by
+`bench_concurrency`.
+"""
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connection, connections, OperationalError
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, override_settings, setup_test_environment,
+                               teardown_test_environment)
+from django.utils import timezone
+from . import gleif
+from .cache import legal_name_cache
+from .db import READ_ONLY_ALIAS
+from .models import Bond, LegalEntity
+
+@contextmanager
+def throwaway_database(path=None):
+    """
+    Run the enclosed block in a test environment, against a freshly migrated test database
+    which is destroyed afterwards, so that benchmarks never touch the real data. With a `path`,
+    the test database is stored in that file (so that other processes can open it) rather
+    than in memory.
+    """
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    old_test_name = connection.settings_dict['TEST']['NAME']
+    if path:
+        connection.settings_dict['TEST']['NAME'] = path
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        connection.settings_dict['TEST']['NAME'] = old_test_name
+        teardown_test_environment()
+
+def seed_bonds(owners, count, start=0, batch_size=5000):
+    """
+    Insert `count` bonds, spread evenly across `owners` and across a few issuers and currencies.
+    ISINs are numbered from `start`, so that more bonds can be added to those seeded before.
+    """
+    issuers = [("%018dXX" % i, "ISSUER%d" % i) for i in range(50)]
+    LegalEntity.objects.bulk_create([LegalEntity(lei=lei, legal_name=legal_name, resolved_at=timezone.now())
+                                     for lei, legal_name in issuers], ignore_conflicts=True)
+    currencies = ["EUR", "USD", "GBP", "JPY", "CHF"]
+    first_maturity = date(2021, 1, 1)
+    bonds = []
+    for i in range(start, start + count):
+        lei = issuers[i % len(issuers)][0]
+        bonds.append(Bond(
+            owner=owners[i % len(owners)], isin="XS%010d" % i, size=1000000 * (1 + i % 500),
+            currency=currencies[i % len(currencies)], maturity=first_maturity + timedelta(days=i % 10000),
+            legal_entity_id=lei,
+        ))
+        if len(bonds) == batch_size:
+            Bond.objects.bulk_create(bonds)
+            bonds = []
+    Bond.objects.bulk_create(bonds)
+
+def create_users(count, prefix="benchuser"):
+    return [User.objects.create_user(username="%s%d" % (prefix, i)) for i in range(count)]
+
+def best_of(repeat, function):
+    """
+    Return the shortest wall-clock time (in seconds) of `repeat` calls to `function`.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def percentile(values, fraction):
+    """
+    Return the value below which `fraction` of `values` fall (nearest-rank method).
+    """
+    ordered = sorted(values)
+    return ordered[max(0, int(round(fraction * len(ordered))) - 1)]
+
+def summarize_timings(timings, query_counts):
+    return {
+        'requests': len(timings),
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p90_ms': percentile(timings, 0.90) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'max_ms': max(timings) * 1000,
+        'queries_per_request': sum(query_counts) / len(query_counts),
+    }
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class GleifStub:
+    """
+    A local HTTP server which stands in for the GLEIF API, answering every LEI lookup with a
+    made-up legal name after `latency` seconds. Use it as a context manager: while it runs,
+    `bonds.gleif.client` points at it.
+    """
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.latency)
+                leis = parse_qs(urlparse(self.path).query).get('lei', [''])[0].split(',')
+                records = [{"LEI": {"$": lei}, "Entity": {"LegalName": {"$": "STUB ENTITY " + lei}}}
+                           for lei in leis if lei]
+                body = json.dumps(records).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.endpoint = 'http://127.0.0.1:%d/api/v2/leirecords' % self.server.server_address[1]
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.original_client = gleif.client
+        gleif.client = gleif.GleifClient(endpoint=self.endpoint)
+        return self
+
+    def __exit__(self, *exc_info):
+        gleif.client = self.original_client
+        self.server.shutdown()
+        self.server.server_close()
+
+def timed_requests(client, method, paths, data=None):
+    """
+    Make a request to each path and return the wall-clock time and number of queries of each.
+    """
+    timings, query_counts = [], []
+    for path in paths:
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(client, method)(path, data, content_type='application/json') \
+                if data is not None else getattr(client, method)(path)
+            timings.append(time.perf_counter() - start)
+        assert response.status_code < 300, (path, response.status_code)
+        query_counts.append(len(queries))
+    return timings, query_counts
+
+def run_benchmark(sizes, users=100, posts=200, gets=50, distinct_leis=20, gleif_latency=0.05, log=None):
+    """
+    Seed the database up to each of `sizes` bonds (spread across `users` users) and measure
+    `POST /bonds/` throughput, against a GLEIF stub with the given latency, and `GET /bonds/`
+    latency for filtered and unfiltered queries. Returns the results as a JSON-serializable list.
+    """
+    log = log or (lambda message: None)
+    owners = create_users(users)
+    client = Client()
+    client.force_login(owners[0])
+    results, seeded = [], 0
+    for size in sorted(sizes):
+        log("Seeding %d bonds..." % size)
+        seed_bonds(owners, size - seeded, start=seeded)
+        seeded = size
+        result = {'bonds': size, 'users': users, 'bonds_per_user': size // users}
+
+        # Start each size with a cold cache, so that the first post of each LEI calls the stub
+        legal_name_cache.clear()
+        LegalEntity.objects.filter(lei__startswith="STUB").update(resolved_at=None)
+        with GleifStub(latency=gleif_latency) as stub:
+            log("Posting %d bonds..." % posts)
+            bond = {"size": 100000000, "currency": "EUR", "maturity": "2025-02-28"}
+            start = time.perf_counter()
+            timings, query_counts = [], []
+            for i in range(posts):
+                data = json.dumps(dict(bond, isin="FR%010d" % i, lei="STUB%016d" % (i % distinct_leis)))
+                post_timings, post_queries = timed_requests(client, 'post', ['/bonds/'], data)
+                timings += post_timings
+                query_counts += post_queries
+            elapsed = time.perf_counter() - start
+            result['post'] = dict(summarize_timings(timings, query_counts),
+                                  requests_per_second=posts / elapsed,
+                                  gleif_requests=stub.requests,
+                                  gleif_latency_ms=gleif_latency * 1000,
+                                  cache=legal_name_cache.stats())
+
+        queries = {
+            'unfiltered': '/bonds/',
+            'legal_name': '/bonds/?legal_name=ISSUER7',
+            'search': '/bonds/?search=issuer7',
+            'currency': '/bonds/?currency=USD',
+            'isin': '/bonds/?isin=XS0000000000',
+            'first_page': '/bonds/?page_size=100',
+        }
+        result['get'] = {}
+        for name, path in queries.items():
+            log("Getting %s %d times..." % (path, gets))
+            result['get'][name] = summarize_timings(*timed_requests(client, 'get', [path] * gets))
+        results.append(result)
+        # The posted bonds are removed, so that each size holds exactly the seeded bonds
+        Bond.objects.filter(isin__startswith="FR").delete()
+    return results
+
+def production_profile():
+    from origin import settings_production
+    return {
+        'pragmas': settings_production.SQLITE_PRAGMAS,
+        'conn_max_age': settings_production.DATABASES['default']['CONN_MAX_AGE'],
+        'read_only_alias': True,
+    }
+
+# The database profiles compared by `run_concurrency_benchmark`
+CONCURRENCY_PROFILES = {
+    # The development settings: rollback journal, and a new connection per request
+    'default': lambda: {'pragmas': {}, 'conn_max_age': 0, 'read_only_alias': False},
+    # origin/settings_production.py: WAL, tuned pragmas, persistent and read-only connections
+    'production': production_profile,
+}
+
+def summarize_latencies(timings, elapsed):
+    if not timings:
+        return {'requests': 0, 'requests_per_second': 0.0}
+    return {
+        'requests': len(timings),
+        'requests_per_second': len(timings) / elapsed,
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'max_ms': max(timings) * 1000,
+    }
+
+def mixed_workload(client, worker, duration, write_ratio, leis, after_request=None):
+    """
+    Make `GET /bonds/` and (with probability `write_ratio`) `POST /bonds/` requests for
+    `duration` seconds. Returns the read and write latencies, and the number of failed
+    requests: those which failed with "database is locked", and the others.
+    """
+    rng = random.Random(worker)
+    bond = {"size": 100000000, "currency": "EUR", "maturity": "2025-02-28"}
+    result = {'reads': [], 'writes': [], 'locked': 0, 'failed': 0}
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        write = rng.random() < write_ratio
+        start = time.perf_counter()
+        try:
+            if write:
+                data = dict(bond, isin="W%03d%08d" % (worker, len(result['writes'])), lei=rng.choice(leis))
+                response = client.post('/bonds/', json.dumps(data), content_type='application/json')
+            else:
+                response = client.get('/bonds/?page_size=100')
+        except OperationalError:
+            # The test client re-raises the exceptions of views, such as "database is locked"
+            result['locked'] += 1
+            continue
+        finally:
+            if after_request:
+                after_request()
+        if response.status_code >= 300:
+            result['failed'] += 1
+            continue
+        result['writes' if write else 'reads'].append(time.perf_counter() - start)
+    return result
+
+def concurrency_worker(task):
+    worker, username, duration, write_ratio, leis = task
+    client = Client()
+    client.force_login(User.objects.get(username=username))
+    # The test client keeps connections open between requests, unlike the WSGI handler, which
+    # closes them at the end of each request unless they are persistent (CONN_MAX_AGE)
+    result = mixed_workload(client, worker, duration, write_ratio, leis, after_request=close_old_connections)
+    connections.close_all()
+    return result
+
+def run_concurrency_benchmark(profile, processes=4, duration=10.0, write_ratio=0.2, bonds=10000, log=None):
+    """
+    Run a mixed `GET`/`POST /bonds/` workload from `processes` worker processes (one user each)
+    for `duration` seconds, against a throwaway file database configured as in the given
+    profile (see CONCURRENCY_PROFILES). Returns the results as a JSON-serializable dict.
+    """
+    log = log or (lambda message: None)
+    config = CONCURRENCY_PROFILES[profile]()
+    directory = tempfile.mkdtemp(prefix='bench_concurrency_')
+    path = os.path.join(directory, 'db.sqlite3')
+    old_conn_max_age = connection.settings_dict['CONN_MAX_AGE']
+    try:
+        with throwaway_database(path), \
+                override_settings(SQLITE_PRAGMAS=config['pragmas'], BONDS_LIST_CACHE_TIMEOUT=0):
+            # Reconnect, so that the pragmas of the profile apply (e.g. the WAL journal mode)
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = config['conn_max_age']
+            if config['read_only_alias']:
+                connections.databases[READ_ONLY_ALIAS] = dict(connection.settings_dict, NAME='file:%s?mode=ro' % path)
+            try:
+                log("[%s] Seeding %d bonds..." % (profile, bonds))
+                owners = create_users(processes)
+                seed_bonds(owners, bonds)
+                leis = list(LegalEntity.objects.values_list('lei', flat=True))
+                # Forked processes must not share the parent's connections
+                connections.close_all()
+
+                log("[%s] Running %d processes for %.1fs..." % (profile, processes, duration))
+                tasks = [(i, owner.username, duration, write_ratio, leis) for i, owner in enumerate(owners)]
+                start = time.perf_counter()
+                with multiprocessing.get_context('fork').Pool(processes) as pool:
+                    outcomes = pool.map(concurrency_worker, tasks)
+                elapsed = time.perf_counter() - start
+            finally:
+                connections.databases.pop(READ_ONLY_ALIAS, None)
+                connection.settings_dict['CONN_MAX_AGE'] = old_conn_max_age
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    reads = [timing for outcome in outcomes for timing in outcome['reads']]
+    writes = [timing for outcome in outcomes for timing in outcome['writes']]
+    return {
+        'profile': profile,
+        'processes': processes,
+        'duration_s': elapsed,
+        'write_ratio': write_ratio,
+        'bonds': bonds,
+        'requests_per_second': (len(reads) + len(writes)) / elapsed,
+        'get': summarize_latencies(reads, elapsed),
+        'post': summarize_latencies(writes, elapsed),
+        'locked': sum(outcome['locked'] for outcome in outcomes),
+        'failed': sum(outcome['failed'] for outcome in outcomes),
+    }
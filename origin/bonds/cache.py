@@ -0,0 +1,199 @@
+"""
+Defines the two-tier cache which sits in front of the GLEIF API.
+
+The first tier is an in-process LRU bounded by size and TTL. The second tier is the
+`LegalEntity` table, which survives restarts and is shared between worker processes.
+Both tiers also remember invalid LEIs (with a shorter TTL), so repeated bad input
+does not reach GLEIF either.
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.utils import timezone
+from . import metrics, versions
+from .models import LegalEntity
+
+# Returned by the caches when nothing (or nothing fresh) is stored for a key.
+# `None` cannot be used for this, as it is the cached value of an invalid LEI.
+MISSING = object()
+
+# LEIs read from the database per query, which keeps queries within SQLite's limit on variables
+DATABASE_CHUNK_SIZE = 500
+
+class LRUCache:
+    """
+    A thread-safe, size-bounded LRU cache whose entries expire after a TTL (in seconds).
+    """
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            # Evict the least recently used entries once the cache is over capacity
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class LegalNameCache:
+    """
+    Maps LEIs to legal names. A cached value of `None` means the LEI is known to be invalid.
+    """
+    def __init__(self, max_size=None, ttl=None, negative_ttl=None):
+        self.ttl = settings.LEI_CACHE_TTL if ttl is None else ttl
+        self.negative_ttl = settings.LEI_CACHE_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        max_size = settings.LEI_CACHE_MAX_SIZE if max_size is None else max_size
+        self.memory = LRUCache(max_size, self.ttl)
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def get(self, lei):
+        """
+        Returns the cached legal name of `lei` (`None` if it is invalid), or `MISSING`.
+        """
+        legal_name = self.memory.get(lei)
+        if legal_name is not MISSING:
+            self._count("memory_hits")
+            return legal_name
+
+        legal_name = self._get_from_database(lei)
+        self._count("misses" if legal_name is MISSING else "database_hits")
+        return legal_name
+
+    def get_many(self, leis):
+        """
+        Returns a dict mapping each of `leis` to its cached legal name, as for `get`. LEIs missing
+        from the in-process tier are read from the database with one query per chunk.
+        """
+        legal_names = {lei: self.memory.get(lei) for lei in leis}
+        misses = [lei for lei, legal_name in legal_names.items() if legal_name is MISSING]
+        self._count("memory_hits", len(legal_names) - len(misses))
+        found = 0
+        for start in range(0, len(misses), DATABASE_CHUNK_SIZE):
+            entities = LegalEntity.objects.filter(lei__in=misses[start:start + DATABASE_CHUNK_SIZE])
+            for lei, *resolution in entities.values_list("lei", "legal_name", "resolved_at", "invalid_at"):
+                legal_names[lei] = self._promote(lei, *resolution)
+                found += legal_names[lei] is not MISSING
+        self._count("database_hits", found)
+        self._count("misses", len(misses) - found)
+        return legal_names
+
+    def set(self, lei, legal_name):
+        """
+        Stores the legal name of `lei` in both tiers. Pass `None` for an invalid LEI.
+        """
+        self.set_many({lei: legal_name})
+
+    def set_many(self, legal_names):
+        """
+        Stores the legal names of several LEIs (a dict, as for `set`) with a few bulk queries.
+        """
+        now = timezone.now()
+        leis = list(legal_names)
+        existing = {}
+        for start in range(0, len(leis), DATABASE_CHUNK_SIZE):
+            entities = LegalEntity.objects.filter(lei__in=leis[start:start + DATABASE_CHUNK_SIZE])
+            existing.update(entities.values_list("lei", "legal_name"))
+        # An issuer which GLEIF now reports as invalid keeps its name, rather than blanking its bonds
+        invalidated = [lei for lei, legal_name in legal_names.items()
+                       if legal_name is None and existing.get(lei) is not None]
+        entities = [LegalEntity(lei=lei, legal_name=legal_name, resolved_at=now, invalid_at=None)
+                    for lei, legal_name in legal_names.items() if lei not in invalidated]
+        # Entities created concurrently by another process are simply overwritten next time
+        LegalEntity.objects.bulk_create([entity for entity in entities if entity.lei not in existing],
+                                        ignore_conflicts=True)
+        LegalEntity.objects.bulk_update([entity for entity in entities if entity.lei in existing],
+                                        ["legal_name", "resolved_at", "invalid_at"])
+        for start in range(0, len(invalidated), DATABASE_CHUNK_SIZE):
+            LegalEntity.objects.filter(lei__in=invalidated[start:start + DATABASE_CHUNK_SIZE]).update(invalid_at=now)
+        # Renaming an issuer changes the books of the users holding its bonds
+        versions.bump_holders([entity.lei for entity in entities
+                               if entity.lei in existing and existing[entity.lei] != entity.legal_name])
+        for lei, legal_name in legal_names.items():
+            self.memory.set(lei, legal_name, ttl=self._ttl_for(legal_name))
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["memory_size"] = len(self.memory)
+        return stats
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {"memory_hits": 0, "database_hits": 0, "misses": 0}
+
+    def clear(self):
+        """
+        Empties the in-process tier and resets the stats. The database tier is left as is.
+        """
+        self.memory.clear()
+        self.reset_stats()
+
+    def _get_from_database(self, lei):
+        resolved = LegalEntity.objects.filter(lei=lei).first()
+        if resolved is None:
+            return MISSING
+        return self._promote(lei, resolved.legal_name, resolved.resolved_at, resolved.invalid_at)
+
+    def _promote(self, lei, legal_name, resolved_at, invalid_at=None):
+        # The name of an issuer which was since reported as invalid is only kept for its bonds
+        if invalid_at is not None:
+            legal_name, resolved_at = None, invalid_at
+        # Entities of bonds which are still being enriched have not been resolved yet
+        if resolved_at is None:
+            return MISSING
+        age = (timezone.now() - resolved_at).total_seconds()
+        remaining = self._ttl_for(legal_name) - age
+        if remaining <= 0:
+            return MISSING
+        # Promote the entry to the in-process tier for the rest of its lifetime
+        self.memory.set(lei, legal_name, ttl=remaining)
+        return legal_name
+
+    def _ttl_for(self, legal_name):
+        return self.negative_ttl if legal_name is None else self.ttl
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+legal_name_cache = LegalNameCache()
+
+def collect_metrics():
+    stats = legal_name_cache.stats()
+    return [
+        '# HELP bonds_lei_cache_lookups_total Lookups in the legal name cache, by result.',
+        '# TYPE bonds_lei_cache_lookups_total counter',
+        'bonds_lei_cache_lookups_total{result="memory_hit"} %d' % stats['memory_hits'],
+        'bonds_lei_cache_lookups_total{result="database_hit"} %d' % stats['database_hits'],
+        'bonds_lei_cache_lookups_total{result="miss"} %d' % stats['misses'],
+        '# HELP bonds_lei_cache_memory_entries Entries in the in-process tier of the legal name cache.',
+        '# TYPE bonds_lei_cache_memory_entries gauge',
+        'bonds_lei_cache_memory_entries %d' % stats['memory_size'],
+    ]
+
+metrics.COLLECTORS.append(collect_metrics)
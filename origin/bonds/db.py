@@ -0,0 +1,66 @@
+"""
+Defines the SQLite connection setup, and the routing of reads to a read-only connection.
+
+Each new SQLite connection gets the pragmas of `settings.SQLITE_PRAGMAS` (e.g. WAL journaling
+and a busy timeout, see origin/settings_production.py). Reads made within `read_only()` go to
+the `readonly` database alias when it is configured: in WAL mode, readers on that connection
+never block writers, nor wait for them.
+"""
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connections
+
+READ_ONLY_ALIAS = 'readonly'
+
+_state = threading.local()
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Apply `settings.SQLITE_PRAGMAS` to a new SQLite connection (connected to `connection_created`).
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = dict(settings.SQLITE_PRAGMAS)
+    if connection.alias == READ_ONLY_ALIAS:
+        # The journal mode is stored in the database file, and can only be set by writers
+        pragmas.pop('journal_mode', None)
+        # Writes through the read-only alias fail, rather than taking the write lock
+        pragmas['query_only'] = 'ON'
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+
+@contextmanager
+def read_only():
+    """
+    Send the reads made by the enclosed block (in this thread) to the read-only alias, if any.
+    """
+    previous = getattr(_state, 'read_only', False)
+    _state.read_only = True
+    try:
+        yield
+    finally:
+        _state.read_only = previous
+
+class ReadOnlyRouter:
+    """
+    Routes the reads made within `read_only()` to the `readonly` alias. Without that alias
+    (e.g. in development and in the tests), every query uses the default database.
+    """
+    def db_for_read(self, model, **hints):
+        if getattr(_state, 'read_only', False) and READ_ONLY_ALIAS in connections.databases:
+            return READ_ONLY_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are connections to the same database file
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == READ_ONLY_ALIAS:
+            return False
+        return None
@@ -0,0 +1,131 @@
+"""
+Defines the background enrichment of bonds which were created with `POST /bonds/?async=true`.
+
+Jobs are stored in the `EnrichmentJob` table. A worker claims a batch of due jobs, looks up
+the distinct LEIs on a bounded thread pool, and then applies the results from its own thread,
+so that only one thread per worker writes to the database. Jobs whose lookup fails (e.g.
+because GLEIF is unavailable) are retried with exponential backoff.
+"""
+import logging
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from . import gleif, versions
+from .cache import legal_name_cache, MISSING
+from .lei_records import lookup_locally
+from .models import Bond, EnrichmentJob
+
+logger = logging.getLogger(__name__)
+
+def enqueue(bond):
+    """
+    Schedule the lookup of the legal name of a (pending) bond.
+    """
+    return EnrichmentJob.objects.create(bond=bond, lei=bond.lei, next_attempt_at=timezone.now())
+
+def backoff_delay(attempts):
+    """
+    Return the delay (in seconds) before retrying a job which has failed `attempts` times.
+    """
+    delay = min(settings.ENRICHMENT_BACKOFF_BASE * 2 ** (attempts - 1), settings.ENRICHMENT_BACKOFF_MAX)
+    # Jitter spreads out the retries of jobs which failed during the same outage
+    return delay * random.uniform(0.5, 1.0)
+
+class EnrichmentWorker:
+    """
+    Processes enrichment jobs, resolving at most `max_workers` LEIs concurrently.
+    """
+    def __init__(self, max_workers=None, batch_size=None):
+        self.max_workers = max_workers or settings.ENRICHMENT_WORKERS
+        self.batch_size = batch_size or settings.ENRICHMENT_BATCH_SIZE
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers)
+
+    def run(self, poll_interval):
+        """
+        Process jobs until interrupted, sleeping for `poll_interval` seconds whenever none are due.
+        """
+        try:
+            while True:
+                if not self.run_once():
+                    time.sleep(poll_interval)
+        finally:
+            self.pool.shutdown()
+
+    def run_once(self):
+        """
+        Process one batch of due jobs. Returns the number of jobs processed.
+        """
+        jobs = self.claim_jobs()
+        if not jobs:
+            return 0
+        legal_names, errors = self.resolve({job.lei for job in jobs})
+        self.apply(jobs, legal_names, errors)
+        return len(jobs)
+
+    def claim_jobs(self):
+        now = timezone.now()
+        token = uuid.uuid4().hex
+        due = EnrichmentJob.objects.filter(next_attempt_at__lte=now)
+        ids = list(due.order_by('next_attempt_at').values_list('id', flat=True)[:self.batch_size])
+        # Pushing `next_attempt_at` back stops other workers from claiming the same jobs.
+        # If this worker dies, the jobs become due again once the lease expires.
+        lease_expiry = now + timedelta(seconds=settings.ENRICHMENT_LEASE)
+        due.filter(id__in=ids).update(claim_token=token, next_attempt_at=lease_expiry)
+        return list(EnrichmentJob.objects.filter(claim_token=token))
+
+    def resolve(self, leis):
+        """
+        Look up the given LEIs, skipping the network for those which can be resolved locally.
+        Returns a dict of legal names (`None` for invalid LEIs) and a dict of errors for LEIs
+        which could not be looked up.
+        """
+        legal_names = lookup_locally(leis)
+        misses = [lei for lei, legal_name in legal_names.items() if legal_name is MISSING]
+        futures = {lei: self.pool.submit(gleif.client.fetch_legal_name, lei) for lei in misses}
+        errors = {}
+        for lei, future in futures.items():
+            try:
+                legal_names[lei] = future.result()
+            except Exception as e:
+                # Any failure is retried with backoff, up to ENRICHMENT_MAX_ATTEMPTS, rather than
+                # stopping the worker (and then every worker which claims the job after it)
+                if not isinstance(e, ConnectionError):
+                    logger.exception("Unexpected error while looking up LEI %s.", lei)
+                errors[lei] = str(e) or type(e).__name__
+                del legal_names[lei]
+                continue
+            legal_name_cache.set(lei, legal_names[lei])
+        return legal_names, errors
+
+    def apply(self, jobs, legal_names, errors):
+        now = timezone.now()
+        # The books of the owners of bonds which get resolved or failed change
+        changed = set()
+        with transaction.atomic():
+            for lei, legal_name in legal_names.items():
+                bond_ids = [job.bond_id for job in jobs if job.lei == lei]
+                # The legal name itself is already stored on the LegalEntity, by the cache
+                enrichment_status = Bond.FAILED if legal_name is None else Bond.RESOLVED
+                Bond.objects.filter(id__in=bond_ids).update(enrichment_status=enrichment_status)
+                changed.update(bond_ids)
+                EnrichmentJob.objects.filter(bond_id__in=bond_ids).delete()
+
+            for job in jobs:
+                if job.lei not in errors:
+                    continue
+                job.attempts += 1
+                job.last_error = errors[job.lei]
+                job.claim_token = ''
+                if job.attempts >= settings.ENRICHMENT_MAX_ATTEMPTS:
+                    Bond.objects.filter(id=job.bond_id).update(enrichment_status=Bond.FAILED)
+                    changed.add(job.bond_id)
+                    job.delete()
+                    continue
+                job.next_attempt_at = now + timedelta(seconds=backoff_delay(job.attempts))
+                job.save()
+            versions.bump(Bond.objects.filter(id__in=changed).values_list('owner_id', flat=True))
@@ -0,0 +1,255 @@
+"""
+Defines the client used to look up legal names on the GLEIF API.
+
+All lookups go through one keep-alive `requests.Session`, so connections are pooled and
+reused. Every request is bounded by connect and read timeouts. Only a 400 or 404 response, or
+an empty result, means that a LEI is invalid: other failures (timeouts, connection errors,
+429s, 5xx and unexpected 4xx responses) are retried with jittered exponential backoff, or after
+the delay GLEIF asks for, and then raise `GleifUnavailableError`. A circuit breaker
+makes lookups fail fast while GLEIF keeps failing, instead of tying up a worker per request.
+Concurrent lookups of the same LEI within a process share one request (see `singleflight`).
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from . import metrics
+from .singleflight import SingleFlight
+
+GLEIF_API_ENDPOINT = settings.GLEIF_API_ENDPOINT
+
+# The statuses with which GLEIF rejects malformed or unknown LEIs
+INVALID_LEI_STATUSES = (400, 404)
+
+def normalize_legal_name(legal_name):
+    """
+    Return a legal name in the form stored on bonds, i.e. with whitespace removed.
+    """
+    return legal_name.replace(" ", "")
+
+class GleifUnavailableError(ConnectionError):
+    """
+    Raised when the GLEIF API cannot be reached or keeps failing.
+    """
+    pass
+
+class CircuitOpenError(GleifUnavailableError):
+    """
+    Raised instead of calling the GLEIF API while the circuit breaker is open.
+    """
+    pass
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. While open, calls are rejected until
+    `reset_timeout` seconds have passed. A single trial call is then let through (half-open):
+    the circuit closes again if it succeeds, and re-opens if it fails.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.reset()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow_request(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                return True
+            # Only the first caller gets to make the trial call while half-open
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def reset(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._opened_at = None
+
+class GleifClient:
+    """
+    A client for the GLEIF LEI records endpoint. Legal names are returned with whitespace removed.
+    """
+    def __init__(self, endpoint=None, pool_size=None, connect_timeout=None, read_timeout=None,
+                 max_retries=None, retry_backoff=None, breaker=None):
+        self.endpoint = endpoint or GLEIF_API_ENDPOINT
+        self.timeout = (connect_timeout or settings.GLEIF_CONNECT_TIMEOUT,
+                        read_timeout or settings.GLEIF_READ_TIMEOUT)
+        self.max_retries = settings.GLEIF_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_backoff = settings.GLEIF_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+        self.breaker = breaker or CircuitBreaker(settings.GLEIF_CIRCUIT_FAILURE_THRESHOLD,
+                                                 settings.GLEIF_CIRCUIT_RESET_TIMEOUT)
+        pool_size = pool_size or settings.GLEIF_POOL_SIZE
+        self.session = requests.Session()
+        # Retries are handled by `get` (and counted by the circuit breaker), not by urllib3
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.in_flight = SingleFlight(metrics.GLEIF_COALESCED_LOOKUPS)
+
+    def fetch_legal_name(self, lei):
+        """
+        Fetch the legal name of a LEI. Returns `None` if the LEI is invalid or does not exist.
+        If the LEI is already being looked up, waits for that lookup and shares its outcome.
+        """
+        return self.in_flight.do(lei, lambda: self._fetch_legal_name(lei))
+
+    def fetch_legal_names(self, leis, throttle=None):
+        """
+        Fetch the legal names of several LEIs with one multi-LEI request, leaving out the LEIs
+        already being looked up (whose lookups are waited for instead). If GLEIF rejects the
+        request, the LEIs are looked up one by one, calling `throttle` (e.g. to rate limit)
+        before each of these requests.
+        Returns a dict mapping each LEI to its legal name (`None` if the LEI is invalid).
+        """
+        results = self.in_flight.do_many(leis, lambda led: self._fetch_legal_names(led, throttle))
+        return {lei: results[lei] for lei in leis}
+
+    def _fetch_legal_name(self, lei):
+        response = self.get(lei)
+        # If the LEI was rejected or no legal names returned, the LEI is invalid.
+        if response.status_code in INVALID_LEI_STATUSES:
+            return None
+        with self.parsing():
+            records = response.json()
+            return self.legal_name(records[0]) if records else None
+
+    def _fetch_legal_names(self, leis, throttle=None):
+        response = self.get(','.join(leis))
+        # GLEIF rejects the whole batch if one of the LEIs is malformed, so look them up one by one
+        # (without coalescing, as these LEIs are in flight already)
+        if response.status_code in INVALID_LEI_STATUSES:
+            legal_names = {}
+            for lei in leis:
+                if throttle:
+                    throttle()
+                legal_names[lei] = self._fetch_legal_name(lei)
+            return legal_names
+
+        with self.parsing():
+            found = {record['LEI']['$'].upper(): self.legal_name(record) for record in response.json()}
+        # LEIs missing from the response do not exist
+        return {lei: found.get(lei.upper()) for lei in leis}
+
+    @contextmanager
+    def parsing(self):
+        # A response which is not the expected JSON says nothing about the LEIs
+        try:
+            yield
+        except (ValueError, LookupError, TypeError) as e:
+            raise GleifUnavailableError("The GLEIF API returned an invalid response.") from e
+
+    def get(self, lei):
+        """
+        Query the endpoint for `lei` (one LEI or a comma-separated list), retrying transient failures.
+        Raises `GleifUnavailableError` if GLEIF cannot be reached, or `CircuitOpenError` while
+        the circuit breaker is open.
+        """
+        outcome = 'ok'
+        start = time.perf_counter()
+        try:
+            return self._get(lei)
+        except CircuitOpenError:
+            outcome = 'circuit_open'
+            raise
+        except Exception:
+            outcome = 'unavailable'
+            raise
+        finally:
+            metrics.GLEIF_REQUEST_DURATION.observe(time.perf_counter() - start, outcome=outcome)
+
+    def _get(self, lei):
+        if not isinstance(lei, str):
+            raise TypeError("LEIs must be strings, not %s." % type(lei).__name__)
+        # The URL is built before the breaker lets the call through, so that a half-open breaker
+        # always gets the outcome of its trial call
+        url = self.endpoint + '?lei=' + quote(lei, safe=',')
+        if not self.breaker.allow_request():
+            raise CircuitOpenError("The GLEIF API is unavailable, not retrying yet.")
+        succeeded = False
+        try:
+            retry_after = None
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    time.sleep(self.retry_delay(attempt, retry_after))
+                try:
+                    response = self.session.get(url, timeout=self.timeout)
+                except requests.RequestException:
+                    # Timeouts, connection errors, broken or undecodable responses, redirect loops...
+                    retry_after = None
+                    continue
+                except Exception as e:
+                    raise GleifUnavailableError("Failed to connect to the GLEIF API.") from e
+                if response.ok or response.status_code in INVALID_LEI_STATUSES:
+                    succeeded = True
+                    return response
+                # 429s, 5xx and unexpected 4xx responses say nothing about the LEI
+                retry_after = self.parse_retry_after(response)
+                if retry_after is not None and retry_after > settings.GLEIF_MAX_RETRY_AFTER:
+                    break
+            raise GleifUnavailableError("Failed to connect to the GLEIF API.")
+        finally:
+            # Every failure counts against the circuit, including unexpected errors
+            if succeeded:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    def retry_delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return retry_after
+        # "Full jitter" backoff, so that concurrent retries do not arrive in lockstep
+        return random.uniform(0, self.retry_backoff * 2 ** (attempt - 1))
+
+    @staticmethod
+    def parse_retry_after(response):
+        """
+        Return the delay (in seconds) asked for by the Retry-After header of a response, if any.
+        """
+        value = response.headers.get('Retry-After')
+        if value is None:
+            return None
+        if value.strip().isdigit():
+            return int(value)
+        # Otherwise, the header is an HTTP date
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at is None or retry_at.tzinfo is None:
+            return None
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0)
+
+    @staticmethod
+    def legal_name(record):
+        return normalize_legal_name(record['Entity']['LegalName']['$'])
+
+client = GleifClient()
@@ -0,0 +1,158 @@
+"""
+Defines the import of GLEIF golden copy files into the `LEIRecord` table, and the local
+resolution of LEIs from it.
+
+Golden copy files (LEI-CDF) hold millions of records, so they are parsed incrementally
+(`iterparse` for XML, `csv.DictReader` for CSV) and written in batches, each in its own
+transaction. Memory use is bounded by the batch size rather than the file size.
+"""
+import csv
+import io
+import zipfile
+from xml.etree import ElementTree
+from django.conf import settings
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from .cache import DATABASE_CHUNK_SIZE, legal_name_cache, MISSING
+from .gleif import normalize_legal_name
+from .models import LEIRecord
+
+# The columns of the GLEIF golden copy CSV files which are imported
+CSV_COLUMNS = {
+    'lei': 'LEI',
+    'legal_name': 'Entity.LegalName',
+    'entity_status': 'Entity.EntityStatus',
+    'last_update': 'Registration.LastUpdateDate',
+}
+
+def lookup_locally(leis):
+    """
+    Resolve LEIs without calling the GLEIF API: from the legal name cache, then from the imported
+    LEI records. Returns a dict mapping each LEI to its legal name, to `None` if it is invalid, or
+    to `MISSING` if only the GLEIF API can tell. With `LEI_RECORDS_ONLY`, LEIs which are not in
+    the imported records are invalid.
+    """
+    legal_names = legal_name_cache.get_many(leis)
+    misses = [lei for lei, legal_name in legal_names.items() if legal_name is MISSING]
+    if not misses:
+        return legal_names
+
+    records = {}
+    for start in range(0, len(misses), DATABASE_CHUNK_SIZE):
+        chunk = misses[start:start + DATABASE_CHUNK_SIZE]
+        records.update(LEIRecord.objects.filter(lei__in=chunk).values_list('lei', 'legal_name'))
+    found = {lei: normalize_legal_name(legal_name) for lei, legal_name in records.items()}
+    # Cache the names found, which also stores them on the LegalEntity that bonds reference
+    if found:
+        legal_name_cache.set_many(found)
+    legal_names.update(found)
+    if settings.LEI_RECORDS_ONLY:
+        legal_names.update({lei: None for lei in misses if lei not in found})
+    return legal_names
+
+def open_golden_copy(path):
+    """
+    Open a golden copy file as a binary stream, unpacking it on the fly if it is zipped.
+    Returns the stream and the format of the file ('xml' or 'csv').
+    """
+    if path.endswith('.zip'):
+        archive = zipfile.ZipFile(path)
+        name = archive.namelist()[0]
+        return archive.open(name), name.rsplit('.', 1)[-1].lower()
+    return open(path, 'rb'), path.rsplit('.', 1)[-1].lower()
+
+def iter_xml_records(stream):
+    """
+    Yield LEI records (as dicts of LEIRecord fields) from an LEI-CDF XML file, one at a time.
+    """
+    # The (LEIRecord field, parent element) of the elements which are imported
+    elements = {
+        ('LEI', 'LEIRecord'): 'lei',
+        ('LegalName', 'Entity'): 'legal_name',
+        ('EntityStatus', 'Entity'): 'entity_status',
+        ('LastUpdateDate', 'Registration'): 'last_update',
+    }
+    record = {}
+    # The elements which have been opened but not closed yet
+    path = []
+    for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            path.append(element)
+            continue
+        path.pop()
+        if not path:
+            break
+        # Ignore the namespace, which changes between versions of the LEI-CDF format
+        tag, parent = local_name(element.tag), local_name(path[-1].tag)
+        if (tag, parent) in elements:
+            record[elements[(tag, parent)]] = element.text
+        elif tag == 'LEIRecord':
+            yield record
+            record = {}
+            # Detach the parsed record, otherwise the whole file builds up in memory
+            path[-1].remove(element)
+
+def local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def iter_csv_records(stream):
+    """
+    Yield LEI records (as dicts of LEIRecord fields) from a golden copy CSV file, one at a time.
+    """
+    for row in csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8')):
+        yield {field: row.get(column) for field, column in CSV_COLUMNS.items()}
+
+def iter_records(stream, file_format):
+    if file_format == 'xml':
+        return iter_xml_records(stream)
+    if file_format == 'csv':
+        return iter_csv_records(stream)
+    raise ValueError("Unsupported golden copy format: " + file_format)
+
+def import_records(records, batch_size, skip=0, progress=None):
+    """
+    Insert or update LEI records in batches, skipping the first `skip` records. Existing records
+    are only overwritten by records with a newer `last_update`, so a file can be re-imported,
+    or a delta file imported on top of it. `progress` is called with the number of records
+    read so far after each batch is committed. Returns counts of created and updated records.
+    """
+    counts = {'created': 0, 'updated': 0}
+    batch = []
+    read = 0
+    for record in records:
+        read += 1
+        if read <= skip:
+            continue
+        batch.append(record)
+        if len(batch) == batch_size:
+            import_batch(batch, counts)
+            batch = []
+            if progress:
+                progress(read)
+    if batch:
+        import_batch(batch, counts)
+        if progress:
+            progress(read)
+    return counts
+
+def import_batch(batch, counts):
+    records = {}
+    for fields in batch:
+        last_update = fields.get('last_update')
+        records[fields['lei']] = LEIRecord(
+            lei=fields['lei'], legal_name=fields.get('legal_name') or '',
+            entity_status=fields.get('entity_status') or '',
+            last_update=parse_datetime(last_update) if last_update else None,
+        )
+
+    with transaction.atomic():
+        existing = dict(LEIRecord.objects.filter(lei__in=records).values_list('lei', 'last_update'))
+        created = [record for lei, record in records.items() if lei not in existing]
+        updated = [record for lei, record in records.items() if lei in existing and is_newer(record, existing[lei])]
+        LEIRecord.objects.bulk_create(created)
+        LEIRecord.objects.bulk_update(updated, ['legal_name', 'entity_status', 'last_update'])
+    counts['created'] += len(created)
+    counts['updated'] += len(updated)
+
+def is_newer(record, last_update):
+    return last_update is None or (record.last_update is not None and record.last_update > last_update)
@@ -0,0 +1,27 @@
+"""
+Moves matured bonds to the archive table (see bonds/archive.py).
+"""
+from datetime import date
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from bonds.archive import archive_matured_bonds
+
+class Command(BaseCommand):
+    help = "Move the bonds which matured before --before (by default, today) to the archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help="Archive bonds maturing before this date (YYYY-MM-DD).")
+        parser.add_argument('--batch-size', type=int, default=settings.BONDS_ARCHIVE_BATCH_SIZE,
+                            help="Number of bonds moved per transaction.")
+
+    def handle(self, *args, **options):
+        try:
+            before = date.fromisoformat(options['before']) if options['before'] else date.today()
+        except ValueError:
+            raise CommandError("--before must be a date in the YYYY-MM-DD format.")
+
+        def progress(archived):
+            self.stdout.write("%d bond(s) archived." % archived)
+
+        archived = archive_matured_bonds(before, options['batch_size'], progress)
+        self.stdout.write("Archived %d bond(s) which matured before %s." % (archived, before.isoformat()))
@@ -0,0 +1,48 @@
+"""
+Benchmarks the bonds API against growing amounts of data, with a local stand-in for the GLEIF API.
+"""
+import json
+import subprocess
+from datetime import datetime
+from django.core.management.base import BaseCommand
+from bonds.benchmark import run_benchmark, throwaway_database
+
+class Command(BaseCommand):
+    help = "Benchmark POST and GET /bonds/ in a throwaway database, and write the results as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                            help="Numbers of bonds to seed (cumulatively).")
+        parser.add_argument('--users', type=int, default=100, help="Number of users owning the bonds.")
+        parser.add_argument('--posts', type=int, default=200, help="Number of POST requests per size.")
+        parser.add_argument('--gets', type=int, default=50, help="Number of GET requests per query and size.")
+        parser.add_argument('--distinct-leis', type=int, default=20, help="Number of distinct LEIs posted.")
+        parser.add_argument('--gleif-latency', type=float, default=0.05,
+                            help="Latency (in seconds) of the GLEIF stub.")
+        parser.add_argument('--output', default='bench_results.json', help="Path of the JSON results file.")
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            results = run_benchmark(
+                options['sizes'], users=options['users'], posts=options['posts'], gets=options['gets'],
+                distinct_leis=options['distinct_leis'], gleif_latency=options['gleif_latency'],
+                log=self.stdout.write,
+            )
+
+        report = {'commit': self.current_commit(), 'timestamp': datetime.utcnow().isoformat() + 'Z', 'results': results}
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+        for result in results:
+            self.stdout.write("%9d bonds: POST %6.1f req/s (p50 %6.1f ms), GET unfiltered p50 %7.1f ms, "
+                              "GET ?legal_name p50 %6.1f ms, GET ?search p50 %6.1f ms" % (
+                                  result['bonds'], result['post']['requests_per_second'], result['post']['p50_ms'],
+                                  result['get']['unfiltered']['p50_ms'], result['get']['legal_name']['p50_ms'],
+                                  result['get']['search']['p50_ms']))
+        self.stdout.write("Results written to %s." % options['output'])
+
+    def current_commit(self):
+        try:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
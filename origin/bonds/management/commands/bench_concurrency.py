@@ -0,0 +1,44 @@
+"""
+Benchmarks mixed reads and writes of the bonds API from several worker processes, with the
+default and the production database profiles.
+"""
+import json
+from datetime import datetime
+from django.core.management.base import BaseCommand
+from bonds.benchmark import CONCURRENCY_PROFILES, run_concurrency_benchmark
+
+class Command(BaseCommand):
+    help = ("Run concurrent GET and POST /bonds/ requests from several processes against a throwaway "
+            "database, for each database profile, and write the results as JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', choices=sorted(CONCURRENCY_PROFILES),
+                            default=['default', 'production'], help="Database profiles to compare.")
+        parser.add_argument('--processes', type=int, default=4, help="Number of worker processes.")
+        parser.add_argument('--duration', type=float, default=10.0,
+                            help="Number of seconds for which each profile is run.")
+        parser.add_argument('--write-ratio', type=float, default=0.2, help="Fraction of requests which are POSTs.")
+        parser.add_argument('--bonds', type=int, default=10000, help="Number of bonds to seed.")
+        parser.add_argument('--output', default='bench_concurrency.json', help="Path of the JSON results file.")
+
+    def handle(self, *args, **options):
+        results = [
+            run_concurrency_benchmark(
+                profile, processes=options['processes'], duration=options['duration'],
+                write_ratio=options['write_ratio'], bonds=options['bonds'], log=self.stdout.write,
+            )
+            for profile in options['profiles']
+        ]
+
+        report = {'timestamp': datetime.utcnow().isoformat() + 'Z', 'results': results}
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+        for result in results:
+            self.stdout.write("%-10s %7.1f req/s: GET %6.1f req/s (p99 %7.1f ms), POST %6.1f req/s (p99 %7.1f ms), "
+                              "%d locked, %d failed" % (
+                                  result['profile'], result['requests_per_second'],
+                                  result['get']['requests_per_second'], result['get'].get('p99_ms', 0),
+                                  result['post']['requests_per_second'], result['post'].get('p99_ms', 0),
+                                  result['locked'], result['failed']))
+        self.stdout.write("Results written to %s." % options['output'])
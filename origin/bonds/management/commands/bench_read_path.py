@@ -0,0 +1,39 @@
+"""
+Compares the fast read path of `GET /bonds/` with serializing model instances through BondSerializer.
+"""
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from bonds.benchmark import best_of, create_users, seed_bonds, throwaway_database
+from bonds.models import Bond
+from bonds.serializers import BondSerializer, BOND_READ_COLUMNS, represent_bonds
+
+class Command(BaseCommand):
+    help = "Benchmark the fast read path against BondSerializer, in a throwaway database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help="Numbers of bonds to serialize.")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per measurement (the best is kept).")
+
+    def handle(self, *args, **options):
+        renderer = JSONRenderer()
+        with throwaway_database():
+            owner, = create_users(1)
+            seeded = 0
+            self.stdout.write("%10s %14s %14s %9s" % ("rows", "serializer (s)", "fast path (s)", "speedup"))
+            for rows in sorted(options['rows']):
+                seed_bonds([owner], rows - seeded, start=seeded)
+                seeded = rows
+                bonds = Bond.objects.filter(owner=owner)
+
+                # Both paths include the query, the serialization and the JSON rendering
+                def serializer_path():
+                    return renderer.render(BondSerializer(bonds.all(), many=True).data)
+
+                def fast_path():
+                    return renderer.render(list(represent_bonds(bonds.values_list(*BOND_READ_COLUMNS), owner.username)))
+
+                assert serializer_path() == fast_path()
+                slow = best_of(options['repeat'], serializer_path)
+                fast = best_of(options['repeat'], fast_path)
+                self.stdout.write("%10d %14.3f %14.3f %8.1fx" % (rows, slow, fast, slow / fast))
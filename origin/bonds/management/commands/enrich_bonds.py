@@ -0,0 +1,32 @@
+"""
+Runs the worker which fills in the legal names of bonds created with `POST /bonds/?async=true`.
+"""
+from django.core.management.base import BaseCommand
+from bonds.enrichment import EnrichmentWorker
+
+class Command(BaseCommand):
+    help = "Resolve the legal names of pending bonds in the background."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help="Number of concurrent GLEIF lookups.")
+        parser.add_argument('--batch-size', type=int, help="Number of jobs claimed at once.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to wait when there are no due jobs.")
+        parser.add_argument('--once', action='store_true',
+                            help="Process the jobs which are currently due, then exit.")
+
+    def handle(self, *args, **options):
+        worker = EnrichmentWorker(max_workers=options['workers'], batch_size=options['batch_size'])
+        if not options['once']:
+            self.stdout.write("Enriching bonds, press CTRL-C to stop.")
+            worker.run(options['poll_interval'])
+            return
+
+        processed = 0
+        while True:
+            count = worker.run_once()
+            if not count:
+                break
+            processed += count
+        worker.pool.shutdown()
+        self.stdout.write("Processed %d job(s)." % processed)
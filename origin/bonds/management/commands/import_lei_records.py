@@ -0,0 +1,33 @@
+"""
+Imports a GLEIF golden copy file (LEI-CDF XML or CSV, optionally zipped) into the LEIRecord table.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from bonds.lei_records import import_records, iter_records, open_golden_copy
+
+class Command(BaseCommand):
+    help = "Import a GLEIF golden copy (or delta) file, so that LEIs can be resolved locally."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Path to a .xml, .csv or .zip golden copy file.")
+        parser.add_argument('--batch-size', type=int, default=settings.LEI_RECORDS_BATCH_SIZE,
+                            help="Number of records written per transaction.")
+        parser.add_argument('--skip', type=int, default=0,
+                            help="Number of records to skip, to resume an interrupted import.")
+
+    def handle(self, *args, **options):
+        try:
+            stream, file_format = open_golden_copy(options['path'])
+        except (OSError, IndexError) as e:
+            raise CommandError("Cannot open %s: %s" % (options['path'], e))
+
+        def progress(read):
+            self.stdout.write("%d records read (resume with --skip %d)." % (read, read))
+
+        with stream:
+            try:
+                records = iter_records(stream, file_format)
+                counts = import_records(records, options['batch_size'], skip=options['skip'], progress=progress)
+            except ValueError as e:
+                raise CommandError(str(e))
+        self.stdout.write("Created %(created)d and updated %(updated)d record(s)." % counts)
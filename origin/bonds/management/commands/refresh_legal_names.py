@@ -0,0 +1,30 @@
+"""
+Looks up the stale legal names of issuers again on the GLEIF API (see bonds/refresh.py).
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from bonds.gleif import GleifUnavailableError
+from bonds.refresh import refresh_legal_names
+
+class Command(BaseCommand):
+    help = "Refresh the legal names of issuers which were resolved longer than --max-age seconds ago."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=settings.LEI_REFRESH_MAX_AGE,
+                            help="Age (in seconds) after which a legal name is refreshed.")
+        parser.add_argument('--batch-size', type=int, default=settings.GLEIF_BATCH_SIZE,
+                            help="Number of LEIs looked up per GLEIF API request.")
+        parser.add_argument('--rate', type=float, default=settings.LEI_REFRESH_RATE,
+                            help="Maximum number of GLEIF API requests per second (0 for no limit).")
+
+    def handle(self, *args, **options):
+        def progress(counts):
+            self.stdout.write("%(refreshed)d LEI(s) refreshed." % counts)
+
+        try:
+            counts = refresh_legal_names(options['max_age'], options['batch_size'], options['rate'], progress)
+        except GleifUnavailableError as e:
+            # Refreshed LEIs are no longer stale, so running the command again resumes the refresh
+            raise CommandError("%s Run the command again to resume." % e)
+        self.stdout.write("Refreshed %(refreshed)d LEI(s): %(renamed)d renamed, %(missing)d missing from GLEIF "
+                          "(kept, and left to the next refresh)." % counts)
@@ -0,0 +1,153 @@
+"""
+Defines the metrics exposed at /metrics in the Prometheus text format.
+
+The metrics are kept in memory with one lock per metric, so recording a value costs a dict
+lookup and a few additions, and they can stay on under load. As with any in-process registry,
+each WSGI worker process reports its own metrics, which Prometheus aggregates across targets.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Prometheus' default buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+class Metric:
+    """
+    A metric with optional labels. Values are stored per combination of label values.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join('%s="%s"' % (name, escape(value)) for name, value in pairs) + '}'
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s %s' % (self.name, self.type)]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+class Counter(Metric):
+    """
+    A value which only goes up, e.g. a number of requests.
+    """
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_value(self, key, value):
+        return ['%s%s %s' % (self.name, self._format_labels(key), format_value(value))]
+
+class Histogram(Metric):
+    """
+    A distribution of observed values (e.g. durations), counted in cumulative buckets.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Counts per bucket (the last one is +Inf), then the sum of all observations
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_value(self, key, value):
+        counts, total = value
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = self._format_labels(key, [('le', '+Inf' if bound == float('inf') else format_value(bound))])
+            lines.append('%s_bucket%s %d' % (self.name, le, cumulative))
+        lines.append('%s_sum%s %s' % (self.name, self._format_labels(key), format_value(total)))
+        lines.append('%s_count%s %d' % (self.name, self._format_labels(key), cumulative))
+        return lines
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+REGISTRY = []
+
+# Functions called when rendering, which return extra lines (for values kept elsewhere)
+COLLECTORS = []
+
+def render():
+    """
+    Render every metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for collector in COLLECTORS:
+        lines.extend(collector())
+    return '\n'.join(lines) + '\n'
+
+def reset():
+    """
+    Clear the values of every metric (used by the tests).
+    """
+    for metric in REGISTRY:
+        with metric._lock:
+            metric._values.clear()
+
+HTTP_REQUESTS = Counter(
+    'bonds_http_requests_total', "HTTP requests, by view, method and status code.",
+    ['view', 'method', 'status'])
+HTTP_REQUEST_DURATION = Histogram(
+    'bonds_http_request_duration_seconds', "Time spent handling HTTP requests.", ['view', 'method'])
+HTTP_REQUEST_DB_QUERIES = Histogram(
+    'bonds_http_request_db_queries', "Database queries made per HTTP request.", ['view', 'method'],
+    buckets=QUERY_COUNT_BUCKETS)
+HTTP_REQUEST_DB_DURATION = Histogram(
+    'bonds_http_request_db_duration_seconds', "Time spent in database queries per HTTP request.",
+    ['view', 'method'])
+GLEIF_REQUEST_DURATION = Histogram(
+    'bonds_gleif_request_duration_seconds',
+    "Time spent on GLEIF API lookups (including retries), by outcome.", ['outcome'])
+GLEIF_COALESCED_LOOKUPS = Counter(
+    'bonds_gleif_coalesced_lookups_total',
+    "LEI lookups which shared the GLEIF request of a concurrent lookup instead of making their own.")
+BONDS_QUERY_DURATION = Histogram(
+    'bonds_list_query_duration_seconds', "Time spent running the filter query of GET /bonds/.")
+BONDS_SERIALIZATION_DURATION = Histogram(
+    'bonds_list_serialization_duration_seconds', "Time spent serializing the bonds of GET /bonds/.")
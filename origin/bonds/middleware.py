@@ -0,0 +1,53 @@
+"""
+Defines middleware for the bonds app.
+"""
+import time
+from contextlib import ExitStack
+from django.db import connections
+from . import metrics
+
+class QueryRecorder:
+    """
+    A database execute wrapper which counts the queries made, and the time spent on them.
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+class MetricsMiddleware:
+    """
+    Records the number, duration and database usage of requests, per view (see bonds/metrics.py).
+    Queries made while a streaming response is consumed are not included.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            # Every alias is wrapped, as reads may go through the read-only one (see bonds/db.py)
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        view, method = self.view_name(request), request.method
+        metrics.HTTP_REQUESTS.inc(view=view, method=method, status=response.status_code)
+        metrics.HTTP_REQUEST_DURATION.observe(duration, view=view, method=method)
+        metrics.HTTP_REQUEST_DB_QUERIES.observe(recorder.count, view=view, method=method)
+        metrics.HTTP_REQUEST_DB_DURATION.observe(recorder.duration, view=view, method=method)
+        return response
+
+    def view_name(self, request):
+        # Label by view rather than by path, so that the number of label values stays bounded
+        match = getattr(request, 'resolver_match', None)
+        return match.func.__name__ if match else 'unmatched'
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.13 on 2026-10-18 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bonds', '0002_auto_20201213_2313'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResolvedLEI',
+            fields=[
+                ('lei', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('legal_name', models.CharField(max_length=100, null=True)),
+                ('resolved_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.13 on 2026-10-18 04:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bonds', '0003_resolvedlei'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bond',
+            name='enrichment_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('resolved', 'Resolved'), ('failed', 'Failed')], default='resolved', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='bond',
+            name='legal_name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.CreateModel(
+            name='EnrichmentJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lei', models.CharField(max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(db_index=True)),
+                ('claim_token', models.CharField(blank=True, max_length=32)),
+                ('last_error', models.TextField(blank=True)),
+                ('bond', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='enrichment_job', to='bonds.Bond')),
+            ],
+        ),
+    ]
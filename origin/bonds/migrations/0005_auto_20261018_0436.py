@@ -0,0 +1,33 @@
+# Generated by Django 2.2.13 on 2026-10-18 04:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bonds', '0004_auto_20261018_0433'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bond',
+            index=models.Index(fields=['owner', 'isin'], name='bonds_owner_isin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bond',
+            index=models.Index(fields=['owner', 'currency'], name='bonds_owner_currency_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bond',
+            index=models.Index(fields=['owner', 'maturity'], name='bonds_owner_maturity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bond',
+            index=models.Index(fields=['owner', 'lei'], name='bonds_owner_lei_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bond',
+            index=models.Index(fields=['owner', 'legal_name'], name='bonds_owner_legal_name_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.13 on 2026-10-18 04:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bonds', '0005_auto_20261018_0436'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LEIRecord',
+            fields=[
+                ('lei', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('legal_name', models.CharField(max_length=500)),
+                ('entity_status', models.CharField(blank=True, max_length=20)),
+                ('last_update', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
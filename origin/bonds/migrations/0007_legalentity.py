@@ -0,0 +1,84 @@
+# Generated by Django 2.2.13 on 2026-10-18 05:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def create_legal_entities(apps, schema_editor):
+    """
+    Create a LegalEntity for every LEI referenced by a bond. Names already in the cache are
+    kept, otherwise the name is taken from the bonds (LEIs of pending bonds stay unresolved).
+    """
+    Bond = apps.get_model('bonds', 'Bond')
+    LegalEntity = apps.get_model('bonds', 'LegalEntity')
+    now = timezone.now()
+    names = dict(Bond.objects.exclude(legal_name='').values_list('lei', 'legal_name').distinct())
+    leis = set(Bond.objects.values_list('lei', flat=True).distinct())
+    existing = {entity.lei: entity for entity in LegalEntity.objects.filter(lei__in=leis)}
+
+    created, updated = [], []
+    for lei in leis:
+        name = names.get(lei)
+        if lei not in existing:
+            created.append(LegalEntity(lei=lei, legal_name=name, resolved_at=now if name else None))
+        elif existing[lei].legal_name is None and name:
+            existing[lei].legal_name = name
+            updated.append(existing[lei])
+    LegalEntity.objects.bulk_create(created, batch_size=500)
+    LegalEntity.objects.bulk_update(updated, ['legal_name'], batch_size=500)
+
+
+def restore_legal_names(apps, schema_editor):
+    Bond = apps.get_model('bonds', 'Bond')
+    LegalEntity = apps.get_model('bonds', 'LegalEntity')
+    for lei, legal_name in LegalEntity.objects.exclude(legal_name=None).values_list('lei', 'legal_name'):
+        Bond.objects.filter(lei=lei).update(legal_name=legal_name[:100])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bonds', '0006_leirecord'),
+    ]
+
+    operations = [
+        migrations.RenameModel('ResolvedLEI', 'LegalEntity'),
+        migrations.AlterField(
+            model_name='legalentity',
+            name='legal_name',
+            field=models.CharField(db_index=True, max_length=500, null=True),
+        ),
+        migrations.AlterField(
+            model_name='legalentity',
+            name='resolved_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(create_legal_entities, restore_legal_names),
+        migrations.RemoveIndex(
+            model_name='bond',
+            name='bonds_owner_legal_name_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='bond',
+            name='bonds_owner_lei_idx',
+        ),
+        migrations.RemoveField(
+            model_name='bond',
+            name='legal_name',
+        ),
+        migrations.RenameField(
+            model_name='bond',
+            old_name='lei',
+            new_name='legal_entity',
+        ),
+        migrations.AlterField(
+            model_name='bond',
+            name='legal_entity',
+            field=models.ForeignKey(db_column='lei', on_delete=django.db.models.deletion.PROTECT, related_name='bonds', to='bonds.LegalEntity'),
+        ),
+        migrations.AddIndex(
+            model_name='bond',
+            index=models.Index(fields=['owner', 'legal_entity'], name='bonds_owner_lei_idx'),
+        ),
+    ]
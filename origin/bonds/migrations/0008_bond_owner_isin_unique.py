@@ -0,0 +1,46 @@
+# Generated by Django 2.2.13 on 2026-10-18 05:01
+
+from django.db import migrations, models
+
+# Removed duplicates are copied to this table, which is left for the operator to inspect
+# (and drop) as reverting the migration does not bring them back
+DUPLICATES_TABLE = 'bonds_bond_duplicates_0008'
+
+
+def remove_duplicate_bonds(apps, schema_editor):
+    """
+    Keep only the latest bond of each (owner, ISIN), i.e. the one which was posted last.
+    The other bonds are copied to `DUPLICATES_TABLE` before being deleted.
+    """
+    Bond = apps.get_model('bonds', 'Bond')
+    table = schema_editor.quote_name(Bond._meta.db_table)
+    duplicates = 'SELECT * FROM %s WHERE id NOT IN (SELECT MAX(id) FROM %s GROUP BY owner_id, isin)' % (table, table)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT id FROM (%s) ORDER BY id' % duplicates)
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return
+        backup = schema_editor.quote_name(DUPLICATES_TABLE)
+        cursor.execute('CREATE TABLE IF NOT EXISTS %s AS %s LIMIT 0' % (backup, duplicates))
+        cursor.execute('INSERT INTO %s %s' % (backup, duplicates))
+        cursor.execute('DELETE FROM %s WHERE id IN (SELECT id FROM %s)' % (table, backup))
+    print("\n  Removed %d duplicate bond(s) (ids %s), copied to table %s."
+          % (len(ids), ", ".join(map(str, ids)), DUPLICATES_TABLE))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bonds', '0007_legalentity'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_bonds, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='bond',
+            name='bonds_owner_isin_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='bond',
+            constraint=models.UniqueConstraint(fields=('owner', 'isin'), name='bonds_owner_isin_unique'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 2.2.13 on 2026-10-18 05:11
+
+from django.db import migrations
+from bonds import search
+
+# An external content FTS5 table over the legal names of LegalEntity (see bonds/search.py),
+# kept in sync by triggers, as described in https://www.sqlite.org/fts5.html#external_content_tables
+CREATE_INDEX = [
+    """
+    CREATE VIRTUAL TABLE bonds_legalentity_fts USING fts5(
+        legal_name, content='bonds_legalentity', content_rowid='rowid', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER bonds_legalentity_fts_insert AFTER INSERT ON bonds_legalentity BEGIN
+        INSERT INTO bonds_legalentity_fts (rowid, legal_name) VALUES (new.rowid, new.legal_name);
+    END
+    """,
+    """
+    CREATE TRIGGER bonds_legalentity_fts_delete AFTER DELETE ON bonds_legalentity BEGIN
+        INSERT INTO bonds_legalentity_fts (bonds_legalentity_fts, rowid, legal_name)
+        VALUES ('delete', old.rowid, old.legal_name);
+    END
+    """,
+    """
+    CREATE TRIGGER bonds_legalentity_fts_update AFTER UPDATE OF legal_name ON bonds_legalentity BEGIN
+        INSERT INTO bonds_legalentity_fts (bonds_legalentity_fts, rowid, legal_name)
+        VALUES ('delete', old.rowid, old.legal_name);
+        INSERT INTO bonds_legalentity_fts (rowid, legal_name) VALUES (new.rowid, new.legal_name);
+    END
+    """,
+    # Index the existing legal names
+    "INSERT INTO bonds_legalentity_fts (bonds_legalentity_fts) VALUES ('rebuild')",
+]
+
+DROP_INDEX = [
+    "DROP TRIGGER bonds_legalentity_fts_update",
+    "DROP TRIGGER bonds_legalentity_fts_delete",
+    "DROP TRIGGER bonds_legalentity_fts_insert",
+    "DROP TABLE bonds_legalentity_fts",
+]
+
+
+def check_sqlite_version(apps, schema_editor):
+    # The trigram tokenizer needs SQLite 3.34, so fail with a clear error on older versions
+    search.check_sqlite_version(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bonds', '0009_bookversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_sqlite_version, migrations.RunPython.noop),
+        migrations.RunSQL(CREATE_INDEX, DROP_INDEX),
+    ]
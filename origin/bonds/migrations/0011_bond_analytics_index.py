@@ -0,0 +1,21 @@
+# Generated by Django 2.2.13 on 2026-10-18 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bonds', '0010_legalentity_fts'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='bond',
+            name='bonds_owner_maturity_idx',
+        ),
+        migrations.AddIndex(
+            model_name='bond',
+            index=models.Index(fields=['owner', 'maturity', 'currency', 'legal_entity', 'size'], name='bonds_owner_maturity_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.13 on 2026-10-18 05:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Reads of live and archived bonds together (CombinedBond). Conditions on the view, such as
+# the owner, are pushed down into both halves of the union, so each uses its table's indexes.
+CREATE_VIEW = """
+    CREATE VIEW bonds_combinedbond AS
+    SELECT id, isin, size, currency, maturity, lei, owner_id, enrichment_status FROM bonds_bond
+    UNION ALL
+    SELECT id, isin, size, currency, maturity, lei, owner_id, enrichment_status FROM bonds_archivedbond
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('bonds', '0011_bond_analytics_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CombinedBond',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('isin', models.CharField(max_length=12)),
+                ('size', models.PositiveIntegerField()),
+                ('currency', models.CharField(max_length=10)),
+                ('maturity', models.DateField()),
+                ('enrichment_status', models.CharField(choices=[('pending', 'Pending'), ('resolved', 'Resolved'), ('failed', 'Failed')], max_length=10)),
+            ],
+            options={
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedBond',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('isin', models.CharField(max_length=12)),
+                ('size', models.PositiveIntegerField()),
+                ('currency', models.CharField(max_length=10)),
+                ('maturity', models.DateField()),
+                ('enrichment_status', models.CharField(choices=[('pending', 'Pending'), ('resolved', 'Resolved'), ('failed', 'Failed')], default='resolved', max_length=10)),
+                ('archived_at', models.DateTimeField()),
+                ('legal_entity', models.ForeignKey(db_column='lei', on_delete=django.db.models.deletion.PROTECT, related_name='archived_bonds', to='bonds.LegalEntity')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bonds', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunSQL(CREATE_VIEW, "DROP VIEW bonds_combinedbond"),
+    ]
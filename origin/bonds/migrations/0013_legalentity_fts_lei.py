@@ -0,0 +1,62 @@
+# Generated by Django 2.2.13 on 2026-10-18 07:20
+
+from importlib import import_module
+from django.db import migrations
+
+# The FTS5 table of migration 0010 referred to the rowids of LegalEntity, which a VACUUM may
+# renumber. This one stores the LEI of each legal name instead. `bonds_legalentity_fts_docid`
+# maps LEIs to the rowids of the FTS5 table (which are stable), so that the triggers update
+# and delete index entries by rowid rather than by scanning the table for a LEI.
+CREATE_INDEX = [
+    """
+    CREATE VIRTUAL TABLE bonds_legalentity_fts USING fts5(lei UNINDEXED, legal_name, tokenize='trigram')
+    """,
+    """
+    CREATE TABLE bonds_legalentity_fts_docid (lei varchar(20) PRIMARY KEY, docid integer NOT NULL) WITHOUT ROWID
+    """,
+    """
+    CREATE TRIGGER bonds_legalentity_fts_insert AFTER INSERT ON bonds_legalentity BEGIN
+        INSERT INTO bonds_legalentity_fts (lei, legal_name) VALUES (new.lei, new.legal_name);
+        INSERT INTO bonds_legalentity_fts_docid (lei, docid) VALUES (new.lei, last_insert_rowid());
+    END
+    """,
+    """
+    CREATE TRIGGER bonds_legalentity_fts_delete AFTER DELETE ON bonds_legalentity BEGIN
+        DELETE FROM bonds_legalentity_fts
+        WHERE rowid = (SELECT docid FROM bonds_legalentity_fts_docid WHERE lei = old.lei);
+        DELETE FROM bonds_legalentity_fts_docid WHERE lei = old.lei;
+    END
+    """,
+    """
+    CREATE TRIGGER bonds_legalentity_fts_update AFTER UPDATE OF legal_name ON bonds_legalentity
+    WHEN old.legal_name IS NOT new.legal_name BEGIN
+        UPDATE bonds_legalentity_fts SET legal_name = new.legal_name
+        WHERE rowid = (SELECT docid FROM bonds_legalentity_fts_docid WHERE lei = new.lei);
+    END
+    """,
+    # Index the existing legal names (through the insert trigger's statements)
+    "INSERT INTO bonds_legalentity_fts (lei, legal_name) SELECT lei, legal_name FROM bonds_legalentity",
+    "INSERT INTO bonds_legalentity_fts_docid (lei, docid) SELECT lei, rowid FROM bonds_legalentity_fts",
+]
+
+DROP_INDEX = [
+    "DROP TRIGGER bonds_legalentity_fts_update",
+    "DROP TRIGGER bonds_legalentity_fts_delete",
+    "DROP TRIGGER bonds_legalentity_fts_insert",
+    "DROP TABLE bonds_legalentity_fts_docid",
+    "DROP TABLE bonds_legalentity_fts",
+]
+
+previous = import_module('bonds.migrations.0010_legalentity_fts')
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bonds', '0012_archivedbond'),
+    ]
+
+    operations = [
+        migrations.RunPython(previous.check_sqlite_version, migrations.RunPython.noop),
+        migrations.RunSQL(previous.DROP_INDEX, previous.CREATE_INDEX),
+        migrations.RunSQL(CREATE_INDEX, DROP_INDEX),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.13 on 2026-10-18 06:23
+
+from importlib import import_module
+from django.db import migrations, models
+
+# Adding a field remakes the table on SQLite, which drops its triggers, so the search index
+# (see migration 0013) is dropped beforehand and created again afterwards
+search_index = import_module('bonds.migrations.0013_legalentity_fts_lei')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bonds', '0013_legalentity_fts_lei'),
+    ]
+
+    operations = [
+        migrations.RunSQL(search_index.DROP_INDEX, search_index.CREATE_INDEX),
+        migrations.AddField(
+            model_name='legalentity',
+            name='invalid_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunSQL(search_index.CREATE_INDEX, search_index.DROP_INDEX),
+    ]
@@ -12,8 +12,135 @@ class Bond(models.Model):
     size = models.PositiveIntegerField()
     currency = models.CharField(max_length=10)
     maturity = models.DateField()
+    # The issuer, which holds the legal name. The column is still called `lei`, as it stores the LEI.
+    legal_entity = models.ForeignKey('LegalEntity', db_column='lei', related_name='bonds', on_delete=models.PROTECT)
+    # When the corresponding user is deleted, remove all their corresponding bonds as well 
+    owner = models.ForeignKey('auth.User', related_name='bonds', on_delete=models.CASCADE)
+
+    PENDING = 'pending'
+    RESOLVED = 'resolved'
+    FAILED = 'failed'
+    ENRICHMENT_STATUSES = [(PENDING, 'Pending'), (RESOLVED, 'Resolved'), (FAILED, 'Failed')]
+    enrichment_status = models.CharField(max_length=10, choices=ENRICHMENT_STATUSES, default=RESOLVED)
+
+    class Meta:
+        # An owner holds each ISIN once, so that re-sending the same bonds cannot duplicate them.
+        # The index of the constraint also serves the ISIN filter.
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'isin'], name='bonds_owner_isin_unique'),
+        ]
+        # Bonds are always queried by owner, usually along with one of the filters of
+        # `BondsList.get`. Filters without an index of their own use the owner index.
+        indexes = [
+            models.Index(fields=['owner', 'currency'], name='bonds_owner_currency_idx'),
+            # Also covers the columns of the analytics (see bonds/analytics.py), in the order
+            # they are grouped by, so that they are computed from the index alone
+            models.Index(fields=['owner', 'maturity', 'currency', 'legal_entity', 'size'],
+                         name='bonds_owner_maturity_idx'),
+            # The legal name filter joins LegalEntity, which has its own index on legal_name
+            models.Index(fields=['owner', 'legal_entity'], name='bonds_owner_lei_idx'),
+        ]
+
+    @property
+    def lei(self):
+        return self.legal_entity_id
+
+    @lei.setter
+    def lei(self, lei):
+        self.legal_entity_id = lei
+
+    @property
+    def legal_name(self):
+        """
+        The legal name of the issuer, or an empty string until it has been resolved.
+        """
+        if self.legal_entity_id is None:
+            return ''
+        return self.legal_entity.legal_name or ''
+
+    @legal_name.setter
+    def legal_name(self, legal_name):
+        # Only sets the name in memory (e.g. for `Bond(lei=..., legal_name=...)`). Issuers are
+        # renamed by updating their LegalEntity, which applies to all of their bonds at once.
+        self.legal_entity = LegalEntity(lei=self.legal_entity_id, legal_name=legal_name)
+
+class ArchivedBond(models.Model):
+    """
+    A matured bond, moved out of the `Bond` table by the `archive_matured_bonds` command (see
+    bonds/archive.py). Archived bonds keep the id they had as bonds, which SQLite never reuses.
+    """
+    id = models.IntegerField(primary_key=True)
+    isin = models.CharField(max_length=12)
+    size = models.PositiveIntegerField()
+    currency = models.CharField(max_length=10)
+    maturity = models.DateField()
+    legal_entity = models.ForeignKey('LegalEntity', db_column='lei', related_name='archived_bonds',
+                                     on_delete=models.PROTECT)
+    owner = models.ForeignKey('auth.User', related_name='archived_bonds', on_delete=models.CASCADE)
+    enrichment_status = models.CharField(max_length=10, choices=Bond.ENRICHMENT_STATUSES, default=Bond.RESOLVED)
+    archived_at = models.DateTimeField()
+
+class CombinedBond(models.Model):
+    """
+    A live or archived bond. Reads the `bonds_combinedbond` view (see migration 0012), which
+    is the union of both tables, for `GET /bonds/?include_matured=true`.
+    """
+    isin = models.CharField(max_length=12)
+    size = models.PositiveIntegerField()
+    currency = models.CharField(max_length=10)
+    maturity = models.DateField()
+    legal_entity = models.ForeignKey('LegalEntity', db_column='lei', related_name='+', on_delete=models.DO_NOTHING)
+    owner = models.ForeignKey('auth.User', related_name='+', on_delete=models.DO_NOTHING)
+    enrichment_status = models.CharField(max_length=10, choices=Bond.ENRICHMENT_STATUSES)
+
+    class Meta:
+        managed = False
+
+class LegalEntity(models.Model):
+    """
+    The issuer of bonds, identified by its LEI. Also acts as the persistent tier of the legal
+    name cache (see bonds/cache.py).
+    """
     # LEIs are 20-character long (https://en.wikipedia.org/wiki/Legal_Entity_Identifier)
+    lei = models.CharField(max_length=20, primary_key=True)
+    # A null legal name records that the LEI is invalid or does not exist (or is not resolved yet)
+    legal_name = models.CharField(max_length=500, null=True, db_index=True)
+    # Null until the LEI has been resolved, e.g. while the bonds of the issuer are being enriched
+    resolved_at = models.DateTimeField(null=True)
+    # When GLEIF last reported the LEI as invalid, although it had a legal name before. The last
+    # known name is kept for the issuer's bonds, while new lookups treat the LEI as invalid.
+    invalid_at = models.DateTimeField(null=True, blank=True)
+
+class EnrichmentJob(models.Model):
+    """
+    A pending lookup of the legal name of a bond, processed by the `enrich_bonds` command.
+    """
+    bond = models.OneToOneField(Bond, related_name='enrichment_job', on_delete=models.CASCADE)
     lei = models.CharField(max_length=20)
-    legal_name = models.CharField(max_length=100)
-    # When the corresponding user is deleted, remove all their corresponding bonds as well 
-    owner = models.ForeignKey('auth.User', related_name='bonds', on_delete=models.CASCADE)
\ No newline at end of file
+    attempts = models.PositiveIntegerField(default=0)
+    # The job is due once this time has passed. It is also pushed back while a worker holds the job.
+    next_attempt_at = models.DateTimeField(db_index=True)
+    # Identifies the worker which currently holds the job
+    claim_token = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+
+class LEIRecord(models.Model):
+    """
+    A LEI record imported from a GLEIF golden copy file by the `import_lei_records` command.
+    Lets LEIs be resolved locally, without calling the GLEIF API.
+    """
+    lei = models.CharField(max_length=20, primary_key=True)
+    # The legal name as published by GLEIF (i.e. including whitespace)
+    legal_name = models.CharField(max_length=500)
+    entity_status = models.CharField(max_length=20, blank=True)
+    # When GLEIF last updated the record. Re-imports only overwrite records with a newer date.
+    last_update = models.DateTimeField(null=True)
+
+class BookVersion(models.Model):
+    """
+    A counter of the changes to a user's bonds (their book), bumped on every write which changes
+    the output of GET /bonds/. Lets GET /bonds/ answer conditional requests (see bonds/versions.py).
+    """
+    owner = models.OneToOneField('auth.User', primary_key=True, related_name='book_version', on_delete=models.CASCADE)
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField()
@@ -0,0 +1,29 @@
+"""
+Defines pagination for the bonds API.
+"""
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+class BondCursorPagination(CursorPagination):
+    """
+    Keyset pagination over bonds, ordered by `id`. As `id` is unique, each page is fetched with
+    `WHERE id > <last id seen> ... LIMIT <page size>`, so deep pages cost the same as the first.
+    Cursors are opaque, base64-encoded tokens.
+    """
+    ordering = 'id'
+    page_size = settings.BONDS_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.BONDS_MAX_PAGE_SIZE
+
+    def is_requested(self, request):
+        """
+        Pagination is opt-in, so that `GET /bonds/` keeps returning a plain list by default.
+        """
+        return self.cursor_query_param in request.query_params or \
+            self.page_size_query_param in request.query_params
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        # A position is enough to locate a page when ordering by a unique field, so never
+        # honour an offset (which would turn into an OFFSET clause) from a crafted cursor.
+        return cursor and cursor._replace(offset=0)
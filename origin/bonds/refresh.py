@@ -0,0 +1,85 @@
+"""
+Defines the refresh of the legal names of issuers, which go stale after mergers and renames.
+
+Names are stored once per issuer on `LegalEntity`, whose `resolved_at` records when each LEI
+was last resolved. A refresh looks up the stalest LEIs first, in multi-LEI GLEIF requests made
+at a limited rate, and writes each batch in its own short transaction which only touches
+`LegalEntity` rows, so reads of bonds are not held up. Only the LEIs which GLEIF returned
+stop being stale, so an interrupted refresh resumes where it stopped when it is run again,
+and LEIs missing from GLEIF are looked up again by the next refresh.
+"""
+import time
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from . import gleif
+from .cache import legal_name_cache
+from .models import Bond, LegalEntity
+
+class RateLimiter:
+    """
+    Spaces out calls to `wait` so that they happen at most `rate` times per second.
+    """
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+
+    def wait(self):
+        now = time.monotonic()
+        if now < self._next:
+            time.sleep(self._next - now)
+            now = self._next
+        self._next = now + self.interval
+
+def stale_entities(max_age, now=None):
+    """
+    Return the issuers of bonds whose legal names were resolved more than `max_age` seconds ago,
+    stalest first. Invalid and unresolved LEIs are left to the cache and the enrichment workers.
+    """
+    cutoff = (now or timezone.now()) - timedelta(seconds=max_age)
+    return LegalEntity.objects.filter(
+        resolved_at__lt=cutoff, legal_name__isnull=False, lei__in=Bond.objects.values('legal_entity'),
+    ).order_by('resolved_at', 'lei')
+
+def refresh_legal_names(max_age, batch_size, rate, progress=None):
+    """
+    Look up the stale legal names again, `batch_size` LEIs per GLEIF request and at most `rate`
+    requests per second. `progress` is called with the counts after each batch is written.
+    Returns counts of refreshed LEIs, of renamed issuers and of LEIs missing from GLEIF
+    (whose names are kept, and which stay stale). Raises `GleifUnavailableError` if GLEIF
+    cannot be reached, or keeps failing (e.g. rate limits the requests).
+    """
+    counts = {'refreshed': 0, 'renamed': 0, 'missing': 0}
+    limiter = RateLimiter(rate)
+    # Fixing the cutoff ensures the refresh ends, as each refreshed LEI gets a newer `resolved_at`
+    stale = stale_entities(max_age)
+    # LEIs which stay stale are skipped by walking the (resolved_at, lei) order of `stale`
+    after = Q()
+    while True:
+        rows = list(stale.filter(after).values_list('lei', 'legal_name', 'resolved_at')[:batch_size])
+        if not rows:
+            return counts
+        batch = {lei: legal_name for lei, legal_name, _ in rows}
+        limiter.wait()
+        apply_batch(batch, gleif.client.fetch_legal_names(list(batch), throttle=limiter.wait), counts)
+        last_lei, _, last_resolved_at = rows[-1]
+        after = Q(resolved_at__gt=last_resolved_at) | Q(resolved_at=last_resolved_at, lei__gt=last_lei)
+        if progress:
+            progress(counts)
+
+def apply_batch(batch, fetched, counts):
+    legal_names = {}
+    for lei, legal_name in batch.items():
+        if fetched.get(lei) is None:
+            # A LEI which GLEIF no longer returns keeps its name, rather than blanking its bonds.
+            # It is not refreshed either, so it stays stale until GLEIF confirms a name.
+            counts['missing'] += 1
+            continue
+        if fetched[lei] != legal_name:
+            counts['renamed'] += 1
+        legal_names[lei] = fetched[lei]
+    if legal_names:
+        with transaction.atomic():
+            legal_name_cache.set_many(legal_names)
+    counts['refreshed'] += len(legal_names)
@@ -0,0 +1,57 @@
+"""
+Defines renderers for the bond export formats. Besides `render`, which DRF uses for regular
+responses (e.g. errors), each renderer can encode an iterable of rows lazily with `render_rows`,
+for use in a streaming response.
+"""
+import csv
+import json
+from rest_framework.renderers import BaseRenderer
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Renders newline-delimited JSON, with one object per line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(self.render_rows(rows)).encode(self.charset)
+
+    def render_rows(self, rows, fields=None):
+        for row in rows:
+            yield json.dumps(row) + '\n'
+
+class Echo:
+    """
+    A file-like object which returns what is written to it, so that `csv.writer` can be
+    used to encode rows one at a time.
+    """
+    def write(self, value):
+        return value
+
+class CSVRenderer(BaseRenderer):
+    """
+    Renders CSV with a header row. Without explicit `fields`, the columns are taken from the first row.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = [data]
+        elif not isinstance(data, list):
+            data = [{'detail': data}]
+        return ''.join(self.render_rows(data)).encode(self.charset)
+
+    def render_rows(self, rows, fields=None):
+        writer = csv.writer(Echo())
+        if fields is not None:
+            yield writer.writerow(fields)
+        for row in rows:
+            if fields is None:
+                fields = list(row)
+                yield writer.writerow(fields)
+            yield writer.writerow([row.get(field) for field in fields])
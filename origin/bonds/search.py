@@ -0,0 +1,64 @@
+"""
+Defines the search of bonds by the legal name of their issuer (`GET /bonds/?search=`).
+
+Legal names are indexed by an SQLite FTS5 table with the trigram tokenizer (SQLite 3.34 or
+later), which stores the LEI of each name and is kept in sync with `LegalEntity` by triggers
+(see migration 0013). Nothing refers to the rowids of `LegalEntity`, which a VACUUM may
+renumber, so the index never needs rebuilding by hand. Legal names are stored without
+whitespace, so each term of a search is matched case-insensitively anywhere in the name
+(which includes prefixes and whole words), and a name matches if it contains every term.
+The matching issuers are found through the index, and their bonds through the (owner, lei)
+index of `Bond`, so neither table is scanned.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from .models import LegalEntity
+
+FTS_TABLE = 'bonds_legalentity_fts'
+
+# The first version of SQLite with the trigram tokenizer
+MIN_SQLITE_VERSION = (3, 34, 0)
+
+# The trigram tokenizer cannot match shorter terms
+MIN_TERM_LENGTH = 3
+
+class InvalidSearchError(ValueError):
+    """
+    Raised when a search query cannot be searched, with a message which says why.
+    """
+    pass
+
+def check_sqlite_version(connection):
+    """
+    Raise an ImproperlyConfigured error if the SQLite library of `connection` is too old for the index.
+    """
+    version = connection.Database.sqlite_version_info
+    if version < MIN_SQLITE_VERSION:
+        raise ImproperlyConfigured(
+            "Searching legal names needs SQLite %s or later, with FTS5 (for its trigram tokenizer), "
+            "but SQLite %s is installed." % ('.'.join(map(str, MIN_SQLITE_VERSION)), '.'.join(map(str, version))))
+
+def match_expression(query):
+    """
+    Return the FTS5 query which matches the legal names containing every term of `query`.
+    Raises an InvalidSearchError if `query` has no terms, or a term which is too short to be searched.
+    """
+    terms = query.split()
+    if not terms:
+        raise InvalidSearchError("The search query is empty.")
+    if any(len(term) < MIN_TERM_LENGTH for term in terms):
+        raise InvalidSearchError("Search terms must be at least %d characters long." % MIN_TERM_LENGTH)
+    # Quoted terms are matched as strings, so FTS5 operators in the query have no effect
+    return ' '.join('"%s"' % term.replace('"', '""') for term in terms)
+
+def matching_leis(query):
+    """
+    Return a subquery selecting the LEIs of the issuers whose legal name matches `query`.
+    """
+    # A RawSQL subquery would be wrapped in a second pair of parentheses by `__in`, which
+    # SQLite reads as a scalar subquery (i.e. only its first row). `lei` is unqualified, as
+    # the table is aliased within subqueries.
+    entities = LegalEntity.objects.extra(
+        where=['lei IN (SELECT lei FROM %s WHERE %s MATCH %%s)' % (FTS_TABLE, FTS_TABLE)],
+        params=[match_expression(query)],
+    )
+    return entities.values('pk')
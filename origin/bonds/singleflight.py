@@ -0,0 +1,78 @@
+"""
+Defines the coalescing of concurrent identical calls within a process ("single flight").
+
+While a call for a key is in flight, other threads asking for the same key wait for it and
+share its outcome (its result, or the exception it raised) instead of making their own call.
+Once the call is over, the next call for the key is made afresh, so nothing is cached here.
+"""
+import threading
+
+class Call:
+    """
+    A call in flight, which waiting threads share the outcome of.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def outcome(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls by key. `counter` (a metric) counts the calls which waited for another.
+    """
+    def __init__(self, counter=None):
+        self.counter = counter
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function):
+        """
+        Return `function()`, or the outcome of the call already in flight for `key`.
+        """
+        return self.do_many([key], lambda keys: {key: function()})[key]
+
+    def do_many(self, keys, function):
+        """
+        Return a dict of the results for `keys`. Keys with a call in flight get the outcome of
+        that call, and `function` is called with the list of the other keys, for which it must
+        return a dict of results (e.g. to look them up with a single request).
+        """
+        led, waited = {}, {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                if key in self._calls:
+                    waited[key] = self._calls[key]
+                else:
+                    led[key] = self._calls[key] = Call()
+        if waited and self.counter is not None:
+            self.counter.inc(len(waited))
+
+        results = {}
+        if led:
+            try:
+                results = function(list(led))
+            except BaseException as e:
+                for call in led.values():
+                    call.error = e
+                raise
+            else:
+                for key, call in led.items():
+                    call.result = results[key]
+            finally:
+                # Later calls start afresh, while the waiting threads get this outcome
+                with self._lock:
+                    for key in led:
+                        del self._calls[key]
+                for call in led.values():
+                    call.done.set()
+        # The calls of other threads are only waited for once ours are done, so that two
+        # threads waiting for each other's keys cannot deadlock
+        for key, call in waited.items():
+            results[key] = call.outcome()
+        return results
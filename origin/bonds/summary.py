@@ -0,0 +1,54 @@
+"""
+Defines the portfolio summaries served by `/bonds/summary/`, computed in SQL.
+"""
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Func, Sum, Value
+from django.db.models.functions import Coalesce, ExtractQuarter, ExtractYear, Greatest
+
+# The dimensions bonds can be grouped by, mapped to the expressions they are computed from
+# (or to `None` for plain columns)
+GROUP_BY_DIMENSIONS = {
+    'currency': None,
+    # Unresolved LEIs have no legal name, which is reported as an empty string as in GET /bonds/
+    'legal_name': Coalesce('legal_entity__legal_name', Value('')),
+    'lei': F('legal_entity'),
+    'maturity_year': ExtractYear('maturity'),
+    'maturity_quarter': ExtractQuarter('maturity'),
+}
+
+DAYS_PER_YEAR = 365.25
+
+class JulianDay(Func):
+    """
+    The (fractional) Julian day number of a date, as computed by SQLite's `julianday`.
+    """
+    function = 'julianday'
+    output_field = FloatField()
+
+def julian_day(day):
+    return day.toordinal() + 1721424.5
+
+def summarize(bonds, group_by, today):
+    """
+    Return the number of bonds, their total size and their size-weighted average time to
+    maturity (in years, counting matured bonds as zero) for each group of `bonds`.
+    """
+    days_to_maturity = Greatest(JulianDay('maturity') - Value(julian_day(today)), Value(0.0))
+    size_days = ExpressionWrapper(F('size') * days_to_maturity, output_field=FloatField())
+    metrics = {'count': Count('id'), 'total_size': Sum('size'), 'size_days': Sum(size_days)}
+
+    if group_by:
+        computed = {dimension: GROUP_BY_DIMENSIONS[dimension] for dimension in group_by
+                    if GROUP_BY_DIMENSIONS[dimension] is not None}
+        groups = bonds.annotate(**computed).values(*group_by).annotate(**metrics).order_by(*group_by)
+    else:
+        groups = [bonds.aggregate(**metrics)]
+
+    summary = []
+    for group in groups:
+        size_days = group.pop('size_days')
+        total_size = group['total_size'] or 0
+        group['total_size'] = total_size
+        group['weighted_average_years_to_maturity'] = \
+            size_days / total_size / DAYS_PER_YEAR if total_size else None
+        summary.append(group)
+    return summary
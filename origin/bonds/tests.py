@@ -1,14 +1,50 @@
 """
 Tests for the `bonds` application.
 """
-from rest_framework.test import APITestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
+import base64
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from urllib.parse import parse_qs, urlparse
+from unittest import mock
 import requests
 import responses
-from bonds.models import Bond
+from bonds.benchmark import GleifStub, mixed_workload, run_benchmark
+from bonds.cache import legal_name_cache, LRUCache, MISSING
+from bonds.enrichment import backoff_delay, EnrichmentWorker
+from bonds.models import ArchivedBond, Bond, CombinedBond, EnrichmentJob, LegalEntity, LEIRecord
+from bonds.pagination import BondCursorPagination
+from bonds.refresh import RateLimiter, stale_entities
 from bonds.serializers import BondSerializer, UserSerializer
-from bonds.views import GLEIF_API_ENDPOINT
+from bonds.upsert import upsert_sql, UPSERT_FIELDS
+from bonds import authentication, db, gleif, metrics, search, versions
+from bonds.analytics import analyze, load_book
+from bonds.authentication import issue_token
+from bonds.middleware import MetricsMiddleware
+from bonds.gleif import CircuitBreaker, CircuitOpenError, GleifClient, GleifUnavailableError
+from bonds.views import BondsList, GLEIF_API_ENDPOINT
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command, CommandError
+from django.db import connection, connections
+from django.db.models import ProtectedError
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.contrib.auth.models import User
+from django.utils import timezone
+from datetime import date, datetime, timedelta
 from rest_framework.test import force_authenticate
 
 class RoutingTest(APITestCase):
@@ -51,6 +87,8 @@ class GetAndPostTest(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='testuser', password='testpass')
         self.client.login(username='testuser', password='testpass')
+        legal_name_cache.clear()
+        gleif.client.breaker.reset()
 
     def test_return_empty_list_if_no_bonds(self):
         resp = self.client.get("/bonds/")
@@ -110,7 +148,8 @@ class GetAndPostTest(APITestCase):
         responses.add(responses.GET, GLEIF_API_ENDPOINT, json=MOCK_GLEIF_RESPONSE, status=200)
         responses.add(responses.GET, GLEIF_API_ENDPOINT, json=MOCK_GLEIF_RESPONSE, status=200)
         self.client.post("/bonds/", MOCK_POST_DATA, format='json')
-        self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+        # A user holds each ISIN at most once
+        self.client.post("/bonds/", dict(MOCK_POST_DATA, isin="FR0000000001"), format='json')
         resp = self.client.get("/bonds/")
         self.assertEqual(len(resp.json()), 2)
     
@@ -132,6 +171,7 @@ class GetAndPostTest(APITestCase):
         self.client.post("/bonds/", MOCK_POST_DATA, format='json')
         EDITED_POST_DATA = MOCK_POST_DATA.copy()
         EDITED_POST_DATA["currency"] = "USD"
+        EDITED_POST_DATA["isin"] = "US0000000001"
         self.client.post("/bonds/", EDITED_POST_DATA, format='json')
         resp = self.client.get("/bonds/?currency=USD")
         # Only show the bond with USD currency
@@ -145,6 +185,1852 @@ class GetAndPostTest(APITestCase):
         resp = self.client.get("/bonds/?size=foobar")
         self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
 
+class LegalNameCacheTest(APITestCase):
+    """
+    Tests for the LEI -> legal name cache defined in bonds/cache.py.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        legal_name_cache.clear()
+        gleif.client.breaker.reset()
+
+    @responses.activate
+    def test_repeated_lei_skips_the_network(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=MOCK_GLEIF_RESPONSE, status=200)
+        self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+        resp = self.client.post("/bonds/", dict(MOCK_POST_DATA, isin="FR0000000001"), format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.json()["legal_name"], "MOCKBANK")
+        self.assertEqual(len(responses.calls), 1)
+        self.assertEqual(legal_name_cache.stats()["memory_hits"], 1)
+        self.assertEqual(legal_name_cache.stats()["misses"], 1)
+
+    @responses.activate
+    def test_invalid_lei_is_cached(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=[], status=200)
+        self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+        resp = self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(responses.calls), 1)
+        self.assertIsNone(LegalEntity.objects.get(lei=MOCK_POST_DATA["lei"]).legal_name)
+
+    @responses.activate
+    def test_failed_gleif_request_is_not_cached(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, body=requests.exceptions.ConnectionError('...'))
+        self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+        self.assertFalse(LegalEntity.objects.exists())
+
+    @responses.activate
+    def test_database_tier_survives_process_restart(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=MOCK_GLEIF_RESPONSE, status=200)
+        self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+        # Emptying the in-process tier simulates a fresh worker process
+        legal_name_cache.clear()
+        gleif.client.breaker.reset()
+        self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+        self.assertEqual(len(responses.calls), 1)
+        self.assertEqual(legal_name_cache.stats()["database_hits"], 1)
+
+    @responses.activate
+    def test_expired_entries_are_fetched_again(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=MOCK_GLEIF_RESPONSE, status=200)
+        self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+        legal_name_cache.clear()
+        gleif.client.breaker.reset()
+        stale = timezone.now() - timedelta(seconds=legal_name_cache.ttl + 1)
+        LegalEntity.objects.update(resolved_at=stale)
+        self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_invalid_lookup_keeps_the_name_of_a_known_issuer(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=MOCK_GLEIF_RESPONSE, status=200)
+        self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+        legal_name_cache.clear()
+        LegalEntity.objects.update(resolved_at=timezone.now() - timedelta(seconds=legal_name_cache.ttl + 1))
+        for body in [dict(status=429, headers={"Retry-After": "0"}), dict(json=[], status=200)]:
+            responses.replace(responses.GET, GLEIF_API_ENDPOINT, **body)
+            resp = self.client.post("/bonds/", dict(MOCK_POST_DATA, isin="FR0000000001"), format='json')
+            self.assertIn(resp.status_code, [status.HTTP_503_SERVICE_UNAVAILABLE, status.HTTP_400_BAD_REQUEST])
+            gleif.client.breaker.reset()
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get("/bonds/").json()[0]["legal_name"], "MOCKBANK")
+        entity = LegalEntity.objects.get()
+        self.assertEqual(entity.legal_name, "MOCKBANK")
+        self.assertIsNotNone(entity.invalid_at)
+
+        # The negative result is cached in the database tier too
+        legal_name_cache.clear()
+        calls = len(responses.calls)
+        resp = self.client.post("/bonds/", dict(MOCK_POST_DATA, isin="FR0000000001"), format='json')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(responses.calls), calls)
+
+        # Once GLEIF resolves the LEI again, it is valid again
+        legal_name_cache.set(MOCK_POST_DATA["lei"], "MOCKBANK")
+        self.assertIsNone(LegalEntity.objects.get().invalid_at)
+
+    def test_negative_entries_use_the_shorter_ttl(self):
+        legal_name_cache.set("AAAAAAAAAAAAAAAAAAAA", None)
+        legal_name_cache.clear()
+        gleif.client.breaker.reset()
+        stale = timezone.now() - timedelta(seconds=legal_name_cache.negative_ttl + 1)
+        LegalEntity.objects.update(resolved_at=stale)
+        self.assertIs(legal_name_cache.get("AAAAAAAAAAAAAAAAAAAA"), MISSING)
+
+    def test_many_leis_are_read_from_the_database_at_once(self):
+        leis = ["%020d" % i for i in range(200)]
+        create_legal_entities({lei: "MOCKBANK" for lei in leis})
+        legal_name_cache.set(leis[0], "MOCKBANK")
+        with CaptureQueriesContext(connection) as queries:
+            legal_names = legal_name_cache.get_many(leis + ["AAAAAAAAAAAAAAAAAAAA"])
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([legal_names[lei] for lei in leis], ["MOCKBANK"] * 200)
+        self.assertIs(legal_names["AAAAAAAAAAAAAAAAAAAA"], MISSING)
+        self.assertEqual(legal_name_cache.stats(), dict(memory_hits=1, database_hits=199, misses=1, memory_size=200))
+
+    @responses.activate
+    def test_bulk_post_resolves_cached_leis_with_a_few_queries(self):
+        leis = ["%020d" % i for i in range(200)]
+        create_legal_entities({lei: "MOCKBANK" for lei in leis})
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.post("/bonds/", mock_bulk_rows(200, leis), format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertLess(len(queries), 20)
+        self.assertEqual(len(responses.calls), 0)
+
+    def test_lru_evicts_least_recently_used_entries(self):
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIs(cache.get("b"), MISSING)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_lru_entries_expire(self):
+        cache = LRUCache(max_size=2, ttl=0)
+        cache.set("a", 1)
+        self.assertIs(cache.get("a"), MISSING)
+
+    def test_stats_are_only_visible_to_admins(self):
+        resp = self.client.get("/bonds/cache/")
+        self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
+        User.objects.create_superuser(username='admin', password='adminpass', email='admin@example.com')
+        self.client.login(username='admin', password='adminpass')
+        resp = self.client.get("/bonds/cache/")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(resp.json().keys()), set(['memory_hits', 'database_hits', 'misses', 'memory_size']))
+
+MOCK_LEIS = ["R0MUWSFPU8MPRO8K5P83", "549300GKFG0RYRRQ1414"]
+
+def mock_gleif_record(lei, legal_name):
+    return {"LEI": {"$": lei}, "Entity": {"LegalName": {"$": legal_name}}}
+
+def mock_bulk_rows(count, leis=MOCK_LEIS):
+    rows = []
+    for i in range(count):
+        row = MOCK_POST_DATA.copy()
+        row["isin"] = "FR%010d" % i
+        row["lei"] = leis[i % len(leis)]
+        rows.append(row)
+    return rows
+
+class BulkPostTest(APITestCase):
+    """
+    Tests for the bulk ingestion mode of POST /bonds/.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        legal_name_cache.clear()
+        gleif.client.breaker.reset()
+
+    def add_gleif_batch_response(self):
+        records = [mock_gleif_record(MOCK_LEIS[0], "MOCK BANK"), mock_gleif_record(MOCK_LEIS[1], "OTHER BANK")]
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=records, status=200)
+
+    @responses.activate
+    def test_json_array_creates_all_bonds(self):
+        self.add_gleif_batch_response()
+        resp = self.client.post("/bonds/", mock_bulk_rows(10), format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.json()["created"], 10)
+        self.assertEqual(Bond.objects.count(), 10)
+        self.assertEqual(Bond.objects.filter(legal_entity__legal_name="OTHERBANK").count(), 5)
+
+    @responses.activate
+    def test_ndjson_body_creates_all_bonds(self):
+        self.add_gleif_batch_response()
+        body = "\n".join(json.dumps(row) for row in mock_bulk_rows(4)) + "\n"
+        resp = self.client.post("/bonds/", body, content_type='application/x-ndjson')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Bond.objects.count(), 4)
+
+    def test_malformed_ndjson_returns_400(self):
+        resp = self.client.post("/bonds/", '{"isin": "FR0000131104"}\n{not json', content_type='application/x-ndjson')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Bond.objects.count(), 0)
+
+    @responses.activate
+    def test_distinct_leis_are_resolved_in_one_request(self):
+        self.add_gleif_batch_response()
+        self.client.post("/bonds/", mock_bulk_rows(50), format='json')
+        self.assertEqual(len(responses.calls), 1)
+        self.assertIn(",".join(sorted(MOCK_LEIS)), responses.calls[0].request.url)
+
+    @responses.activate
+    def test_leis_are_split_into_batches(self):
+        self.add_gleif_batch_response()
+        self.add_gleif_batch_response()
+        with self.settings(GLEIF_BATCH_SIZE=1):
+            self.client.post("/bonds/", mock_bulk_rows(4), format='json')
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_cached_leis_skip_the_network(self):
+        legal_name_cache.set(MOCK_LEIS[0], "MOCKBANK")
+        legal_name_cache.set(MOCK_LEIS[1], "OTHERBANK")
+        resp = self.client.post("/bonds/", mock_bulk_rows(4), format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(responses.calls), 0)
+
+    @responses.activate
+    def test_invalid_rows_are_reported(self):
+        # Only the first LEI exists
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=[mock_gleif_record(MOCK_LEIS[0], "MOCK BANK")], status=200)
+        rows = mock_bulk_rows(2)
+        rows.append(dict(rows[0], maturity="2020-99-10"))
+        rows.append("foobar")
+        resp = self.client.post("/bonds/", rows, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([result["status"] for result in resp.json()["results"]], ["created", "invalid", "invalid", "invalid"])
+        self.assertIn("lei", resp.json()["results"][1]["errors"])
+        self.assertIn("maturity", resp.json()["results"][2]["errors"])
+        self.assertEqual(Bond.objects.count(), 1)
+
+    @responses.activate
+    def test_rejected_batch_falls_back_to_single_lookups(self):
+        # The batch is rejected, then "AAAA" and the valid LEI are looked up in (sorted) order
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json={'message': 'Invalid LEI'}, status=400)
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json={'message': 'Invalid LEI'}, status=400)
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=MOCK_GLEIF_RESPONSE, status=200)
+        resp = self.client.post("/bonds/", mock_bulk_rows(2, leis=["AAAA", MOCK_LEIS[0]]), format='json')
+        self.assertEqual(resp.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(Bond.objects.get().lei, MOCK_LEIS[0])
+
+    @responses.activate
+    def test_failed_gleif_request_returns_503(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, body=requests.exceptions.ConnectionError('...'))
+        resp = self.client.post("/bonds/", mock_bulk_rows(2), format='json')
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(Bond.objects.count(), 0)
+
+class AsyncEnrichmentTest(APITestCase):
+    """
+    Tests for `POST /bonds/?async=true` and the enrichment worker defined in bonds/enrichment.py.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        legal_name_cache.clear()
+        gleif.client.breaker.reset()
+
+    @responses.activate
+    def test_async_post_returns_202_without_calling_gleif(self):
+        resp = self.client.post("/bonds/?async=true", MOCK_POST_DATA, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(resp.json()["enrichment_status"], Bond.PENDING)
+        self.assertEqual(len(responses.calls), 0)
+        bond = Bond.objects.get()
+        self.assertEqual(bond.legal_name, "")
+        self.assertEqual(bond.enrichment_job.lei, MOCK_POST_DATA["lei"])
+
+    @responses.activate
+    def test_async_post_succeeds_while_gleif_is_down(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, body=requests.exceptions.ConnectionError('...'))
+        resp = self.client.post("/bonds/?async=true", MOCK_POST_DATA, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_202_ACCEPTED)
+
+    def test_async_post_with_cached_lei_is_resolved_immediately(self):
+        legal_name_cache.set(MOCK_POST_DATA["lei"], "MOCKBANK")
+        resp = self.client.post("/bonds/?async=true", MOCK_POST_DATA, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Bond.objects.get().legal_name, "MOCKBANK")
+        self.assertFalse(EnrichmentJob.objects.exists())
+
+    def test_async_post_with_cached_invalid_lei_returns_400(self):
+        legal_name_cache.set(MOCK_POST_DATA["lei"], None)
+        resp = self.client.post("/bonds/?async=true", MOCK_POST_DATA, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Bond.objects.exists())
+
+    def test_pending_bonds_can_be_filtered(self):
+        self.client.post("/bonds/?async=true", MOCK_POST_DATA, format='json')
+        resp = self.client.get("/bonds/?enrichment_status=pending")
+        self.assertEqual(len(resp.json()), 1)
+
+    @responses.activate
+    def test_worker_resolves_pending_bonds(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=MOCK_GLEIF_RESPONSE, status=200)
+        self.client.post("/bonds/?async=true", MOCK_POST_DATA, format='json')
+        self.client.post("/bonds/?async=true", dict(MOCK_POST_DATA, isin="FR0000000001"), format='json')
+        self.assertEqual(EnrichmentWorker(max_workers=2).run_once(), 2)
+        # Both bonds share a LEI, so it is only looked up once
+        self.assertEqual(len(responses.calls), 1)
+        self.assertEqual(set(Bond.objects.values_list('legal_entity__legal_name', 'enrichment_status')),
+                         set([("MOCKBANK", Bond.RESOLVED)]))
+        self.assertFalse(EnrichmentJob.objects.exists())
+
+    @responses.activate
+    def test_worker_marks_invalid_leis_as_failed(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=[], status=200)
+        self.client.post("/bonds/?async=true", MOCK_POST_DATA, format='json')
+        EnrichmentWorker().run_once()
+        self.assertEqual(Bond.objects.get().enrichment_status, Bond.FAILED)
+        self.assertFalse(EnrichmentJob.objects.exists())
+
+    @responses.activate
+    def test_worker_retries_with_backoff_while_gleif_is_down(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, body=requests.exceptions.ConnectionError('...'))
+        self.client.post("/bonds/?async=true", MOCK_POST_DATA, format='json')
+        EnrichmentWorker().run_once()
+        job = EnrichmentJob.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.next_attempt_at, timezone.now())
+        self.assertEqual(Bond.objects.get().enrichment_status, Bond.PENDING)
+        # The job is not due again until the backoff has passed
+        self.assertEqual(EnrichmentWorker().run_once(), 0)
+
+    def test_unexpected_lookup_errors_are_retried_without_stopping_the_worker(self):
+        self.client.post("/bonds/?async=true", MOCK_POST_DATA, format='json')
+        with mock.patch.object(gleif.client, "fetch_legal_name", side_effect=RuntimeError("boom")), \
+                self.assertLogs("bonds.enrichment", level="ERROR"):
+            self.assertEqual(EnrichmentWorker().run_once(), 1)
+        job = EnrichmentJob.objects.get()
+        self.assertEqual((job.attempts, job.last_error), (1, "boom"))
+        self.assertGreater(job.next_attempt_at, timezone.now())
+        self.assertEqual(Bond.objects.get().enrichment_status, Bond.PENDING)
+
+    @responses.activate
+    def test_worker_gives_up_after_max_attempts(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, body=requests.exceptions.ConnectionError('...'))
+        self.client.post("/bonds/?async=true", MOCK_POST_DATA, format='json')
+        EnrichmentJob.objects.update(attempts=settings.ENRICHMENT_MAX_ATTEMPTS - 1)
+        EnrichmentWorker().run_once()
+        self.assertEqual(Bond.objects.get().enrichment_status, Bond.FAILED)
+        self.assertFalse(EnrichmentJob.objects.exists())
+
+    @responses.activate
+    def test_enrich_bonds_command_processes_due_jobs(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=MOCK_GLEIF_RESPONSE, status=200)
+        self.client.post("/bonds/?async=true", MOCK_POST_DATA, format='json')
+        out = StringIO()
+        call_command('enrich_bonds', '--once', stdout=out)
+        self.assertIn("Processed 1 job(s).", out.getvalue())
+        self.assertEqual(Bond.objects.get().legal_name, "MOCKBANK")
+
+    def test_claimed_jobs_are_not_claimed_again(self):
+        self.client.post("/bonds/?async=true", MOCK_POST_DATA, format='json')
+        self.assertEqual(len(EnrichmentWorker().claim_jobs()), 1)
+        self.assertEqual(len(EnrichmentWorker().claim_jobs()), 0)
+
+    def test_backoff_grows_exponentially_up_to_the_maximum(self):
+        self.assertLessEqual(backoff_delay(1), settings.ENRICHMENT_BACKOFF_BASE)
+        self.assertGreaterEqual(backoff_delay(3), 2 * settings.ENRICHMENT_BACKOFF_BASE)
+        self.assertLessEqual(backoff_delay(100), settings.ENRICHMENT_BACKOFF_MAX)
+
+class GleifClientTest(APITestCase):
+    """
+    Tests for the GLEIF API client defined in bonds/gleif.py.
+    """
+    def setUp(self):
+        self.gleif_client = GleifClient(retry_backoff=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+
+    @responses.activate
+    def test_legal_name_is_fetched(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=MOCK_GLEIF_RESPONSE, status=200)
+        self.assertEqual(self.gleif_client.fetch_legal_name(MOCK_LEIS[0]), "MOCKBANK")
+
+    @responses.activate
+    def test_requests_have_timeouts(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=MOCK_GLEIF_RESPONSE, status=200)
+        with mock.patch.object(self.gleif_client.session, 'get', wraps=self.gleif_client.session.get) as get:
+            self.gleif_client.fetch_legal_name(MOCK_LEIS[0])
+        self.assertEqual(get.call_args[1]["timeout"], (settings.GLEIF_CONNECT_TIMEOUT, settings.GLEIF_READ_TIMEOUT))
+
+    @responses.activate
+    def test_server_errors_are_retried(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, status=502)
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=MOCK_GLEIF_RESPONSE, status=200)
+        self.assertEqual(self.gleif_client.fetch_legal_name(MOCK_LEIS[0]), "MOCKBANK")
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_timeouts_are_retried_then_raise(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, body=requests.exceptions.ReadTimeout('...'))
+        with self.assertRaises(GleifUnavailableError):
+            self.gleif_client.fetch_legal_name(MOCK_LEIS[0])
+        self.assertEqual(len(responses.calls), settings.GLEIF_MAX_RETRIES + 1)
+
+    @responses.activate
+    def test_client_errors_are_not_retried(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json={'message': 'Invalid LEI'}, status=400)
+        self.assertIsNone(self.gleif_client.fetch_legal_name("AAAA"))
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_circuit_opens_after_repeated_failures(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, status=503)
+        for _ in range(2):
+            with self.assertRaises(GleifUnavailableError):
+                self.gleif_client.fetch_legal_name(MOCK_LEIS[0])
+        calls = len(responses.calls)
+        with self.assertRaises(CircuitOpenError):
+            self.gleif_client.fetch_legal_name(MOCK_LEIS[0])
+        # Failing fast does not reach GLEIF
+        self.assertEqual(len(responses.calls), calls)
+
+    def test_circuit_lets_one_trial_call_through_after_the_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_trial_call_reopens_the_circuit(self):
+        breaker = CircuitBreaker(failure_threshold=5, reset_timeout=0)
+        for _ in range(5):
+            breaker.record_failure()
+        breaker.allow_request()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_invalid_lei_does_not_leave_the_circuit_half_open(self):
+        gleif_client = GleifClient(breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0))
+        gleif_client.breaker.record_failure()
+        with self.assertRaises(TypeError):
+            gleif_client.fetch_legal_name(123)
+        self.assertEqual(gleif_client.breaker.state, CircuitBreaker.OPEN)
+        self.assertTrue(gleif_client.breaker.allow_request())
+
+    @responses.activate
+    def test_unexpected_errors_count_against_the_circuit(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, body=ValueError('...'))
+        with self.assertRaises(GleifUnavailableError):
+            self.gleif_client.fetch_legal_name(MOCK_LEIS[0])
+        with self.assertRaises(GleifUnavailableError):
+            self.gleif_client.fetch_legal_name(MOCK_LEIS[0])
+        self.assertEqual(self.gleif_client.breaker.state, CircuitBreaker.OPEN)
+
+    @responses.activate
+    def test_rate_limited_requests_are_retried_after_the_requested_delay(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, status=429, headers={"Retry-After": "1"})
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=MOCK_GLEIF_RESPONSE, status=200)
+        with mock.patch("bonds.gleif.time.sleep") as sleep:
+            self.assertEqual(self.gleif_client.fetch_legal_name(MOCK_LEIS[0]), "MOCKBANK")
+        sleep.assert_called_once_with(1)
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_rate_limiting_is_not_an_invalid_lei(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, status=429, headers={"Retry-After": "0"})
+        with self.assertRaises(GleifUnavailableError):
+            self.gleif_client.fetch_legal_name(MOCK_LEIS[0])
+        with self.assertRaises(GleifUnavailableError):
+            self.gleif_client.fetch_legal_names(MOCK_LEIS)
+        self.assertEqual(len(responses.calls), 2 * (settings.GLEIF_MAX_RETRIES + 1))
+
+    @responses.activate
+    def test_long_retry_after_is_not_waited_for(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, status=429,
+                      headers={"Retry-After": str(settings.GLEIF_MAX_RETRY_AFTER + 1)})
+        with self.assertRaises(GleifUnavailableError):
+            self.gleif_client.fetch_legal_name(MOCK_LEIS[0])
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_unexpected_client_errors_are_retried_then_raise(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, status=403)
+        with self.assertRaises(GleifUnavailableError):
+            self.gleif_client.fetch_legal_name(MOCK_LEIS[0])
+        self.assertEqual(len(responses.calls), settings.GLEIF_MAX_RETRIES + 1)
+
+    @responses.activate
+    def test_unknown_leis_are_invalid(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, status=404)
+        self.assertIsNone(self.gleif_client.fetch_legal_name(MOCK_LEIS[0]))
+
+    @responses.activate
+    def test_invalid_json_raises(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, body="<html>Maintenance</html>", status=200)
+        with self.assertRaises(GleifUnavailableError):
+            self.gleif_client.fetch_legal_name(MOCK_LEIS[0])
+        with self.assertRaises(GleifUnavailableError):
+            self.gleif_client.fetch_legal_names(MOCK_LEIS)
+
+    @responses.activate
+    def test_gleif_failures_return_503(self):
+        user = User.objects.create_user(username='testuser', password='testpass')
+        api_client = APIClient()
+        api_client.force_authenticate(user)
+        for failure in [dict(body=requests.exceptions.ChunkedEncodingError('...')),
+                        dict(body=requests.exceptions.TooManyRedirects('...')),
+                        dict(status=429, headers={"Retry-After": "0"}),
+                        dict(body="not json", status=200)]:
+            legal_name_cache.clear()
+            gleif.client.breaker.reset()
+            responses.reset()
+            responses.add(responses.GET, GLEIF_API_ENDPOINT, **failure)
+            resp = api_client.post("/bonds/", MOCK_POST_DATA, format='json')
+            self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE, failure)
+            resp = api_client.post("/bonds/", [MOCK_POST_DATA], format='json')
+            self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE, failure)
+        gleif.client.breaker.reset()
+        # Nothing was cached as invalid
+        self.assertFalse(LegalEntity.objects.exists())
+
+    @responses.activate
+    def test_non_string_leis_are_rejected(self):
+        user = User.objects.create_user(username='testuser', password='testpass')
+        api_client = APIClient()
+        api_client.force_authenticate(user)
+        for url in ["/bonds/", "/bonds/?async=true"]:
+            resp = api_client.post(url, dict(MOCK_POST_DATA, lei=123), format='json')
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(responses.calls), 0)
+        self.assertEqual(Bond.objects.count(), 0)
+
+    @responses.activate
+    def test_open_circuit_returns_503(self):
+        gleif.client.breaker.reset()
+        for _ in range(settings.GLEIF_CIRCUIT_FAILURE_THRESHOLD):
+            gleif.client.breaker.record_failure()
+        user = User.objects.create_user(username='testuser', password='testpass')
+        api_client = APIClient()
+        api_client.force_authenticate(user)
+        legal_name_cache.clear()
+        resp = api_client.post("/bonds/", MOCK_POST_DATA, format='json')
+        gleif.client.breaker.reset()
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(len(responses.calls), 0)
+
+class SingleFlightTest(APITestCase):
+    """
+    Tests for the coalescing of concurrent GLEIF lookups, defined in bonds/singleflight.py.
+    """
+    def setUp(self):
+        metrics.reset()
+        self.gleif_client = GleifClient(max_retries=0, retry_backoff=0)
+        # GLEIF answers once released, so that lookups stay in flight until then
+        self.release = threading.Event()
+        self.requests = []
+        self.error = None
+
+    def respond(self, request):
+        self.requests.append(request)
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        leis = parse_qs(urlparse(request.url).query)["lei"][0].split(",")
+        return (200, {}, json.dumps([mock_gleif_record(lei, "MOCK BANK") for lei in leis]))
+
+    def requested_leis(self):
+        return sorted(parse_qs(urlparse(request.url).query)["lei"][0] for request in self.requests)
+
+    def coalesced(self):
+        lines = metrics.GLEIF_COALESCED_LOOKUPS.render()[2:]
+        return int(lines[0].split()[-1]) if lines else 0
+
+    def wait_until(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.001)
+
+    def lookup_concurrently(self, lookups, coalesced):
+        """
+        Run each lookup in its own thread, and release GLEIF once `coalesced` of them wait for another.
+        """
+        with ThreadPoolExecutor(max_workers=len(lookups)) as pool:
+            futures = [pool.submit(lookup) for lookup in lookups]
+            try:
+                self.wait_until(lambda: self.coalesced() == coalesced)
+            finally:
+                self.release.set()
+        return futures
+
+    @responses.activate
+    def test_concurrent_lookups_of_a_lei_share_one_request(self):
+        responses.add_callback(responses.GET, GLEIF_API_ENDPOINT, callback=self.respond)
+        lookups = [lambda: self.gleif_client.fetch_legal_name(MOCK_LEIS[0])] * 32
+        futures = self.lookup_concurrently(lookups, coalesced=31)
+        self.assertEqual([future.result() for future in futures], ["MOCKBANK"] * 32)
+        self.assertEqual(len(self.requests), 1)
+
+    @responses.activate
+    def test_concurrent_lookups_share_errors(self):
+        responses.add_callback(responses.GET, GLEIF_API_ENDPOINT, callback=self.respond)
+        self.error = requests.exceptions.ConnectionError('...')
+        lookups = [lambda: self.gleif_client.fetch_legal_name(MOCK_LEIS[0])] * 16
+        for future in self.lookup_concurrently(lookups, coalesced=15):
+            with self.assertRaises(GleifUnavailableError):
+                future.result()
+        self.assertEqual(len(self.requests), 1)
+
+    @responses.activate
+    def test_lookups_of_different_leis_are_not_coalesced(self):
+        responses.add_callback(responses.GET, GLEIF_API_ENDPOINT, callback=self.respond)
+        lookups = [lambda lei=lei: self.gleif_client.fetch_legal_name(lei) for lei in MOCK_LEIS * 8]
+        futures = self.lookup_concurrently(lookups, coalesced=14)
+        self.assertEqual([future.result() for future in futures], ["MOCKBANK"] * 16)
+        self.assertEqual(self.requested_leis(), sorted(MOCK_LEIS))
+
+    @responses.activate
+    def test_batch_lookups_leave_out_leis_in_flight(self):
+        responses.add_callback(responses.GET, GLEIF_API_ENDPOINT, callback=self.respond)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            single = pool.submit(self.gleif_client.fetch_legal_name, MOCK_LEIS[0])
+            self.wait_until(lambda: len(self.requests) == 1)
+            batch = pool.submit(self.gleif_client.fetch_legal_names, list(reversed(MOCK_LEIS)))
+            self.wait_until(lambda: len(self.requests) == 2)
+            self.release.set()
+        self.assertEqual(single.result(), "MOCKBANK")
+        self.assertEqual(batch.result(), {MOCK_LEIS[1]: "MOCKBANK", MOCK_LEIS[0]: "MOCKBANK"})
+        self.assertEqual(list(batch.result()), list(reversed(MOCK_LEIS)))
+        self.assertEqual(self.requested_leis(), sorted(MOCK_LEIS))
+        self.assertEqual(self.coalesced(), 1)
+
+    @responses.activate
+    def test_lookups_after_a_lookup_completes_make_a_new_request(self):
+        responses.add_callback(responses.GET, GLEIF_API_ENDPOINT, callback=self.respond)
+        self.release.set()
+        self.gleif_client.fetch_legal_name(MOCK_LEIS[0])
+        self.gleif_client.fetch_legal_name(MOCK_LEIS[0])
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(self.coalesced(), 0)
+
+def create_legal_entities(legal_names):
+    LegalEntity.objects.bulk_create([LegalEntity(lei=lei, legal_name=legal_name, resolved_at=timezone.now())
+                                     for lei, legal_name in legal_names.items()], ignore_conflicts=True)
+
+def create_bonds(owner, count, start=0, **attributes):
+    create_legal_entities({attributes.get("lei", MOCK_POST_DATA["lei"]): "MOCKBANK"})
+    bonds = []
+    for i in range(start, start + count):
+        bond = dict(MOCK_POST_DATA, isin="FR%010d" % i, legal_name="MOCKBANK", **attributes)
+        bonds.append(Bond(owner=owner, **bond))
+    Bond.objects.bulk_create(bonds)
+
+class PaginationTest(APITestCase):
+    """
+    Tests for the cursor pagination of GET /bonds/ defined in bonds/pagination.py.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+    def test_unpaginated_requests_return_a_list(self):
+        create_bonds(self.user, 3)
+        resp = self.client.get("/bonds/")
+        self.assertEqual(len(resp.json()), 3)
+
+    def test_pages_can_be_followed_forwards_and_backwards(self):
+        create_bonds(self.user, 5)
+        page = self.client.get("/bonds/?page_size=2").json()
+        isins = [bond["isin"] for bond in page["results"]]
+        self.assertIsNone(page["previous"])
+        while page["next"]:
+            page = self.client.get(page["next"]).json()
+            isins += [bond["isin"] for bond in page["results"]]
+        self.assertEqual(isins, ["FR%010d" % i for i in range(5)])
+        previous = self.client.get(page["previous"]).json()
+        self.assertEqual([bond["isin"] for bond in previous["results"]], ["FR0000000002", "FR0000000003"])
+
+    def test_pagination_applies_filters(self):
+        create_bonds(self.user, 3)
+        create_bonds(self.user, 3, start=3, currency="USD")
+        page = self.client.get("/bonds/?currency=USD&page_size=2").json()
+        page = self.client.get(page["next"]).json()
+        self.assertEqual(len(page["results"]), 1)
+        self.assertEqual(page["results"][0]["currency"], "USD")
+
+    def test_page_size_is_capped(self):
+        create_bonds(self.user, 3)
+        with mock.patch.object(BondCursorPagination, 'max_page_size', 2):
+            page = self.client.get("/bonds/?page_size=1000").json()
+        self.assertEqual(len(page["results"]), 2)
+
+    def test_deep_pages_do_not_use_offset(self):
+        create_bonds(self.user, 5)
+        page = self.client.get("/bonds/?page_size=2").json()
+        page = self.client.get(page["next"]).json()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(page["next"])
+        self.assertFalse(any("OFFSET" in query["sql"] for query in queries))
+
+    def test_offsets_in_crafted_cursors_are_ignored(self):
+        create_bonds(self.user, 5)
+        cursor = base64.b64encode(b"o=3").decode()
+        page = self.client.get("/bonds/?cursor=" + cursor).json()
+        self.assertEqual(page["results"][0]["isin"], "FR0000000000")
+
+    def test_invalid_cursor_returns_404(self):
+        resp = self.client.get("/bonds/?cursor=foobar")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+class FastReadPathTest(APITestCase):
+    """
+    Tests for the fast read path of GET /bonds/ (`represent_bonds` in bonds/serializers.py).
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(self.user)
+
+    def test_output_is_identical_to_bond_serializer(self):
+        create_bonds(self.user, 5)
+        create_legal_entities({"PENDINGLEI": None})
+        Bond.objects.filter(isin="FR0000000003").update(legal_entity="PENDINGLEI", enrichment_status=Bond.PENDING)
+        expected = JSONRenderer().render(BondSerializer(Bond.objects.all(), many=True).data)
+        resp = self.client.get("/bonds/?format=json")
+        self.assertEqual(resp.content, expected)
+
+    def test_paginated_output_is_identical_to_bond_serializer(self):
+        create_bonds(self.user, 5)
+        expected = BondSerializer(Bond.objects.order_by('id')[:2], many=True).data
+        resp = self.client.get("/bonds/?page_size=2")
+        self.assertEqual(resp.json()["results"], json.loads(JSONRenderer().render(expected)))
+
+    def test_list_is_read_in_one_query(self):
+        create_bonds(self.user, 5)
+        # Besides the bonds, only the version of the book is read (see bonds/versions.py)
+        with self.assertNumQueries(2):
+            self.client.get("/bonds/")
+
+class TokenAuthenticationTest(APITestCase):
+    """
+    Tests for the signed API tokens defined in bonds/authentication.py.
+    """
+    def setUp(self):
+        authentication.user_cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+
+    def login(self, password='testpass'):
+        return self.client.post("/token/", {"username": "testuser", "password": password}, format='json')
+
+    def get_bonds(self, token):
+        return self.client.get("/bonds/", HTTP_AUTHORIZATION="Token " + token)
+
+    def test_login_issues_a_token_for_the_api(self):
+        create_bonds(self.user, 2)
+        resp = self.login()
+        assert resp.status_code == status.HTTP_200_OK
+        self.assertEqual(resp.data["expires_in"], settings.API_TOKEN_MAX_AGE)
+        resp = self.get_bonds(resp.data["token"])
+        assert resp.status_code == status.HTTP_200_OK
+        self.assertEqual(len(resp.data), 2)
+
+    def test_tokens_authenticate_writes_without_csrf(self):
+        create_legal_entities({MOCK_POST_DATA["lei"]: "MOCKBANK"})
+        client = APIClient(enforce_csrf_checks=True)
+        token = issue_token(self.user)
+        resp = client.post("/bonds/", MOCK_POST_DATA, format='json', HTTP_AUTHORIZATION="Token " + token)
+        assert resp.status_code == status.HTTP_201_CREATED
+        self.assertEqual(Bond.objects.get().owner, self.user)
+
+    def test_invalid_credentials_return_400(self):
+        assert self.login(password='wrongpass').status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_tampered_token_is_rejected(self):
+        token = issue_token(self.user)
+        other = User.objects.create_user(username='otheruser', password='testpass')
+        forged = token.replace("%d:" % self.user.pk, "%d:" % other.pk, 1)
+        assert self.get_bonds(forged).status_code == status.HTTP_403_FORBIDDEN
+        assert self.get_bonds("foobar").status_code == status.HTTP_403_FORBIDDEN
+
+    def test_expired_token_is_rejected(self):
+        token = issue_token(self.user)
+        with self.settings(API_TOKEN_MAX_AGE=-1):
+            resp = self.get_bonds(token)
+        assert resp.status_code == status.HTTP_403_FORBIDDEN
+        self.assertEqual(str(resp.data["detail"]), "Token has expired.")
+
+    def test_version_bump_revokes_tokens(self):
+        token = issue_token(self.user)
+        with self.settings(API_TOKEN_VERSION=settings.API_TOKEN_VERSION + 1):
+            resp = self.get_bonds(token)
+            assert resp.status_code == status.HTTP_403_FORBIDDEN
+            self.assertEqual(str(resp.data["detail"]), "Token has been revoked.")
+            assert self.get_bonds(issue_token(self.user)).status_code == status.HTTP_200_OK
+
+    def test_password_change_revokes_tokens(self):
+        token = issue_token(self.user)
+        self.user.set_password('newpass')
+        self.user.save()
+        authentication.user_cache.clear()
+        assert self.get_bonds(token).status_code == status.HTTP_403_FORBIDDEN
+
+    def test_inactive_user_is_rejected(self):
+        token = issue_token(self.user)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        assert self.get_bonds(token).status_code == status.HTTP_403_FORBIDDEN
+
+    def test_authentication_makes_no_queries_once_the_user_is_cached(self):
+        create_bonds(self.user, 5)
+        token = issue_token(self.user)
+        self.get_bonds(token)
+        # As with force_authenticate (see FastReadPathTest), only the book version and the bonds are read
+        with self.assertNumQueries(2):
+            resp = self.get_bonds(token)
+        assert resp.status_code == status.HTTP_200_OK
+
+class SummaryTest(APITestCase):
+    """
+    Tests for the portfolio summaries at /bonds/summary/ (see bonds/summary.py).
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(self.user)
+        today = date.today()
+        in_one_year = today + timedelta(days=365)
+        in_three_years = today + timedelta(days=3 * 365)
+        create_legal_entities({"L1": "ONE", "L2": "TWO"})
+        self.bonds = [
+            Bond(owner=self.user, isin="A", size=100, currency="EUR", maturity=in_one_year, lei="L1", legal_name="ONE"),
+            Bond(owner=self.user, isin="B", size=300, currency="EUR", maturity=in_three_years, lei="L2", legal_name="TWO"),
+            Bond(owner=self.user, isin="C", size=500, currency="USD", maturity=in_one_year, lei="L1", legal_name="ONE"),
+            # Matured bonds count as having no time left to maturity
+            Bond(owner=self.user, isin="D", size=100, currency="USD", maturity=today - timedelta(days=30), lei="L2", legal_name="TWO"),
+        ]
+        Bond.objects.bulk_create(self.bonds)
+        other_user = User.objects.create_user(username='anotheruser', password='testpass')
+        create_bonds(other_user, 3)
+
+    def test_summary_without_grouping(self):
+        summary, = self.client.get("/bonds/summary/").json()
+        self.assertEqual(summary["count"], 4)
+        self.assertEqual(summary["total_size"], 1000)
+        expected_days = 100 * 365 + 300 * 3 * 365 + 500 * 365
+        self.assertAlmostEqual(summary["weighted_average_years_to_maturity"], expected_days / 1000 / 365.25)
+
+    def test_summary_grouped_by_currency(self):
+        summary = self.client.get("/bonds/summary/?group_by=currency").json()
+        self.assertEqual([(group["currency"], group["count"], group["total_size"]) for group in summary],
+                         [("EUR", 2, 400), ("USD", 2, 600)])
+        self.assertAlmostEqual(summary[0]["weighted_average_years_to_maturity"], (100 + 900) * 365 / 400 / 365.25)
+
+    def test_summary_grouped_by_several_dimensions(self):
+        summary = self.client.get("/bonds/summary/?group_by=legal_name,maturity_year").json()
+        self.assertEqual(len(summary), len({(bond.legal_name, bond.maturity.year) for bond in self.bonds}))
+        self.assertEqual(set(summary[0]), set(['legal_name', 'maturity_year', 'count', 'total_size',
+                                               'weighted_average_years_to_maturity']))
+
+    def test_summary_grouped_by_quarter(self):
+        summary = self.client.get("/bonds/summary/?group_by=maturity_year,maturity_quarter").json()
+        quarters = set((bond.maturity.year, (bond.maturity.month - 1) // 3 + 1) for bond in self.bonds)
+        self.assertEqual(set((group["maturity_year"], group["maturity_quarter"]) for group in summary), quarters)
+
+    def test_summary_applies_filters(self):
+        summary, = self.client.get("/bonds/summary/?lei=L1").json()
+        self.assertEqual(summary["total_size"], 600)
+
+    def test_summary_of_no_bonds(self):
+        summary, = self.client.get("/bonds/summary/?currency=GBP").json()
+        self.assertEqual(summary, {"count": 0, "total_size": 0, "weighted_average_years_to_maturity": None})
+
+    def test_invalid_dimension_returns_400(self):
+        resp = self.client.get("/bonds/summary/?group_by=currency,owner")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_summary_is_one_query(self):
+        with self.assertNumQueries(1):
+            self.client.get("/bonds/summary/?group_by=currency,maturity_year")
+
+class AnalyticsTest(APITestCase):
+    """
+    Tests for the portfolio analytics at /bonds/analytics/ (see bonds/analytics.py).
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(self.user)
+        today = date.today()
+        in_one_year = today + timedelta(days=365)
+        in_three_years = today + timedelta(days=3 * 365)
+        create_legal_entities({"L1": "ONE", "L2": "TWO"})
+        Bond.objects.bulk_create([
+            Bond(owner=self.user, isin="A", size=100, currency="EUR", maturity=in_one_year, lei="L1"),
+            Bond(owner=self.user, isin="B", size=300, currency="EUR", maturity=in_three_years, lei="L2"),
+            Bond(owner=self.user, isin="C", size=500, currency="USD", maturity=in_one_year, lei="L1"),
+            Bond(owner=self.user, isin="D", size=100, currency="USD", maturity=today - timedelta(days=30), lei="L2"),
+            # Read along with A, as one row of the same maturity, currency and LEI
+            Bond(owner=self.user, isin="E", size=50, currency="EUR", maturity=in_one_year, lei="L1"),
+        ])
+        other_user = User.objects.create_user(username='anotheruser', password='testpass')
+        create_bonds(other_user, 3)
+
+    def get_analytics(self, path="/bonds/analytics/", **headers):
+        resp = self.client.get(path, **headers)
+        assert resp.status_code == status.HTTP_200_OK
+        return resp.json()
+
+    def test_totals_and_weighted_average_life(self):
+        analytics = self.get_analytics()
+        self.assertEqual(analytics["count"], 5)
+        self.assertEqual(analytics["total_size"], 1050)
+        # Matured bonds count as having no life left
+        expected_days = (100 + 500 + 50) * 365 + 300 * 3 * 365
+        self.assertAlmostEqual(analytics["weighted_average_life_years"], expected_days / 1050 / 365.25)
+
+    def test_maturity_ladder(self):
+        ladder = {bucket["bucket"]: (bucket["count"], bucket["total_size"])
+                  for bucket in self.get_analytics()["maturity_ladder"]}
+        self.assertEqual(list(ladder), ["matured", "0-1y", "1-2y", "2-3y", "3-5y", "5-7y", "7-10y",
+                                        "10-20y", "20-30y", "30y+"])
+        self.assertEqual(ladder["matured"], (1, 100))
+        self.assertEqual(ladder["0-1y"], (3, 650))
+        self.assertEqual(ladder["2-3y"], (1, 300))
+        self.assertEqual(sum(count for count, _ in ladder.values()), 5)
+
+    def test_concentration_by_currency_and_issuer(self):
+        analytics = self.get_analytics()
+        currencies = analytics["currencies"]
+        self.assertEqual([(group["currency"], group["total_size"]) for group in currencies["groups"]],
+                         [("USD", 600), ("EUR", 450)])
+        self.assertAlmostEqual(currencies["groups"][0]["share"], 600 / 1050)
+        self.assertAlmostEqual(currencies["hhi"], (600 / 1050) ** 2 + (450 / 1050) ** 2)
+        issuers = analytics["issuers"]
+        self.assertEqual(issuers["count"], 2)
+        self.assertEqual([(issuer["lei"], issuer["legal_name"], issuer["total_size"]) for issuer in issuers["top"]],
+                         [("L1", "ONE", 650), ("L2", "TWO", 400)])
+
+    def test_top_issuers_are_limited(self):
+        with self.settings(BONDS_ANALYTICS_TOP_ISSUERS=1):
+            issuers = self.get_analytics()["issuers"]
+        self.assertEqual(issuers["count"], 2)
+        self.assertEqual([issuer["lei"] for issuer in issuers["top"]], ["L1"])
+
+    def test_analytics_accept_filters(self):
+        analytics = self.get_analytics("/bonds/analytics/?currency=EUR")
+        self.assertEqual((analytics["count"], analytics["total_size"]), (3, 450))
+
+    def test_empty_book(self):
+        Bond.objects.filter(owner=self.user).delete()
+        analytics = self.get_analytics()
+        self.assertEqual((analytics["count"], analytics["total_size"]), (0, 0))
+        self.assertIsNone(analytics["weighted_average_life_years"])
+        self.assertEqual(analytics["issuers"], {"count": 0, "hhi": 0.0, "top": []})
+
+    def test_chunked_reads_give_the_same_result(self):
+        bonds = Bond.objects.filter(owner=self.user)
+        self.assertEqual(analyze(load_book(bonds, chunk_size=1), date.today()),
+                         analyze(load_book(bonds), date.today()))
+
+    def test_analytics_are_cached_per_book_version(self):
+        versions.bump([self.user.pk])
+        first = self.get_analytics()
+        # Only the version of the book is read
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_analytics(), first)
+        Bond.objects.filter(isin="A").update(size=1100)
+        versions.bump([self.user.pk])
+        self.assertEqual(self.get_analytics()["total_size"], 2050)
+
+    def test_unchanged_analytics_return_304(self):
+        etag = self.client.get("/bonds/analytics/")["ETag"]
+        self.assertNotEqual(etag, self.client.get("/bonds/")["ETag"])
+        resp = self.client.get("/bonds/analytics/", HTTP_IF_NONE_MATCH=etag)
+        assert resp.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_analytics_are_read_from_the_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            load_book(Bond.objects.filter(owner=self.user))
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + queries[0]["sql"])
+            plan = " ".join(row[-1] for row in cursor.fetchall())
+        self.assertIn("USING COVERING INDEX bonds_owner_maturity_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+class ExportTest(APITestCase):
+    """
+    Tests for the streaming export of bonds at /bonds/export/.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+    def test_ndjson_export_matches_the_list_output(self):
+        create_bonds(self.user, 3)
+        resp = self.client.get("/bonds/export/")
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(resp.streaming_content).decode().splitlines()]
+        self.assertEqual(rows, self.client.get("/bonds/").json())
+
+    def test_csv_export(self):
+        create_bonds(self.user, 2)
+        resp = self.client.get("/bonds/export/?format=csv")
+        self.assertEqual(resp["Content-Type"], "text/csv")
+        rows = list(csv.reader(StringIO(b"".join(resp.streaming_content).decode())))
+        self.assertEqual(rows[0], ['isin', 'size', 'currency', 'maturity', 'lei', 'legal_name', 'owner'])
+        self.assertEqual(rows[1], ['FR0000000000', '100000000', 'EUR', '2025-02-28', MOCK_POST_DATA["lei"], 'MOCKBANK', 'testuser'])
+        self.assertEqual(len(rows), 3)
+
+    def test_empty_csv_export_has_a_header(self):
+        resp = self.client.get("/bonds/export/", HTTP_ACCEPT="text/csv")
+        self.assertEqual(b"".join(resp.streaming_content).decode().strip(), "isin,size,currency,maturity,lei,legal_name,owner")
+
+    def test_export_applies_filters_and_ownership(self):
+        create_bonds(self.user, 2)
+        create_bonds(self.user, 1, start=2, currency="USD")
+        create_bonds(User.objects.create_user(username='anotheruser', password='testpass'), 4, currency="USD")
+        resp = self.client.get("/bonds/export/?currency=USD")
+        self.assertEqual(len(b"".join(resp.streaming_content).splitlines()), 1)
+
+    def test_invalid_filter_returns_400(self):
+        resp = self.client.get("/bonds/export/?size=foobar")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_is_read_in_chunks(self):
+        create_bonds(self.user, 5)
+        with self.settings(BONDS_EXPORT_CHUNK_SIZE=2), \
+                mock.patch('django.db.models.query.QuerySet.iterator', autospec=True,
+                           side_effect=QuerySet.iterator) as iterator:
+            b"".join(self.client.get("/bonds/export/").streaming_content)
+        self.assertEqual(iterator.call_args[1]["chunk_size"], 2)
+
+    def test_anonymous_users_are_rejected(self):
+        self.client.logout()
+        resp = self.client.get("/bonds/export/")
+        self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
+
+def query_plan(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return " ".join(row[-1] for row in cursor.fetchall())
+
+# The index expected to serve each filter of `BondsList.get`. `None` means any index on owner is enough.
+FILTER_INDEXES = {
+    # The index of the (owner, isin) unique constraint
+    'isin': r'sqlite_autoindex_bonds_bond_\d+',
+    'size': None,
+    'currency': 'bonds_owner_currency_idx',
+    'maturity': 'bonds_owner_maturity_idx',
+    'lei': 'bonds_owner_lei_idx',
+    # A join on LegalEntity, by primary key (or through its legal name index, depending on statistics)
+    'legal_name': None,
+    'enrichment_status': None,
+}
+
+FILTER_VALUES = dict(MOCK_POST_DATA, legal_name="MOCKBANK", enrichment_status=Bond.PENDING)
+
+class QueryPlanTest(APITestCase):
+    """
+    Checks that every filter supported by GET /bonds/ is served by an index rather than a full scan.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+
+    def test_every_filter_has_an_expected_index(self):
+        # New filters must be added to FILTER_INDEXES (and usually to Bond.Meta.indexes)
+        self.assertEqual(set(BondsList.filter_fields), set(FILTER_INDEXES))
+
+    def test_filters_use_an_index(self):
+        for field in BondsList.filter_fields:
+            lookup = BondsList.filter_fields[field]
+            plan = query_plan(Bond.objects.filter(owner=self.user, **{lookup: FILTER_VALUES[field]}))
+            with self.subTest(field=field, plan=plan):
+                self.assertNotRegex(plan, r"\bSCAN bonds_bond\b")
+                self.assertRegex(plan, r"USING (COVERING )?INDEX %s \(owner_id=\?" % (FILTER_INDEXES[field] or r"\w+"))
+
+    def test_combined_filters_use_an_index(self):
+        plan = query_plan(Bond.objects.filter(owner=self.user, legal_entity__legal_name="MOCKBANK", currency="EUR"))
+        self.assertIn("USING INDEX", plan)
+        self.assertNotRegex(plan, r"\bSCAN bonds_bond\b")
+
+class SearchTest(APITestCase):
+    """
+    Tests for the search of bonds by legal name (GET /bonds/?search=), defined in bonds/search.py.
+    """
+    ISSUERS = {
+        "R0MUWSFPU8MPRO8K5P83": "BNPPARIBAS",
+        "B4TYDEB6GKMZO031MB27": "BankofAmericaCorporation",
+        "G5GSEF7VJP5I7OUK5573": "BARCLAYSPLC",
+    }
+
+    def setUp(self):
+        legal_name_cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(self.user)
+        for i, lei in enumerate(self.ISSUERS):
+            create_legal_entities({lei: self.ISSUERS[lei]})
+            create_bonds(self.user, 2, start=2 * i, lei=lei)
+
+    def search(self, query, status_code=status.HTTP_200_OK):
+        resp = self.client.get("/bonds/", {"search": query})
+        self.assertEqual(resp.status_code, status_code)
+        return sorted(set(bond["legal_name"] for bond in resp.data)) if status_code == status.HTTP_200_OK else resp.data
+
+    def test_search_matches_prefixes_case_insensitively(self):
+        self.assertEqual(self.search("bnp"), ["BNPPARIBAS"])
+        self.assertEqual(self.search("BAR"), ["BARCLAYSPLC"])
+
+    def test_search_matches_words_within_legal_names(self):
+        self.assertEqual(self.search("paribas"), ["BNPPARIBAS"])
+        self.assertEqual(self.search("america"), ["BankofAmericaCorporation"])
+        self.assertEqual(self.search("plc"), ["BARCLAYSPLC"])
+
+    def test_search_requires_every_term(self):
+        self.assertEqual(self.search("bank corp"), ["BankofAmericaCorporation"])
+        self.assertEqual(self.search("bnp america"), [])
+
+    def test_search_only_returns_bonds_of_the_user(self):
+        other = User.objects.create_user(username='otheruser', password='testpass')
+        create_bonds(other, 1, start=100)
+        resp = self.client.get("/bonds/?search=bnp")
+        self.assertEqual(len(resp.data), 2)
+
+    def test_search_combines_with_filters(self):
+        Bond.objects.filter(isin="FR0000000000").update(currency="USD")
+        resp = self.client.get("/bonds/?search=paribas&currency=USD")
+        self.assertEqual([bond["isin"] for bond in resp.data], ["FR0000000000"])
+
+    def test_short_or_empty_search_returns_400(self):
+        too_short = "Search terms must be at least 3 characters long."
+        self.assertEqual(self.search("bn", status.HTTP_400_BAD_REQUEST), too_short)
+        self.assertEqual(self.search("bnp pa", status.HTTP_400_BAD_REQUEST), too_short)
+        self.assertEqual(self.search(" ", status.HTTP_400_BAD_REQUEST), "The search query is empty.")
+
+    def test_invalid_search_is_explained_by_every_endpoint(self):
+        for path in ["/bonds/", "/bonds/export/", "/bonds/summary/", "/bonds/analytics/"]:
+            resp = self.client.get(path, {"search": "bn"})
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, path)
+            self.assertIn("Search terms must be at least 3 characters long.", resp.content.decode(), path)
+        # Other invalid values are still reported generically
+        resp = self.client.get("/bonds/", {"search": "bnp", "size": "foobar"})
+        self.assertEqual(resp.data, "Invalid query value(s) provided.")
+
+    def test_fts_syntax_is_matched_literally(self):
+        self.assertEqual(self.search('bnp AND "barclays* NEAR(plc'), [])
+
+    def test_search_follows_renames(self):
+        legal_name_cache.set("R0MUWSFPU8MPRO8K5P83", "SOCIETEGENERALE")
+        self.assertEqual(self.search("bnp"), [])
+        self.assertEqual(self.search("generale"), ["SOCIETEGENERALE"])
+
+    def test_search_skips_unresolved_and_deleted_issuers(self):
+        LegalEntity.objects.filter(lei="G5GSEF7VJP5I7OUK5573").update(legal_name=None)
+        self.assertEqual(self.search("barclays"), [])
+        Bond.objects.filter(legal_entity="B4TYDEB6GKMZO031MB27").delete()
+        LegalEntity.objects.filter(lei="B4TYDEB6GKMZO031MB27").delete()
+        create_legal_entities({"B4TYDEB6GKMZO031MB27": "HSBCHOLDINGSPLC"})
+        create_bonds(self.user, 1, start=100, lei="B4TYDEB6GKMZO031MB27")
+        self.assertEqual(self.search("america"), [])
+        self.assertEqual(self.search("hsbc"), ["HSBCHOLDINGSPLC"])
+
+    def test_search_applies_to_summary_and_export(self):
+        summary, = self.client.get("/bonds/summary/?search=paribas").json()
+        self.assertEqual(summary["count"], 2)
+        resp = self.client.get("/bonds/export/?search=paribas")
+        self.assertEqual(len(b"".join(resp.streaming_content).splitlines()), 2)
+
+    def test_search_uses_the_full_text_index(self):
+        bonds = Bond.objects.filter(owner=self.user, legal_entity__in=search.matching_leis("bnp"))
+        plan = query_plan(bonds)
+        self.assertIn("VIRTUAL TABLE INDEX", plan)
+        self.assertIn("bonds_owner_lei_idx", plan)
+        self.assertNotRegex(plan, r"\bSCAN (bonds_bond|bonds_legalentity|U0)\b")
+
+    def test_search_does_not_depend_on_legal_entity_rowids(self):
+        # A VACUUM may renumber the rowids of LegalEntity, as it has no integer primary key
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE bonds_legalentity SET rowid = rowid + 1000")
+        self.assertEqual(self.search("bnp"), ["BNPPARIBAS"])
+        legal_name_cache.set("R0MUWSFPU8MPRO8K5P83", "SOCIETEGENERALE")
+        self.assertEqual(self.search("generale"), ["SOCIETEGENERALE"])
+
+    def test_old_sqlite_versions_are_rejected(self):
+        with mock.patch.object(connection.Database, "sqlite_version_info", (3, 31, 1)):
+            with self.assertRaisesRegex(ImproperlyConfigured, "SQLite 3.34.0 or later"):
+                search.check_sqlite_version(connection)
+        search.check_sqlite_version(connection)
+
+class LegalEntityTest(APITestCase):
+    """
+    Tests for the normalization of issuers into the LegalEntity model.
+    """
+    def setUp(self):
+        legal_name_cache.clear()
+        gleif.client.breaker.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(self.user)
+
+    @responses.activate
+    def test_bonds_of_an_issuer_share_one_entity(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=MOCK_GLEIF_RESPONSE, status=200)
+        self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+        self.client.post("/bonds/", dict(MOCK_POST_DATA, isin="FR0000000001"), format='json')
+        self.assertEqual(LegalEntity.objects.count(), 1)
+        self.assertEqual(LegalEntity.objects.get().bonds.count(), 2)
+
+    def test_renaming_an_entity_renames_all_of_its_bonds(self):
+        create_bonds(self.user, 3)
+        LegalEntity.objects.filter(lei=MOCK_POST_DATA["lei"]).update(legal_name="RENAMEDBANK")
+        self.assertEqual({bond["legal_name"] for bond in self.client.get("/bonds/").json()}, {"RENAMEDBANK"})
+        self.assertEqual(len(self.client.get("/bonds/?legal_name=RENAMEDBANK").json()), 3)
+
+    def test_pending_bonds_reference_an_unresolved_entity(self):
+        self.client.post("/bonds/?async=true", MOCK_POST_DATA, format='json')
+        self.assertIsNone(LegalEntity.objects.get().resolved_at)
+        self.assertIs(legal_name_cache.get(MOCK_POST_DATA["lei"]), MISSING)
+        self.assertEqual(self.client.get("/bonds/").json()[0]["legal_name"], "")
+
+    def test_entities_with_bonds_cannot_be_deleted(self):
+        create_bonds(self.user, 1)
+        with self.assertRaises(ProtectedError):
+            LegalEntity.objects.all().delete()
+
+class RefreshTest(APITestCase):
+    """
+    Tests for the refresh of stale legal names (see bonds/refresh.py).
+    """
+    def setUp(self):
+        legal_name_cache.clear()
+        gleif.client.breaker.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        create_bonds(self.user, 2, lei=MOCK_LEIS[0])
+        create_bonds(self.user, 1, start=2, lei=MOCK_LEIS[1])
+        LegalEntity.objects.filter(lei=MOCK_LEIS[1]).update(legal_name="OTHERBANK")
+        self.age(MOCK_LEIS[0], days=30)
+        self.age(MOCK_LEIS[1], days=20)
+
+    def age(self, lei, days):
+        LegalEntity.objects.filter(lei=lei).update(resolved_at=timezone.now() - timedelta(days=days))
+
+    def refresh(self, *args):
+        out = StringIO()
+        call_command('refresh_legal_names', '--rate', '0', *args, stdout=out)
+        return out.getvalue()
+
+    @responses.activate
+    def test_stale_names_are_refreshed_in_one_batch(self):
+        records = [mock_gleif_record(MOCK_LEIS[0], "MOCK BANK SA"), mock_gleif_record(MOCK_LEIS[1], "OTHER BANK")]
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=records, status=200)
+        self.assertIn("Refreshed 2 LEI(s): 1 renamed, 0 missing", self.refresh())
+        self.assertEqual(len(responses.calls), 1)
+        self.assertEqual(Bond.objects.filter(legal_entity__legal_name="MOCKBANKSA").count(), 2)
+        self.assertEqual(legal_name_cache.get(MOCK_LEIS[0]), "MOCKBANKSA")
+
+    @responses.activate
+    def test_fresh_names_are_not_looked_up(self):
+        self.age(MOCK_LEIS[1], days=1)
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=[mock_gleif_record(MOCK_LEIS[0], "MOCK BANK")], status=200)
+        self.assertIn("Refreshed 1 LEI(s)", self.refresh())
+        self.assertEqual(responses.calls[0].request.url, GLEIF_API_ENDPOINT + "?lei=" + MOCK_LEIS[0])
+
+    @responses.activate
+    def test_interrupted_refresh_resumes(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=[mock_gleif_record(MOCK_LEIS[0], "MOCK BANK SA")], status=200)
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, body=requests.exceptions.ConnectionError('...'))
+        with self.assertRaises(CommandError):
+            self.refresh('--batch-size', '1')
+        # The stalest LEI was refreshed before GLEIF became unavailable
+        self.assertEqual(LegalEntity.objects.get(lei=MOCK_LEIS[0]).legal_name, "MOCKBANKSA")
+
+        gleif.client.breaker.reset()
+        responses.replace(responses.GET, GLEIF_API_ENDPOINT, json=[mock_gleif_record(MOCK_LEIS[1], "OTHER BANK")], status=200)
+        self.assertIn("Refreshed 1 LEI(s)", self.refresh('--batch-size', '1'))
+        self.assertTrue(responses.calls[-1].request.url.endswith(MOCK_LEIS[1]))
+
+    @responses.activate
+    def test_names_missing_from_gleif_are_kept(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=[], status=200)
+        self.assertIn("Refreshed 0 LEI(s): 0 renamed, 2 missing from GLEIF", self.refresh())
+        self.assertEqual(LegalEntity.objects.get(lei=MOCK_LEIS[0]).legal_name, "MOCKBANK")
+        # They were not confirmed by GLEIF, so the next refresh looks them up again
+        self.assertEqual(stale_entities(settings.LEI_REFRESH_MAX_AGE).count(), 2)
+
+    @responses.activate
+    def test_missing_names_do_not_stop_the_refresh(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=[], status=200)
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=[mock_gleif_record(MOCK_LEIS[1], "OTHER BANK")], status=200)
+        self.assertIn("Refreshed 1 LEI(s): 0 renamed, 1 missing", self.refresh('--batch-size', '1'))
+        self.assertEqual(len(responses.calls), 2)
+        self.assertEqual(list(stale_entities(settings.LEI_REFRESH_MAX_AGE).values_list('lei', flat=True)), [MOCK_LEIS[0]])
+
+    @responses.activate
+    def test_rate_limited_refresh_stops_without_refreshing(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, status=429, headers={"Retry-After": "0"})
+        with self.assertRaises(CommandError):
+            self.refresh()
+        self.assertEqual(len(responses.calls), settings.GLEIF_MAX_RETRIES + 1)
+        self.assertEqual(stale_entities(settings.LEI_REFRESH_MAX_AGE).count(), 2)
+
+    @responses.activate
+    def test_lookups_of_rejected_batches_are_rate_limited(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, status=400)
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=[mock_gleif_record(MOCK_LEIS[0], "MOCK BANK")], status=200)
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=[mock_gleif_record(MOCK_LEIS[1], "OTHER BANK")], status=200)
+        with mock.patch.object(RateLimiter, 'wait', autospec=True) as wait:
+            self.assertIn("Refreshed 2 LEI(s)", self.refresh())
+        self.assertEqual(len(responses.calls), 3)
+        self.assertEqual(wait.call_count, 3)
+
+    def test_rate_limiter_spaces_out_calls(self):
+        limiter = RateLimiter(rate=2)
+        with mock.patch('bonds.refresh.time.sleep') as sleep:
+            limiter.wait()
+            limiter.wait()
+        self.assertEqual(sleep.call_count, 1)
+        self.assertAlmostEqual(sleep.call_args[0][0], 0.5, places=2)
+
+class UpsertTest(APITestCase):
+    """
+    Tests for the uniqueness of (owner, isin) and the upsert mode of POST /bonds/ (see bonds/upsert.py).
+    """
+    def setUp(self):
+        legal_name_cache.clear()
+        gleif.client.breaker.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(self.user)
+        legal_name_cache.set(MOCK_LEIS[0], "MOCKBANK")
+        legal_name_cache.set(MOCK_LEIS[1], "OTHERBANK")
+
+    def inserts(self, queries):
+        return [query for query in queries if query["sql"].startswith("INSERT INTO \"bonds_bond\"")]
+
+    def test_duplicate_isin_returns_409(self):
+        self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+        resp = self.client.post("/bonds/", dict(MOCK_POST_DATA, size=1), format='json')
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Bond.objects.get().size, MOCK_POST_DATA["size"])
+
+    def test_same_isin_can_be_held_by_other_users(self):
+        create_bonds(User.objects.create_user(username='anotheruser', password='testpass'), 1)
+        resp = self.client.post("/bonds/", dict(MOCK_POST_DATA, isin="FR0000000000"), format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+
+    def test_single_upsert_creates_updates_and_skips(self):
+        resp = self.client.post("/bonds/?upsert=true", MOCK_POST_DATA, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.json()["created"], 1)
+        self.assertEqual(resp.json()["bond"]["legal_name"], "MOCKBANK")
+
+        resp = self.client.post("/bonds/?upsert=true", dict(MOCK_POST_DATA, size=1), format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual((resp.json()["updated"], resp.json()["unchanged"]), (1, 0))
+        self.assertEqual(Bond.objects.get().size, 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.post("/bonds/?upsert=true", dict(MOCK_POST_DATA, size=1), format='json')
+        self.assertEqual(resp.json()["unchanged"], 1)
+        # Identical bonds are not written at all
+        self.assertEqual(self.inserts(queries), [])
+
+    def test_bulk_upsert_reports_counts(self):
+        self.client.post("/bonds/", mock_bulk_rows(3), format='json')
+        rows = mock_bulk_rows(4)
+        rows[1]["currency"] = "USD"
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.post("/bonds/?upsert=true", rows, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        report = resp.json()
+        self.assertEqual((report["created"], report["updated"], report["unchanged"], report["invalid"]), (1, 1, 2, 0))
+        self.assertEqual([result["status"] for result in report["results"]], ["unchanged", "updated", "unchanged", "created"])
+        # All of the changes are written by a single statement
+        self.assertEqual(len(self.inserts(queries)), 1)
+        self.assertEqual(Bond.objects.count(), 4)
+        self.assertEqual(Bond.objects.get(isin=rows[1]["isin"]).currency, "USD")
+
+    def test_upsert_statements_stay_within_the_parameter_limit(self):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.post("/bonds/?upsert=true", mock_bulk_rows(300), format='json')
+        self.assertEqual(resp.json()["created"], 300)
+        inserts = self.inserts(queries)
+        # 7 parameters per row, and at most 999 per statement (SQLite before 3.32)
+        rows = [insert["sql"].count("), (") + 1 for insert in inserts]
+        self.assertEqual(rows, [142, 142, 16])
+
+    def test_bulk_post_reports_existing_isins(self):
+        self.client.post("/bonds/", mock_bulk_rows(2), format='json')
+        resp = self.client.post("/bonds/", mock_bulk_rows(3), format='json')
+        self.assertEqual(resp.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([result["status"] for result in resp.json()["results"]], ["invalid", "invalid", "created"])
+        self.assertEqual(Bond.objects.count(), 3)
+
+    def test_repeated_isins_in_one_request_are_invalid(self):
+        rows = mock_bulk_rows(2)
+        rows.append(dict(rows[0], size=1))
+        resp = self.client.post("/bonds/?upsert=true", rows, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertIn("isin", resp.json()["results"][2]["errors"])
+        self.assertEqual(Bond.objects.get(isin=rows[0]["isin"]).size, MOCK_POST_DATA["size"])
+
+    def test_upsert_statement_skips_identical_rows(self):
+        create_bonds(self.user, 1)
+        bond = Bond(owner=self.user, **dict(MOCK_POST_DATA, isin="FR0000000000", maturity=date(2025, 2, 28)))
+        sql, params = upsert_sql([bond], [Bond._meta.get_field(name) for name in UPSERT_FIELDS])
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            self.assertEqual(cursor.rowcount, 0)
+
+class ConditionalGetTest(APITestCase):
+    """
+    Tests for the ETags and conditional requests of GET /bonds/ (see bonds/versions.py).
+    """
+    def setUp(self):
+        legal_name_cache.clear()
+        gleif.client.breaker.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(self.user)
+        legal_name_cache.set(MOCK_LEIS[0], "MOCKBANK")
+        self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+
+    def test_matching_etag_returns_304_without_reading_bonds(self):
+        resp = self.client.get("/bonds/")
+        self.assertIn("no-cache", resp["Cache-Control"])
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get("/bonds/", HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse([query for query in queries if "bonds_bond" in query["sql"]])
+
+    def test_if_modified_since_returns_304(self):
+        resp = self.client.get("/bonds/")
+        resp = self.client.get("/bonds/", HTTP_IF_MODIFIED_SINCE=resp["Last-Modified"])
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_writes_change_the_etag(self):
+        etag = self.client.get("/bonds/")["ETag"]
+        self.client.post("/bonds/", dict(MOCK_POST_DATA, isin="FR0000000001"), format='json')
+        resp = self.client.get("/bonds/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(resp.json()), 2)
+
+    def test_unchanged_upserts_keep_the_etag(self):
+        etag = self.client.get("/bonds/")["ETag"]
+        self.client.post("/bonds/?upsert=true", MOCK_POST_DATA, format='json')
+        self.assertEqual(self.client.get("/bonds/")["ETag"], etag)
+
+    def test_etag_depends_on_query_parameters(self):
+        self.assertNotEqual(self.client.get("/bonds/")["ETag"], self.client.get("/bonds/?currency=USD")["ETag"])
+        self.assertEqual(self.client.get("/bonds/?currency=EUR&size=1")["ETag"],
+                         self.client.get("/bonds/?size=1&currency=EUR")["ETag"])
+
+    def test_renaming_an_issuer_changes_the_etag(self):
+        etag = self.client.get("/bonds/")["ETag"]
+        legal_name_cache.set(MOCK_LEIS[0], "RENAMEDBANK")
+        self.assertNotEqual(self.client.get("/bonds/")["ETag"], etag)
+
+    def test_renaming_an_issuer_in_the_admin_changes_the_etag(self):
+        etag = self.client.get("/bonds/")["ETag"]
+        User.objects.create_superuser(username='admin', password='adminpass', email='admin@example.com')
+        admin_client = APIClient()
+        admin_client.login(username='admin', password='adminpass')
+        resp = admin_client.post("/admin/bonds/legalentity/%s/change/" % MOCK_LEIS[0], {
+            "lei": MOCK_LEIS[0], "legal_name": "RENAMEDBANK", "resolved_at_0": "2022-01-01", "resolved_at_1": "00:00:00"})
+        self.assertEqual(resp.status_code, status.HTTP_302_FOUND)
+        resp = self.client.get("/bonds/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json()[0]["legal_name"], "RENAMEDBANK")
+
+    def test_responses_are_not_cached_by_default(self):
+        self.client.get("/bonds/?currency=EUR")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/bonds/?currency=EUR")
+        self.assertTrue([query for query in queries if "bonds_bond" in query["sql"]])
+
+    @override_settings(BONDS_LIST_CACHE_TIMEOUT=60)
+    def test_repeated_queries_are_served_from_the_cache(self):
+        cache.clear()
+        self.client.get("/bonds/?currency=EUR")
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get("/bonds/?currency=EUR")
+        self.assertEqual(resp.json()[0]["isin"], MOCK_POST_DATA["isin"])
+        self.assertFalse([query for query in queries if "bonds_bond" in query["sql"]])
+
+MOCK_LEI_CDF_RECORD = """
+    <lei:LEIRecord>
+      <lei:LEI>{lei}</lei:LEI>
+      <lei:Entity>
+        <lei:LegalName xml:lang="en">{legal_name}</lei:LegalName>
+        <lei:SuccessorEntity><lei:SuccessorEntityName>NOT THE LEGAL NAME</lei:SuccessorEntityName></lei:SuccessorEntity>
+        <lei:EntityStatus>ACTIVE</lei:EntityStatus>
+      </lei:Entity>
+      <lei:Registration>
+        <lei:InitialRegistrationDate>2012-06-06T15:53:00.000+02:00</lei:InitialRegistrationDate>
+        <lei:LastUpdateDate>{last_update}</lei:LastUpdateDate>
+      </lei:Registration>
+    </lei:LEIRecord>"""
+
+def mock_lei_cdf(records):
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<lei:LEIData xmlns:lei="http://www.gleif.org/data/schema/leidata/2016">'
+        '<lei:LEIHeader><lei:RecordCount>%d</lei:RecordCount></lei:LEIHeader><lei:LEIRecords>%s</lei:LEIRecords>'
+        '</lei:LEIData>' % (len(records), "".join(MOCK_LEI_CDF_RECORD.format(**record) for record in records))
+    )
+
+MOCK_LEI_RECORDS = [
+    {"lei": MOCK_LEIS[0], "legal_name": "BNP PARIBAS", "last_update": "2022-05-02T08:31:35.000+02:00"},
+    {"lei": MOCK_LEIS[1], "legal_name": "OTHER BANK", "last_update": "2022-01-01T00:00:00Z"},
+]
+
+class ArchiveTest(APITestCase):
+    """
+    Tests for the archival of matured bonds (see bonds/archive.py) and `?include_matured=true`.
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(self.user)
+        today = date.today()
+        create_bonds(self.user, 4)
+        # FR0000000000 and FR0000000001 have matured, FR0000000002 has matured but is pending
+        Bond.objects.filter(isin__in=["FR0000000000", "FR0000000001", "FR0000000002"]) \
+            .update(maturity=today - timedelta(days=1))
+        Bond.objects.filter(isin="FR0000000002").update(enrichment_status=Bond.PENDING)
+        Bond.objects.filter(isin="FR0000000003").update(maturity=today)
+        self.other_user = User.objects.create_user(username='anotheruser', password='testpass')
+        create_bonds(self.other_user, 1, start=10, maturity=today - timedelta(days=1))
+
+    def archive(self, *args):
+        out = StringIO()
+        call_command("archive_matured_bonds", *args, stdout=out)
+        return out.getvalue()
+
+    def isins(self, path):
+        resp = self.client.get(path)
+        assert resp.status_code == status.HTTP_200_OK
+        return sorted(bond["isin"] for bond in resp.data)
+
+    def test_matured_bonds_are_moved_to_the_archive(self):
+        ids = dict(Bond.objects.values_list("isin", "id"))
+        out = self.archive()
+        self.assertIn("Archived 3 bond(s)", out)
+        self.assertEqual(sorted(Bond.objects.values_list("isin", flat=True)), ["FR0000000002", "FR0000000003"])
+        archived = ArchivedBond.objects.get(isin="FR0000000000")
+        self.assertEqual(archived.id, ids["FR0000000000"])
+        self.assertEqual((archived.owner, archived.legal_entity_id, archived.size), (self.user, MOCK_POST_DATA["lei"], 100000000))
+        self.assertIsNotNone(archived.archived_at)
+        self.assertEqual(ArchivedBond.objects.filter(owner=self.other_user).count(), 1)
+
+    def test_archiving_twice_moves_nothing(self):
+        self.archive()
+        self.assertIn("Archived 0 bond(s)", self.archive())
+        self.assertEqual(ArchivedBond.objects.count(), 3)
+
+    def test_archive_in_batches(self):
+        out = self.archive("--batch-size", "1")
+        self.assertEqual(out.count("archived."), 3)
+        self.assertEqual(ArchivedBond.objects.count(), 3)
+
+    def test_archive_before_a_date(self):
+        self.archive("--before", (date.today() - timedelta(days=1)).isoformat())
+        self.assertEqual(ArchivedBond.objects.count(), 0)
+        with self.assertRaises(CommandError):
+            self.archive("--before", "yesterday")
+
+    def test_get_excludes_archived_bonds_unless_requested(self):
+        self.archive()
+        self.assertEqual(self.isins("/bonds/"), ["FR0000000002", "FR0000000003"])
+        self.assertEqual(self.isins("/bonds/?include_matured=true"),
+                         ["FR0000000000", "FR0000000001", "FR0000000002", "FR0000000003"])
+
+    def test_include_matured_applies_filters_and_pagination(self):
+        self.archive()
+        Bond.objects.filter(isin="FR0000000003").update(currency="USD")
+        self.assertEqual(self.isins("/bonds/?include_matured=true&currency=EUR"),
+                         ["FR0000000000", "FR0000000001", "FR0000000002"])
+        self.assertEqual(len(self.isins("/bonds/?include_matured=true&search=mockbank")), 4)
+        resp = self.client.get("/bonds/?include_matured=true&page_size=3")
+        self.assertEqual([bond["isin"] for bond in resp.data["results"]],
+                         ["FR0000000000", "FR0000000001", "FR0000000002"])
+        resp = self.client.get(resp.data["next"])
+        self.assertEqual([bond["isin"] for bond in resp.data["results"]], ["FR0000000003"])
+        summary, = self.client.get("/bonds/summary/?include_matured=true").json()
+        self.assertEqual(summary["count"], 4)
+
+    def test_archiving_changes_the_etag(self):
+        etag = self.client.get("/bonds/")["ETag"]
+        self.archive()
+        self.assertNotEqual(self.client.get("/bonds/")["ETag"], etag)
+
+    def test_archived_isin_can_be_posted_again(self):
+        self.archive()
+        resp = self.client.post("/bonds/", dict(MOCK_POST_DATA, isin="FR0000000000"), format='json')
+        assert resp.status_code == status.HTTP_201_CREATED
+        self.assertEqual(self.isins("/bonds/?include_matured=true").count("FR0000000000"), 2)
+
+    def test_include_matured_uses_the_indexes_of_both_tables(self):
+        plan = query_plan(CombinedBond.objects.filter(owner=self.user, currency="EUR").order_by("id"))
+        self.assertIn("bonds_owner_currency_idx", plan)
+        self.assertRegex(plan, r"SEARCH bonds_archivedbond USING INDEX \w+ \(owner_id=\?")
+        self.assertNotRegex(plan, r"\bSCAN bonds_(archived)?bond\b")
+
+class LEIRecordImportTest(APITestCase):
+    """
+    Tests for the import of GLEIF golden copy files and the local resolution of LEIs (bonds/lei_records.py).
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        legal_name_cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def import_file(self, path, *args):
+        call_command('import_lei_records', path, *args, stdout=StringIO())
+
+    def test_xml_import(self):
+        self.import_file(self.write_file("golden.xml", mock_lei_cdf(MOCK_LEI_RECORDS)))
+        record = LEIRecord.objects.get(lei=MOCK_LEIS[0])
+        self.assertEqual(record.legal_name, "BNP PARIBAS")
+        self.assertEqual(record.entity_status, "ACTIVE")
+        self.assertEqual(record.last_update, datetime(2022, 5, 2, 6, 31, 35, tzinfo=timezone.utc))
+        self.assertEqual(LEIRecord.objects.count(), 2)
+
+    def test_csv_import(self):
+        path = self.write_file("golden.csv", "LEI,Entity.LegalName,Entity.EntityStatus,Registration.LastUpdateDate\n"
+                                             "%s,BNP PARIBAS,ACTIVE,2022-05-02T08:31:35Z\n" % MOCK_LEIS[0])
+        self.import_file(path)
+        self.assertEqual(LEIRecord.objects.get().legal_name, "BNP PARIBAS")
+
+    def test_zipped_import(self):
+        path = os.path.join(self.directory.name, "golden.zip")
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("golden.xml", mock_lei_cdf(MOCK_LEI_RECORDS))
+        self.import_file(path)
+        self.assertEqual(LEIRecord.objects.count(), 2)
+
+    def test_records_are_written_in_batches(self):
+        path = self.write_file("golden.xml", mock_lei_cdf(MOCK_LEI_RECORDS))
+        out = StringIO()
+        call_command('import_lei_records', path, '--batch-size', '1', stdout=out)
+        self.assertIn("1 records read", out.getvalue())
+        self.assertIn("2 records read", out.getvalue())
+
+    def test_import_can_be_resumed(self):
+        self.import_file(self.write_file("golden.xml", mock_lei_cdf(MOCK_LEI_RECORDS)), '--skip', '1')
+        self.assertEqual(list(LEIRecord.objects.values_list('lei', flat=True)), [MOCK_LEIS[1]])
+
+    def test_delta_import_only_applies_newer_records(self):
+        self.import_file(self.write_file("golden.xml", mock_lei_cdf(MOCK_LEI_RECORDS)))
+        delta = [
+            dict(MOCK_LEI_RECORDS[0], legal_name="BNP PARIBAS SA", last_update="2023-01-01T00:00:00Z"),
+            dict(MOCK_LEI_RECORDS[1], legal_name="OUTDATED", last_update="2021-01-01T00:00:00Z"),
+        ]
+        out = StringIO()
+        call_command('import_lei_records', self.write_file("delta.xml", mock_lei_cdf(delta)), stdout=out)
+        self.assertIn("Created 0 and updated 1 record(s).", out.getvalue())
+        self.assertEqual(LEIRecord.objects.get(lei=MOCK_LEIS[0]).legal_name, "BNP PARIBAS SA")
+        self.assertEqual(LEIRecord.objects.get(lei=MOCK_LEIS[1]).legal_name, "OTHER BANK")
+
+    def test_unsupported_file_returns_error(self):
+        with self.assertRaises(CommandError):
+            self.import_file(self.write_file("golden.txt", ""))
+
+    @responses.activate
+    def test_imported_leis_are_resolved_without_gleif(self):
+        self.import_file(self.write_file("golden.xml", mock_lei_cdf(MOCK_LEI_RECORDS)))
+        resp = self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Bond.objects.get().legal_name, "BNPPARIBAS")
+        self.assertEqual(len(responses.calls), 0)
+
+    @responses.activate
+    def test_bulk_post_resolves_imported_leis_without_gleif(self):
+        self.import_file(self.write_file("golden.xml", mock_lei_cdf(MOCK_LEI_RECORDS)))
+        resp = self.client.post("/bonds/", mock_bulk_rows(4), format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(responses.calls), 0)
+
+    @responses.activate
+    def test_unknown_leis_are_invalid_in_local_only_mode(self):
+        with self.settings(LEI_RECORDS_ONLY=True):
+            resp = self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(responses.calls), 0)
+
+class MetricsTest(APITestCase):
+    """
+    Tests for the metrics defined in bonds/metrics.py, and their exposition at /metrics.
+    """
+    def setUp(self):
+        metrics.reset()
+        legal_name_cache.clear()
+        gleif.client.breaker.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(user=self.user)
+
+    def scrape(self):
+        admin = User.objects.filter(username='admin').first() or \
+            User.objects.create_superuser(username='admin', password='adminpass', email='admin@example.com')
+        scraper = APIClient()
+        scraper.credentials(HTTP_AUTHORIZATION="Basic " + base64.b64encode(b"admin:adminpass").decode())
+        resp = scraper.get("/metrics")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp["Content-Type"].startswith("text/plain; version=0.0.4"))
+        return resp.content.decode()
+
+    def test_metrics_are_only_visible_to_admins(self):
+        self.assertEqual(self.client.get("/metrics").status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(APIClient().get("/metrics").status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_requests_are_counted_per_view(self):
+        self.client.get("/bonds/")
+        self.client.get("/bonds/")
+        self.client.get("/bonds/missing/")
+        body = self.scrape()
+        self.assertIn('bonds_http_requests_total{view="BondsList",method="GET",status="200"} 2', body)
+        self.assertIn('bonds_http_requests_total{view="unmatched",method="GET",status="404"} 1', body)
+        self.assertIn('bonds_http_request_duration_seconds_count{view="BondsList",method="GET"} 2', body)
+
+    def test_database_queries_are_counted_per_request(self):
+        create_bonds(self.user, 3)
+        self.client.get("/bonds/")
+        body = self.scrape()
+        self.assertIn('bonds_http_request_db_queries_count{view="BondsList",method="GET"} 1', body)
+        self.assertRegex(body, r'bonds_http_request_db_queries_sum\{view="BondsList",method="GET"\} [1-9]')
+
+    def test_queries_on_the_read_only_alias_are_counted(self):
+        def get_response(request):
+            with connections[db.READ_ONLY_ALIAS].cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return HttpResponse()
+        with mock.patch.dict(connections.databases, {db.READ_ONLY_ALIAS: dict(connections.databases['default'])}):
+            self.addCleanup(delattr, connections._connections, db.READ_ONLY_ALIAS)
+            self.addCleanup(connections[db.READ_ONLY_ALIAS].close)
+            # Connect first, so that only the query of the view is counted
+            connections[db.READ_ONLY_ALIAS].ensure_connection()
+            MetricsMiddleware(get_response)(RequestFactory().get("/bonds/"))
+        self.assertIn('bonds_http_request_db_queries_sum{view="unmatched",method="GET"} 1', self.scrape())
+
+    def test_read_path_is_timed(self):
+        self.client.get("/bonds/")
+        body = self.scrape()
+        self.assertIn('bonds_list_query_duration_seconds_count 1', body)
+        self.assertIn('bonds_list_serialization_duration_seconds_count 1', body)
+
+    @responses.activate
+    def test_gleif_lookups_are_timed_by_outcome(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=MOCK_GLEIF_RESPONSE, status=200)
+        self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+        responses.replace(responses.GET, GLEIF_API_ENDPOINT, body=requests.exceptions.ConnectionError('...'))
+        self.client.post("/bonds/", dict(MOCK_POST_DATA, lei=MOCK_LEIS[1]), format='json')
+        body = self.scrape()
+        self.assertIn('bonds_gleif_request_duration_seconds_count{outcome="ok"} 1', body)
+        self.assertIn('bonds_gleif_request_duration_seconds_count{outcome="unavailable"} 1', body)
+
+    @responses.activate
+    def test_cache_stats_are_exposed(self):
+        responses.add(responses.GET, GLEIF_API_ENDPOINT, json=MOCK_GLEIF_RESPONSE, status=200)
+        self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+        self.client.post("/bonds/", MOCK_POST_DATA, format='json')
+        body = self.scrape()
+        self.assertIn('bonds_lei_cache_lookups_total{result="memory_hit"} 1', body)
+        self.assertIn('bonds_lei_cache_memory_entries 1', body)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_histogram', "A test histogram.", buckets=(1, 5))
+        metrics.REGISTRY.remove(histogram)
+        for value in (0.5, 2, 10):
+            histogram.observe(value)
+        self.assertEqual(histogram.render()[2:], [
+            'test_histogram_bucket{le="1"} 1',
+            'test_histogram_bucket{le="5"} 2',
+            'test_histogram_bucket{le="+Inf"} 3',
+            'test_histogram_sum 12.5',
+            'test_histogram_count 3',
+        ])
+
+class BenchmarkTest(APITestCase):
+    """
+    Smoke tests for the benchmark harness defined in bonds/benchmark.py.
+    """
+    def test_benchmark_reports_posts_and_gets(self):
+        legal_name_cache.clear()
+        results = run_benchmark([20, 40], users=2, posts=3, gets=2, distinct_leis=2, gleif_latency=0)
+        self.assertEqual([result['bonds'] for result in results], [20, 40])
+        self.assertEqual(results[0]['post']['gleif_requests'], 2)
+        self.assertEqual(set(results[0]['get']), set(['unfiltered', 'legal_name', 'search', 'currency', 'isin', 'first_page']))
+        self.assertGreater(results[0]['get']['unfiltered']['queries_per_request'], 0)
+        json.dumps(results)
+
+    def test_gleif_stub_answers_multi_lei_lookups(self):
+        with GleifStub() as stub:
+            legal_names = gleif.client.fetch_legal_names(["A", "B"])
+        self.assertEqual(legal_names, {"A": "STUBENTITYA", "B": "STUBENTITYB"})
+        self.assertEqual(stub.requests, 1)
+
+    def test_mixed_workload_reads_and_writes(self):
+        legal_name_cache.clear()
+        user = User.objects.create_user(username='testuser', password='testpass')
+        create_legal_entities({"R0MUWSFPU8MPRO8K5P83": "MOCKBANK"})
+        self.client.force_login(user)
+        result = mixed_workload(self.client, 0, 0.2, 0.5, ["R0MUWSFPU8MPRO8K5P83"])
+        self.assertGreater(len(result['reads']), 0)
+        self.assertGreater(len(result['writes']), 0)
+        self.assertEqual((result['locked'], result['failed']), (0, 0))
+        self.assertEqual(Bond.objects.filter(owner=user).count(), len(result['writes']))
+
+class DatabaseProfileTest(APITestCase):
+    """
+    Tests for the SQLite pragmas and the read-only router defined in bonds/db.py.
+    """
+    def setUp(self):
+        self.router = db.ReadOnlyRouter()
+
+    def test_reads_use_default_database_outside_read_only(self):
+        with mock.patch.dict(connections.databases, {db.READ_ONLY_ALIAS: {}}):
+            self.assertIsNone(self.router.db_for_read(Bond))
+
+    def test_reads_use_read_only_alias_within_read_only(self):
+        with mock.patch.dict(connections.databases, {db.READ_ONLY_ALIAS: {}}):
+            with db.read_only():
+                self.assertEqual(self.router.db_for_read(Bond), db.READ_ONLY_ALIAS)
+            self.assertIsNone(self.router.db_for_read(Bond))
+
+    def test_reads_use_default_database_without_read_only_alias(self):
+        with db.read_only():
+            self.assertIsNone(self.router.db_for_read(Bond))
+            self.assertIsNone(self.router.db_for_write(Bond))
+
+    def test_read_only_alias_is_never_migrated(self):
+        self.assertFalse(self.router.allow_migrate(db.READ_ONLY_ALIAS, 'bonds'))
+        self.assertIsNone(self.router.allow_migrate('default', 'bonds'))
+
+    def test_get_bonds_reads_within_read_only(self):
+        user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(user)
+        read_only = []
+        def db_for_read(router, model, **hints):
+            read_only.append(getattr(db._state, 'read_only', False))
+        with mock.patch.object(db.ReadOnlyRouter, 'db_for_read', autospec=True, side_effect=db_for_read):
+            resp = self.client.get("/bonds/")
+        assert resp.status_code == status.HTTP_200_OK
+        self.assertIn(True, read_only)
+
+    def test_pragmas_are_applied_to_new_connections(self):
+        self.addCleanup(connection.cursor().execute, 'PRAGMA cache_size = -2000')
+        with override_settings(SQLITE_PRAGMAS={'cache_size': -1234}):
+            db.configure_sqlite(None, connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -1234)
+
 MOCK_BOND_ATTRIBUTES = {
     "isin": "foobar",
     "size": 100000000,
@@ -0,0 +1,90 @@
+"""
+Defines the idempotent ingestion of bonds, keyed on (owner, ISIN).
+
+Bonds are written with one set-based `INSERT ... ON CONFLICT (owner_id, isin) DO UPDATE`
+statement per batch (SQLite 3.24+). The update only applies to rows whose values changed,
+so re-sending identical bonds leaves their rows untouched. The existing rows of each batch
+are read in a single query beforehand, to report what happened to each bond.
+"""
+from django.db import connection
+from .models import Bond
+
+CREATED = 'created'
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+
+# The fields which an upsert may change, besides the (owner, isin) key
+UPSERT_FIELDS = ['size', 'currency', 'maturity', 'legal_entity', 'enrichment_status']
+
+def existing_isins(owner, isins, batch_size):
+    """
+    Return which of `isins` the owner already holds, querying `batch_size` ISINs at a time.
+    """
+    isins, existing = list(isins), set()
+    for start in range(0, len(isins), batch_size):
+        batch = isins[start:start + batch_size]
+        existing.update(Bond.objects.filter(owner=owner, isin__in=batch).values_list('isin', flat=True))
+    return existing
+
+def count_outcomes(outcomes):
+    return {outcome: outcomes.count(outcome) for outcome in (CREATED, UPDATED, UNCHANGED)}
+
+def upsert_bonds(owner, bonds, batch_size):
+    """
+    Insert or update `bonds` (unsaved bonds of `owner`, with distinct ISINs), `batch_size` at a
+    time. Returns the outcome of each bond (CREATED, UPDATED or UNCHANGED), in order.
+    """
+    # Each bond binds one parameter per column, and SQLite limits the parameters of a statement
+    columns = [Bond._meta.get_field(name) for name in ['owner', 'isin'] + UPSERT_FIELDS]
+    batch_size = min(batch_size, connection.ops.bulk_batch_size(columns, bonds))
+    outcomes = []
+    for start in range(0, len(bonds), batch_size):
+        outcomes.extend(upsert_batch(owner, bonds[start:start + batch_size]))
+    return outcomes
+
+def upsert_batch(owner, bonds):
+    fields = [Bond._meta.get_field(name) for name in UPSERT_FIELDS]
+    rows = Bond.objects.filter(owner=owner, isin__in=[bond.isin for bond in bonds])
+    existing = {row[0]: row[1:] for row in rows.values_list('isin', *[field.attname for field in fields])}
+
+    outcomes, changed = [], []
+    for bond in bonds:
+        values = tuple(getattr(bond, field.attname) for field in fields)
+        if bond.isin not in existing:
+            outcomes.append(CREATED)
+        elif existing[bond.isin] == values:
+            outcomes.append(UNCHANGED)
+            continue
+        else:
+            outcomes.append(UPDATED)
+        changed.append(bond)
+
+    if changed:
+        sql, params = upsert_sql(changed, fields)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+    return outcomes
+
+def upsert_sql(bonds, fields):
+    """
+    Return the statement (and its parameters) which inserts `bonds`, or updates the `fields`
+    of those which already exist if any of them changed.
+    """
+    quote = connection.ops.quote_name
+    table = quote(Bond._meta.db_table)
+    key = [Bond._meta.get_field('owner'), Bond._meta.get_field('isin')]
+    columns = key + fields
+    row = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    sql = 'INSERT INTO %s (%s) VALUES %s ON CONFLICT (%s) DO UPDATE SET %s WHERE %s' % (
+        table,
+        ', '.join(quote(field.column) for field in columns),
+        ', '.join([row] * len(bonds)),
+        ', '.join(quote(field.column) for field in key),
+        ', '.join('%s = excluded.%s' % (quote(field.column), quote(field.column)) for field in fields),
+        # Identical rows are skipped, rather than rewritten with the same values
+        ' OR '.join('%s.%s IS NOT excluded.%s' % (table, quote(field.column), quote(field.column))
+                    for field in fields),
+    )
+    params = [field.get_db_prep_save(getattr(bond, field.attname), connection)
+              for bond in bonds for field in columns]
+    return sql, params
@@ -0,0 +1,75 @@
+"""
+Defines the per-user versions of books of bonds, which make `GET /bonds/` conditional.
+
+Every write which changes what `GET /bonds/` returns to a user bumps their `BookVersion`. The
+ETag of a response is derived from that version and from the request (query parameters and
+format), so `If-None-Match` and `If-Modified-Since` can be answered with a 304 by reading a
+single row, without querying or serializing any bonds. Rendered data can also be kept in the
+Django cache under the same key, so repeated identical queries skip the bond query as well.
+"""
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+from .models import Bond, BookVersion
+
+def bump(owner_ids):
+    """
+    Record that the books of the given users (ids) have changed. Code which writes bonds
+    outside of the API must call this too, or clients may keep being told nothing changed.
+    """
+    owner_ids = set(owner_ids)
+    if not owner_ids:
+        return
+    now = timezone.now()
+    BookVersion.objects.filter(owner_id__in=owner_ids).update(version=F('version') + 1, updated_at=now)
+    # Users without a version so far start at 1 (rows updated above are left alone)
+    BookVersion.objects.bulk_create([BookVersion(owner_id=owner_id, version=1, updated_at=now)
+                                     for owner_id in owner_ids], ignore_conflicts=True)
+
+def bump_holders(leis):
+    """
+    Record that the books of the users holding bonds of the given LEIs have changed.
+    """
+    if leis:
+        bump(Bond.objects.filter(legal_entity__in=leis).values_list('owner_id', flat=True).distinct())
+
+def current(owner):
+    """
+    Return the user's `BookVersion`, or an unsaved one at version 0 if their book never changed.
+    """
+    return BookVersion.objects.filter(owner=owner).first() or BookVersion(owner=owner, version=0)
+
+def etag(request, book, *extra):
+    """
+    Return the (quoted) ETag of the response to `request` for the given version of the user's
+    book, which also depends on the path, the query parameters and the format of the response,
+    and on any `extra` values the response depends on.
+    """
+    query = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+    # The time of the change tells apart versions of users which were deleted and re-created
+    key = repr((book.owner_id, book.version, book.updated_at, request.get_host(), request.path,
+                request.accepted_renderer.format, query) + extra)
+    return '"%s"' % hashlib.sha1(key.encode()).hexdigest()
+
+def cache_key(etag):
+    return 'bonds:book:' + etag.strip('"')
+
+def get_cached(etag, book, timeout=None):
+    """
+    Return the data cached for a response with this ETag, or `None`. Caching is disabled if
+    `timeout` (by default `BONDS_LIST_CACHE_TIMEOUT`) is 0.
+    """
+    timeout = settings.BONDS_LIST_CACHE_TIMEOUT if timeout is None else timeout
+    # Books which never changed through the API are not cached, as the bonds may have been
+    # loaded by other means (e.g. fixtures) without bumping the version
+    if not timeout or not book.version:
+        return None
+    return cache.get(cache_key(etag))
+
+def set_cached(etag, book, data, timeout=None):
+    timeout = settings.BONDS_LIST_CACHE_TIMEOUT if timeout is None else timeout
+    # Entries never need invalidating, as any write changes the ETag of later responses
+    if timeout and book.version:
+        cache.set(cache_key(etag), data, timeout)
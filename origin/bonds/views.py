@@ -1,14 +1,35 @@
 """
 Defines views for the bonds app.
 """
+from calendar import timegm
+from datetime import date
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, generics, permissions
+from rest_framework.parsers import JSONParser, FormParser, MultiPartParser
+from django.conf import settings
+from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-import requests
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from bonds.serializers import UserSerializer
-from .models import Bond
-from .serializers import BondSerializer
+from . import enrichment, gleif, metrics, versions
+from .analytics import analyze, load_book
+from .authentication import issue_token
+from .cache import legal_name_cache, MISSING
+from .db import read_only
+from .gleif import GLEIF_API_ENDPOINT
+from .lei_records import lookup_locally
+from .models import Bond, CombinedBond, LegalEntity
+from .pagination import BondCursorPagination
+from .parsers import NDJSONParser
+from .renderers import CSVRenderer, NDJSONRenderer
+from .search import InvalidSearchError, matching_leis
+from .serializers import BondSerializer, BOND_READ_COLUMNS, represent_bonds
+from .summary import GROUP_BY_DIMENSIONS, summarize
+from .upsert import count_outcomes, CREATED, existing_isins, UNCHANGED, upsert_bonds
 
 class InvalidLEIException(Exception):
     """
@@ -16,33 +37,120 @@ class InvalidLEIException(Exception):
     """
     pass
 
-GLEIF_API_ENDPOINT = 'https://leilookup.gleif.org/api/v2/leirecords'
-
-class BondsList(APIView):
+class BondFilterMixin:
     """
-    List all relevant bonds, or create a new bond.
+    Filters the bonds of the requesting user by the query parameters (e.g. ?currency=EUR).
     """
-    # Makes this view accessible for authenticated users only
-    permission_classes = [permissions.IsAuthenticated]
-    
-    def get(self, request):
-        fields = ['isin', 'size', 'currency', 'maturity', 'lei', 'legal_name']
+    # The query parameters which bonds can be filtered by, mapped to their lookups.
+    # Bond.Meta.indexes should cover each of them.
+    filter_fields = {
+        'isin': 'isin',
+        'size': 'size',
+        'currency': 'currency',
+        'maturity': 'maturity',
+        'lei': 'legal_entity',
+        'legal_name': 'legal_entity__legal_name',
+        'enrichment_status': 'enrichment_status',
+    }
+
+    def filter_bonds(self, request):
         # Extract the preferences for each value (e.g. ?currency=EUR)
-        filters = {field: self.request.GET.get(field, None) for field in fields}
+        filters = {lookup: request.GET.get(field, None) for field, lookup in self.filter_fields.items()}
         filters = {key: val for key, val in filters.items() if val is not None}
+        # Search the legal names of the issuers (e.g. ?search=bnp par), see bonds/search.py
+        if "search" in request.GET:
+            filters["legal_entity__in"] = matching_leis(request.GET["search"])
         # Forcefully filter the results by owner
         filters["owner"] = request.user
+        # Archived (matured) bonds are only included on request (see bonds/archive.py)
+        model = CombinedBond if request.GET.get("include_matured") == "true" else Bond
+        # Raises a ValueError if an invalid query value is provided (e.g. ?size=foobar or ?search=bn)
+        return model.objects.all().filter(**filters)
+
+    def invalid_query(self, error):
+        """
+        Return the 400 response to a query which `filter_bonds` raised `error` for.
+        """
+        # Searches say what is wrong with them (e.g. a term is too short)
+        message = str(error) if isinstance(error, InvalidSearchError) else "Invalid query value(s) provided."
+        return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
+# The fields (and their order) of exported bonds, as output by BondSerializer
+EXPORT_FIELDS = ['isin', 'size', 'currency', 'maturity', 'lei', 'legal_name', 'owner']
+
+def book_response(request, get_data, timeout=None, extra=()):
+    """
+    Return a conditional response with the data returned by `get_data`, which depends on the
+    requesting user's book (and on the `extra` values). The data is cached for `timeout`
+    seconds per version of the book (see bonds/versions.py).
+    """
+    # In production, the book is read through the read-only connection (see bonds/db.py)
+    with read_only():
+        book = versions.current(request.user)
+        etag = versions.etag(request, book, *extra)
+        last_modified = timegm(book.updated_at.utctimetuple()) if book.updated_at else None
+        # Clients which already hold this version of the book get a 304, without reading any bonds
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            data = versions.get_cached(etag, book, timeout)
+            if data is None:
+                data = get_data()
+                versions.set_cached(etag, book, data, timeout)
+            response = Response(data, status=status.HTTP_200_OK)
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    # Books are private, and clients should revalidate them every time
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
+class BondsList(BondFilterMixin, APIView):
+    """
+    List all relevant bonds, or create a new bond.
+    """
+    # Makes this view accessible for authenticated users only
+    permission_classes = [permissions.IsAuthenticated]
+    # A JSON array or an NDJSON body creates many bonds at once
+    parser_classes = [JSONParser, NDJSONParser, FormParser, MultiPartParser]
+
+    def get(self, request):
         try: 
-            bonds = Bond.objects.all().filter(**filters)
+            bonds = self.filter_bonds(request)
         # Value error can occur if invalid query value provided (e.g. ?size=foobar)
-        except ValueError: 
-            return Response("Invalid query value(s) provided.", status=status.HTTP_400_BAD_REQUEST)
-        return Response(BondSerializer(bonds, many=True).data, status=status.HTTP_200_OK)
+        except ValueError as e:
+            return self.invalid_query(e)
+
+        return book_response(request, lambda: self.list_bonds(request, bonds))
+
+    def list_bonds(self, request, bonds):
+        """
+        Return the data of the response to GET /bonds/, which is paginated if requested.
+        """
+        # Only the needed columns are read, and the owner is the requesting user
+        owner = request.user.username
+        paginator = BondCursorPagination()
+        if paginator.is_requested(request):
+            # Named rows let the paginator read the `id` of the last bond of the page
+            with metrics.BONDS_QUERY_DURATION.time():
+                page = paginator.paginate_queryset(bonds.values_list(*BOND_READ_COLUMNS, named=True), request, view=self)
+            with metrics.BONDS_SERIALIZATION_DURATION.time():
+                data = list(represent_bonds(page, owner))
+            return paginator.get_paginated_response(data).data
+        with metrics.BONDS_QUERY_DURATION.time():
+            rows = list(bonds.values_list(*BOND_READ_COLUMNS))
+        with metrics.BONDS_SERIALIZATION_DURATION.time():
+            return list(represent_bonds(rows, owner))
 
     def post(self, request):
+        # With ?upsert=true, a bond whose ISIN the user already holds is updated instead
+        upsert = request.query_params.get("upsert") == "true"
+        if isinstance(request.data, list):
+            return self.bulk_post(request, upsert)
+        if request.query_params.get("async") == "true" and not upsert:
+            return self.async_post(request)
+
         try:
-            legal_name =self.get_legal_name(request)
+            self.get_legal_name(request)
         # Return 503 if error due to unsuccessful get request.
         except ConnectionError as e:
             return Response(str(e), status=status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -50,33 +158,269 @@ class BondsList(APIView):
         except (ValueError, InvalidLEIException) as e:
             return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
 
-        request.data["legal_name"] = legal_name
+        # The legal name is now stored on the LegalEntity of the LEI (see `lookup_legal_name`)
         serializer = BondSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save(owner=self.request.user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)    
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if upsert:
+            return self.upsert_post(request, serializer.validated_data)
+        try:
+            with transaction.atomic():
+                serializer.save(owner=self.request.user)
+                versions.bump([request.user.pk])
+        except IntegrityError:
+            return self.duplicate_response(serializer.validated_data["isin"])
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def upsert_post(self, request, validated_data):
+        """
+        Create the bond, or update the bond with the same ISIN (unless nothing changed).
+        """
+        bond = Bond(owner=request.user, **validated_data)
+        with transaction.atomic():
+            outcome, = upsert_bonds(request.user, [bond], settings.BULK_CREATE_BATCH_SIZE)
+            if outcome != UNCHANGED:
+                versions.bump([request.user.pk])
+        report = dict(count_outcomes([outcome]), bond=BondSerializer(instance=bond).data)
+        return Response(report, status=status.HTTP_201_CREATED if outcome == CREATED else status.HTTP_200_OK)
+
+    def duplicate_response(self, isin):
+        return Response("A bond with ISIN " + isin + " already exists. Post it with ?upsert=true to update it.",
+                        status=status.HTTP_409_CONFLICT)
+
+    def async_post(self, request):
+        """
+        Store the bond straight away and leave the lookup of its legal name to the
+        `enrich_bonds` workers, unless the LEI can be resolved locally.
+        """
+        if "lei" not in request.data:
+            return Response("LEI not specified", status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(request.data["lei"], str):
+            return Response("LEI " + str(request.data["lei"]) + " is invalid or does not exist.",
+                            status=status.HTTP_400_BAD_REQUEST)
+        legal_name = lookup_locally([request.data["lei"]])[request.data["lei"]]
+        if legal_name is None:
+            return Response("LEI " + request.data["lei"] + " is invalid or does not exist.",
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = BondSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            if legal_name is not MISSING:
+                with transaction.atomic():
+                    serializer.save(owner=self.request.user)
+                    versions.bump([request.user.pk])
+                return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+            with transaction.atomic():
+                # The worker fills in the legal name of the (so far unresolved) entity
+                LegalEntity.objects.get_or_create(lei=serializer.validated_data["lei"])
+                bond = serializer.save(owner=self.request.user, enrichment_status=Bond.PENDING)
+                enrichment.enqueue(bond)
+                versions.bump([request.user.pk])
+        except IntegrityError:
+            return self.duplicate_response(serializer.validated_data["isin"])
+        return Response(dict(serializer.data, enrichment_status=Bond.PENDING), status=status.HTTP_202_ACCEPTED)
+
+    def bulk_post(self, request, upsert=False):
+        rows = request.data
+        # Resolve every distinct LEI once, however many bonds share it
+        leis = {row["lei"] for row in rows if isinstance(row, dict) and isinstance(row.get("lei"), str)}
+        try:
+            legal_names = lookup_legal_names(leis)
+        except ConnectionError as e:
+            return Response(str(e), status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if upsert:
+            existing = set()
+        else:
+            isins = {row["isin"] for row in rows if isinstance(row, dict) and isinstance(row.get("isin"), str)}
+            existing = existing_isins(request.user, isins, settings.BULK_CREATE_BATCH_SIZE)
+
+        bonds, results, seen = [], [], set()
+        for index, row in enumerate(rows):
+            errors = self.validate_row(row, legal_names)
+            if errors:
+                results.append({"row": index, "status": "invalid", "errors": errors})
+                continue
+            serializer = BondSerializer(data=row)
+            if not serializer.is_valid():
+                results.append({"row": index, "status": "invalid", "errors": serializer.errors})
+                continue
+            isin = serializer.validated_data["isin"]
+            if isin in seen or isin in existing:
+                error = "Duplicate ISIN in this request." if isin in seen else "A bond with this ISIN already exists."
+                results.append({"row": index, "status": "invalid", "errors": {"isin": [error]}})
+                continue
+            seen.add(isin)
+            bonds.append(Bond(owner=request.user, **serializer.validated_data))
+            results.append({"row": index, "status": CREATED, "isin": isin})
+
+        try:
+            with transaction.atomic():
+                if upsert:
+                    outcomes = upsert_bonds(request.user, bonds, settings.BULK_CREATE_BATCH_SIZE)
+                else:
+                    Bond.objects.bulk_create(bonds, batch_size=settings.BULK_CREATE_BATCH_SIZE)
+                    outcomes = [CREATED] * len(bonds)
+                if outcomes.count(UNCHANGED) < len(outcomes):
+                    versions.bump([request.user.pk])
+        # The same ISINs were posted concurrently
+        except IntegrityError:
+            return Response("Some of the bonds were created concurrently, please retry.", status=status.HTTP_409_CONFLICT)
+        accepted = [result for result in results if result["status"] != "invalid"]
+        for result, outcome in zip(accepted, outcomes):
+            result["status"] = outcome
+
+        if len(bonds) == len(rows):
+            all_created = outcomes.count(CREATED) == len(bonds)
+            response_status = status.HTTP_201_CREATED if all_created else status.HTTP_200_OK
+        elif not bonds:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+        report = count_outcomes(outcomes) if upsert else {"created": len(bonds)}
+        report.update({"invalid": len(rows) - len(bonds), "results": results})
+        return Response(report, status=response_status)
+
+    def validate_row(self, row, legal_names):
+        """
+        Return the errors which prevent a bulk row from being passed to the serializer, if any.
+        """
+        if not isinstance(row, dict):
+            return {"non_field_errors": ["Expected a JSON object."]}
+        if "lei" not in row:
+            return {"lei": ["LEI not specified"]}
+        if not isinstance(row["lei"], str) or legal_names.get(row["lei"]) is None:
+            return {"lei": ["LEI " + str(row["lei"]) + " is invalid or does not exist."]}
+        return None
 
-    
     def get_legal_name(self, request):
         # If LEI not specified, raise an exception
         if "lei" not in request.data:
             raise ValueError("LEI not specified")
-        
-        lei = request.data["lei"]
-        url = GLEIF_API_ENDPOINT +'?lei=' + lei
-        # If requests.get fails, raise a ConnectionError.
+        if not isinstance(request.data["lei"], str):
+            raise InvalidLEIException("LEI " + str(request.data["lei"]) + " is invalid or does not exist.")
+        return lookup_legal_name(request.data["lei"])
+
+class BondsExport(BondFilterMixin, APIView):
+    """
+    Stream all relevant bonds as NDJSON (the default) or CSV, e.g. /bonds/export/?format=csv.
+    Rows are read from the database in chunks and written out as they arrive, so memory
+    use stays flat however many bonds are exported.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+
+    def get(self, request):
         try:
-            response = requests.get(url)
-        except:
-            raise ConnectionError("Failed to connect to the GLEIF API.")
-        # If status code outside of the 200-200 range or no legal names returned, raise exception.
-        if (not response.ok) or (not response.json()):
-            raise InvalidLEIException("LEI " + lei + " is invalid or does not exist.")
-
-        legal_name = response.json()[0]['Entity']['LegalName']['$']
-        # Remove whitespace from the string
-        return legal_name.replace(" ", "")
+            bonds = self.filter_bonds(request)
+        except ValueError as e:
+            return self.invalid_query(e)
+
+        rows = bonds.order_by("id").values_list(*BOND_READ_COLUMNS)
+        rows = represent_bonds(rows.iterator(chunk_size=settings.BONDS_EXPORT_CHUNK_SIZE), request.user.username)
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(renderer.render_rows(rows, EXPORT_FIELDS), content_type=renderer.media_type)
+        response["Content-Disposition"] = 'attachment; filename="bonds.%s"' % renderer.format
+        return response
+
+class BondsSummary(BondFilterMixin, APIView):
+    """
+    Summarise the relevant bonds, optionally grouped by some dimensions
+    (e.g. /bonds/summary/?currency=EUR&group_by=legal_name,maturity_year).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        group_by = [dimension for dimension in request.GET.get("group_by", "").split(",") if dimension]
+        invalid = [dimension for dimension in group_by if dimension not in GROUP_BY_DIMENSIONS]
+        if invalid:
+            return Response("Invalid group_by dimension(s): " + ", ".join(invalid) + ".",
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            bonds = self.filter_bonds(request)
+        except ValueError as e:
+            return self.invalid_query(e)
+        return Response(summarize(bonds, group_by, date.today()), status=status.HTTP_200_OK)
+
+class BondsAnalytics(BondFilterMixin, APIView):
+    """
+    Compute analytics over the relevant bonds, such as their maturity ladder and their
+    concentration by currency and issuer (see bonds/analytics.py). Accepts the same filters
+    as GET /bonds/ (e.g. /bonds/analytics/?currency=EUR).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            bonds = self.filter_bonds(request)
+        except ValueError as e:
+            return self.invalid_query(e)
+
+        today = date.today()
+        # The analytics are as of today, so they change daily as well as with the book
+        return book_response(request, lambda: analyze(load_book(bonds), today),
+                             timeout=settings.BONDS_ANALYTICS_CACHE_TIMEOUT, extra=(today,))
+
+class LegalNameCacheStats(APIView):
+    """
+    Report the hit/miss counts of the legal name cache (see bonds/cache.py).
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(legal_name_cache.stats(), status=status.HTTP_200_OK)
+
+def lookup_legal_name(lei):
+    """
+    Resolve a LEI to its legal name, going to the GLEIF API only if it cannot be resolved locally.
+    """
+    legal_name = lookup_locally([lei])[lei]
+    if legal_name is MISSING:
+        legal_name = gleif.client.fetch_legal_name(lei)
+        legal_name_cache.set(lei, legal_name)
+    if legal_name is None:
+        raise InvalidLEIException("LEI " + lei + " is invalid or does not exist.")
+    return legal_name
+
+def lookup_legal_names(leis):
+    """
+    Resolve many LEIs at once, fetching those which cannot be resolved locally from the GLEIF
+    API in batches. Returns a dict mapping each LEI to its legal name (`None` if the LEI is invalid).
+    """
+    legal_names = lookup_locally(leis)
+    misses = sorted(lei for lei, legal_name in legal_names.items() if legal_name is MISSING)
+    for start in range(0, len(misses), settings.GLEIF_BATCH_SIZE):
+        fetched = gleif.client.fetch_legal_names(misses[start:start + settings.GLEIF_BATCH_SIZE])
+        legal_name_cache.set_many(fetched)
+        legal_names.update(fetched)
+    return legal_names
+
+class Metrics(APIView):
+    """
+    Expose the metrics of this process in the Prometheus text format (see bonds/metrics.py).
+    Like the cache stats, they are only visible to admin users (e.g. a scraper using basic auth).
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class TokenLogin(APIView):
+    """
+    Issue a signed API token (see bonds/authentication.py) in exchange for a username and password.
+    """
+    permission_classes = [permissions.AllowAny]
+    # Credentials are checked below, so no CSRF token is required
+    authentication_classes = []
+
+    def post(self, request):
+        user = authenticate(request, username=request.data.get("username"), password=request.data.get("password"))
+        if user is None:
+            return Response("Invalid username or password.", status=status.HTTP_400_BAD_REQUEST)
+        return Response({"token": issue_token(user), "expires_in": settings.API_TOKEN_MAX_AGE},
+                        status=status.HTTP_200_OK)
 
 class UserRegistration(generics.CreateAPIView):
     """
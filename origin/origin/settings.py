@@ -38,10 +38,12 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework', 
-    'bonds',
+    'bonds.apps.BondsConfig',
 ]
 
 MIDDLEWARE = [
+    # First, so that it measures the whole request (see bonds/metrics.py)
+    'bonds.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +84,12 @@ DATABASES = {
     }
 }
 
+# Sends the reads of GET /bonds/ to a 'readonly' alias, if one is configured (see bonds/db.py)
+DATABASE_ROUTERS = ['bonds.db.ReadOnlyRouter']
+
+# Pragmas applied to every new SQLite connection (see origin/settings_production.py)
+SQLITE_PRAGMAS = {}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -120,3 +128,145 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.1/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# LEI -> legal name cache (see bonds/cache.py). TTLs are in seconds.
+
+LEI_CACHE_MAX_SIZE = 10000
+
+LEI_CACHE_TTL = 24 * 60 * 60
+
+# Invalid LEIs are remembered for a shorter time, in case they get registered
+LEI_CACHE_NEGATIVE_TTL = 60 * 60
+
+
+# Bulk ingestion (see `BondsList.bulk_post` in bonds/views.py)
+
+# Maximum number of LEIs resolved by a single GLEIF API request
+GLEIF_BATCH_SIZE = 100
+
+# Maximum number of bonds written by a single INSERT statement
+BULK_CREATE_BATCH_SIZE = 500
+
+
+# Asynchronous enrichment (see bonds/enrichment.py). Durations are in seconds.
+
+# Number of LEIs looked up concurrently by each `enrich_bonds` worker
+ENRICHMENT_WORKERS = 4
+
+# Maximum number of jobs claimed by a worker at once
+ENRICHMENT_BATCH_SIZE = 100
+
+# How long a claimed job is reserved for the worker which claimed it
+ENRICHMENT_LEASE = 5 * 60
+
+# Failed lookups are retried after 5s, 10s, 20s, ... (at most an hour), with jitter
+ENRICHMENT_BACKOFF_BASE = 5
+
+ENRICHMENT_BACKOFF_MAX = 60 * 60
+
+# The bond is marked as failed after this many unsuccessful attempts
+ENRICHMENT_MAX_ATTEMPTS = 10
+
+
+# GLEIF API client (see bonds/gleif.py). Durations are in seconds.
+
+GLEIF_API_ENDPOINT = 'https://leilookup.gleif.org/api/v2/leirecords'
+
+# Maximum number of kept-alive connections to the GLEIF API
+GLEIF_POOL_SIZE = 10
+
+GLEIF_CONNECT_TIMEOUT = 3.05
+
+GLEIF_READ_TIMEOUT = 10
+
+# Timeouts, connection errors, 429s, 5xx and unexpected 4xx responses are retried after ~0.1s,
+# ~0.2s, ... (with jitter), or after the delay asked for by a Retry-After header
+GLEIF_MAX_RETRIES = 2
+
+GLEIF_RETRY_BACKOFF = 0.1
+
+# A longer Retry-After is not waited for: the lookup fails (with a 503) instead
+GLEIF_MAX_RETRY_AFTER = 5
+
+# After this many consecutive failed lookups, lookups fail fast for GLEIF_CIRCUIT_RESET_TIMEOUT
+GLEIF_CIRCUIT_FAILURE_THRESHOLD = 5
+
+GLEIF_CIRCUIT_RESET_TIMEOUT = 30
+
+
+# Pagination of `GET /bonds/` (see bonds/pagination.py), used when `cursor` or `page_size` is given
+
+BONDS_PAGE_SIZE = 100
+
+BONDS_MAX_PAGE_SIZE = 1000
+
+
+# Number of rows fetched from the database at a time by `/bonds/export/`
+BONDS_EXPORT_CHUNK_SIZE = 2000
+
+
+# Local GLEIF golden copy (see bonds/lei_records.py), imported with `import_lei_records`
+
+# Number of records written per transaction by `import_lei_records`
+LEI_RECORDS_BATCH_SIZE = 5000
+
+# If True, LEIs missing from the imported records are invalid, and the GLEIF API is never called
+LEI_RECORDS_ONLY = False
+
+
+# Refresh of the legal names of issuers (see bonds/refresh.py), run with `refresh_legal_names`
+
+# Legal names resolved longer ago than this (in seconds) are looked up again
+LEI_REFRESH_MAX_AGE = 7 * 24 * 60 * 60
+
+# Maximum number of GLEIF API requests per second made by a refresh
+LEI_REFRESH_RATE = 1.0
+
+
+# Conditional GET /bonds/ (see bonds/versions.py)
+
+# Seconds for which the data of GET /bonds/ responses is kept in the Django cache (0 to disable).
+# Whole unpaginated books are cached, so only enable this with a cache backend sized for them.
+BONDS_LIST_CACHE_TIMEOUT = 0
+
+
+# Signed API tokens (see bonds/authentication.py), issued by POST /token/. Durations are in seconds.
+
+REST_FRAMEWORK = {
+    # Session authentication comes first, so that unauthenticated requests still get a 403
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'bonds.authentication.SignedTokenAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+}
+
+API_TOKEN_MAX_AGE = 24 * 60 * 60
+
+# Bumping the version revokes every token issued before
+API_TOKEN_VERSION = 1
+
+# Users are cached in each process, for at most API_TOKEN_USER_CACHE_TTL seconds
+API_TOKEN_USER_CACHE_SIZE = 10000
+
+API_TOKEN_USER_CACHE_TTL = 60
+
+
+# Portfolio analytics of /bonds/analytics/ (see bonds/analytics.py)
+
+# Upper bounds (in years to maturity) of the buckets of the maturity ladder
+BONDS_ANALYTICS_LADDER = [1, 2, 3, 5, 7, 10, 20, 30]
+
+# Number of issuers listed by the concentration by issuer
+BONDS_ANALYTICS_TOP_ISSUERS = 10
+
+# Number of rows read from the database at a time
+BONDS_ANALYTICS_CHUNK_SIZE = 20000
+
+# Seconds for which analytics are cached, per version of the book (0 to disable)
+BONDS_ANALYTICS_CACHE_TIMEOUT = 60 * 60
+
+
+# Number of matured bonds moved per transaction by `archive_matured_bonds` (see bonds/archive.py)
+BONDS_ARCHIVE_BATCH_SIZE = 500
@@ -0,0 +1,44 @@
+"""
+Django settings for running origin in production, with several WSGI worker processes.
+
+Use with DJANGO_SETTINGS_MODULE=origin.settings_production. The SQLite database is run in WAL
+mode, so that readers and the (single) writer do not block each other, and the reads of
+GET /bonds/ go through a separate read-only connection (see bonds/db.py).
+"""
+
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', 'localhost').split(',')
+
+DATABASE_PATH = os.environ.get('DATABASE_PATH', os.path.join(BASE_DIR, 'db.sqlite3'))
+
+# Connections are kept open across requests (for up to 10 minutes), so that the pragmas are
+# only applied once per connection
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DATABASE_PATH,
+        'CONN_MAX_AGE': 600,
+    },
+    'readonly': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        # Opened with SQLite's read-only URI mode (Django opens SQLite databases with uri=True)
+        'NAME': 'file:%s?mode=ro' % DATABASE_PATH,
+        'CONN_MAX_AGE': 600,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+# Applied in order, to every new connection (see bonds/db.py)
+SQLITE_PRAGMAS = {
+    # Wait (in milliseconds) for locks instead of failing with "database is locked"
+    'busy_timeout': 5000,
+    # Readers see the last committed data while a write is in progress, and vice versa
+    'journal_mode': 'WAL',
+    # In WAL mode, syncing at checkpoints only is safe against corruption, and much faster
+    'synchronous': 'NORMAL',
+    # Read the database through a 256MB memory map rather than read() calls
+    'mmap_size': 256 * 1024 * 1024,
+}
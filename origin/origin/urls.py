@@ -15,12 +15,18 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from bonds.views import BondsList, UserRegistration
+from bonds.views import BondsAnalytics, BondsExport, BondsList, BondsSummary, LegalNameCacheStats, Metrics, TokenLogin, UserRegistration
 from django.urls import path, include
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('bonds/', BondsList.as_view()),
+    path('bonds/analytics/', BondsAnalytics.as_view()),
+    path('bonds/cache/', LegalNameCacheStats.as_view()),
+    path('bonds/export/', BondsExport.as_view()),
+    path('bonds/summary/', BondsSummary.as_view()),
     path('login/', include('rest_framework.urls')),
     path('register/', UserRegistration.as_view()),
+    path('token/', TokenLogin.as_view()),
+    path('metrics', Metrics.as_view()),
 ]